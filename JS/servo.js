@@ -440,6 +440,9 @@ function emergencyStop(servoType) {
     // Marcar como detenido localmente
     servoState[servoType].moving = false;
     
+    // Guardar el video alrededor de la emergencia (si el modo dashcam está activo)
+    socket.emit('dashcam_trigger', { reason: 'emergency_stop' });
+    
     // Estrategia agresiva según tipo de servo
     if (servoType === 'ds04') {
         // Para DS04, enviar a posición neutral y detener
@@ -5,6 +5,36 @@ let socket = null;
 let isStreamActive = false;
 let connectionStatusInterval = null;
 
+// Decodificación de frames binarios: solo un frame en curso y el último pendiente
+let decodingFrame = false;
+let pendingFrame = null;
+
+// Decodificación H.264 con WebCodecs
+let videoDecoder = null;
+let decoderCodec = null;
+const decodeStarts = new Map();
+
+// Informe periódico al servidor para el control adaptativo de video
+const FEEDBACK_INTERVAL = 2000;
+let feedbackInterval = null;
+let framesDrawn = 0;
+let decodeTimeTotal = 0;
+let lastFeedback = performance.now();
+
+// Trazas de latencia por frame: el cliente devuelve cuándo recibió y dibujó cada
+// frame, en su reloj, junto con el desfase estimado respecto al reloj del servidor
+const TRACE_INTERVAL = 1000;
+const CLOCK_SYNC_INTERVAL = 10000;
+const CLOCK_SAMPLES = 8;
+const MAX_PENDING_TRACES = 300;
+let traceInterval = null;
+let clockSyncInterval = null;
+let clockSamples = [];
+let clockOffset = null;  // Reloj del servidor - performance.now() (ms)
+let clockRtt = null;
+let frameTraces = [];    // [seq, recibido, dibujado]
+let latencyBreakdown = null;
+
 // Inicializar la transmisión de video
 export function initializeVideoStream() {
     try {
@@ -27,19 +57,39 @@ export function initializeVideoStream() {
         const ctx = canvas.getContext('2d');
         
         // Manejar recepción de frames de video
-        socket.on('video_frame', (data) => {
+        // El servidor no envía el siguiente frame hasta recibir la confirmación (ack)
+        socket.on('video_frame', (data, ack) => {
+            const confirm = (typeof ack === 'function') ? ack : () => {};
+            const received = performance.now();
             if (isStreamActive && data && data.frame) {
-                const img = new Image();
-                img.onload = () => {
-                    ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
-                };
-                img.src = 'data:image/jpeg;base64,' + data.frame;
+                if (data.format === 'h264') {
+                    // H.264 del codificador por hardware de la Raspberry Pi
+                    decodeH264Frame(data, confirm, ctx, canvas, received);
+                } else if (typeof data.frame === 'string') {
+                    // Protocolo anterior: JPEG en base64
+                    const img = new Image();
+                    const start = performance.now();
+                    img.onload = () => {
+                        ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
+                        recordDecode(start);
+                        recordTrace(data.seq, received);
+                        confirm();
+                    };
+                    img.onerror = confirm;
+                    img.src = 'data:image/jpeg;base64,' + data.frame;
+                } else {
+                    // Protocolo binario: JPEG crudo decodificado fuera del hilo principal
+                    drawBinaryFrame({ frame: data.frame, ack: confirm, seq: data.seq, received: received }, ctx, canvas);
+                }
                 
                 // Actualizar estadísticas
                 const statsOverlay = document.getElementById('statsOverlay');
                 if (statsOverlay) {
-                    statsOverlay.textContent = `FPS: ${data.fps || 0} | Resolución: ${data.width || 0}x${data.height || 0}`;
+                    statsOverlay.textContent = `FPS: ${data.fps || 0} | Resolución: ${data.width || 0}x${data.height || 0}` +
+                        formatLatency(latencyBreakdown);
                 }
+            } else {
+                confirm();
             }
         });
         
@@ -47,6 +97,10 @@ export function initializeVideoStream() {
         socket.on('connect', () => {
             console.log('Conectado al servidor de video con ID:', socket.id);
             updateConnectionStatus('connected');
+            negotiateVideoProtocol();
+            setVideoRendition(renditionForCanvas(canvas));
+            startFeedbackReports();
+            startLatencyTracing();
             document.getElementById('video-call-div').style.display = 'block';
             logMessage('Conectado al servidor de video');
         });
@@ -101,6 +155,7 @@ export function initializeVideoStream() {
                 
                 // Limpiar el canvas
                 ctx.clearRect(0, 0, canvas.width, canvas.height);
+                closeVideoDecoder();
                 
                 // Agregar entrada al registro
                 const logContainer = document.getElementById('logContainer');
@@ -167,6 +222,229 @@ export function initializeVideoStream() {
     }
 }
 
+// Solicitar frames binarios si el navegador puede decodificarlos con createImageBitmap,
+// y anunciar H.264 si dispone de WebCodecs
+function negotiateVideoProtocol() {
+    const protocol = (typeof createImageBitmap === 'function') ? 'binary' : 'base64';
+    const codecs = (protocol === 'binary' && typeof VideoDecoder === 'function') ? ['h264'] : [];
+    closeVideoDecoder();
+    socket.emit('video_protocol', { protocol: protocol, ack: true, codecs: codecs }, (response) => {
+        console.log('Protocolo de video:', response ? response.protocol : 'base64',
+                    '| Códec:', response && response.codec ? response.codec : 'mjpeg');
+    });
+}
+
+// Elegir la versión del video según el tamaño con que se muestra el canvas
+function renditionForCanvas(canvas) {
+    const displayWidth = canvas.clientWidth * (window.devicePixelRatio || 1);
+    if (displayWidth > 0 && displayWidth <= 200) {
+        return 'thumb';
+    }
+    if (displayWidth > 0 && displayWidth <= 400) {
+        return 'half';
+    }
+    return 'full';
+}
+
+// Suscribirse a una rendition del video ('full', 'half' o 'thumb')
+export function setVideoRendition(rendition) {
+    if (!socket || !socket.connected) {
+        return;
+    }
+    socket.emit('video_rendition', { rendition: rendition }, (response) => {
+        console.log('Rendition de video:', response ? response.rendition : 'full');
+    });
+}
+
+// Decodificar una unidad de acceso H.264; sin decodificador válido se descartan
+// los frames delta hasta el siguiente keyframe (el servidor envía uno por segundo)
+function decodeH264Frame(data, ack, ctx, canvas, received) {
+    if (!videoDecoder || videoDecoder.state === 'closed' || decoderCodec !== data.codec) {
+        if (!data.key || !data.codec) {
+            ack();
+            return;
+        }
+        createVideoDecoder(data.codec, ctx, canvas);
+    }
+    try {
+        const timestamp = data.seq * 1000;  // Microsegundos; solo importa el orden
+        decodeStarts.set(timestamp, { start: performance.now(), seq: data.seq, received: received });
+        videoDecoder.decode(new EncodedVideoChunk({
+            type: data.key ? 'key' : 'delta',
+            timestamp: timestamp,
+            data: data.frame
+        }));
+    } catch (error) {
+        console.error('Error al decodificar frame H.264:', error);
+        closeVideoDecoder();
+    }
+    ack();
+}
+
+function createVideoDecoder(codec, ctx, canvas) {
+    closeVideoDecoder();
+    decoderCodec = codec;
+    videoDecoder = new VideoDecoder({
+        output: (frame) => {
+            ctx.drawImage(frame, 0, 0, canvas.width, canvas.height);
+            const pending = decodeStarts.get(frame.timestamp);
+            decodeStarts.delete(frame.timestamp);
+            frame.close();
+            if (pending !== undefined) {
+                recordDecode(pending.start);
+                recordTrace(pending.seq, pending.received);
+            }
+        },
+        error: (error) => {
+            console.error('Error en el decodificador H.264:', error);
+            videoDecoder = null;
+        }
+    });
+    videoDecoder.configure({ codec: codec, optimizeForLatency: true });
+}
+
+function closeVideoDecoder() {
+    if (videoDecoder && videoDecoder.state !== 'closed') {
+        videoDecoder.close();
+    }
+    videoDecoder = null;
+    decoderCodec = null;
+    decodeStarts.clear();
+}
+
+// Acumular el tiempo desde la llegada del frame hasta dibujarlo
+function recordDecode(start) {
+    framesDrawn++;
+    decodeTimeTotal += performance.now() - start;
+}
+
+// Enviar cada pocos segundos los FPS dibujados y el tiempo medio de decodificación
+function startFeedbackReports() {
+    if (feedbackInterval) {
+        clearInterval(feedbackInterval);
+    }
+    framesDrawn = 0;
+    decodeTimeTotal = 0;
+    lastFeedback = performance.now();
+    
+    feedbackInterval = setInterval(() => {
+        const now = performance.now();
+        const elapsed = (now - lastFeedback) / 1000;
+        if (socket && socket.connected && isStreamActive) {
+            socket.emit('video_feedback', {
+                fps: Math.round(framesDrawn / elapsed * 10) / 10,
+                decode_ms: framesDrawn > 0 ? Math.round(decodeTimeTotal / framesDrawn * 10) / 10 : null
+            });
+        }
+        framesDrawn = 0;
+        decodeTimeTotal = 0;
+        lastFeedback = now;
+    }, FEEDBACK_INTERVAL);
+}
+
+// Guardar cuándo se recibió y se dibujó un frame para devolverlo al servidor
+function recordTrace(seq, received) {
+    if (seq === undefined || frameTraces.length >= MAX_PENDING_TRACES) {
+        return;
+    }
+    frameTraces.push([seq, received, performance.now()]);
+}
+
+// Estimar el desfase con el reloj del servidor; la muestra con menor tiempo de
+// ida y vuelta es la de menor error
+function syncClock() {
+    if (!socket || !socket.connected) {
+        return;
+    }
+    const sent = performance.now();
+    socket.emit('clock_sync', {}, (response) => {
+        const rtt = performance.now() - sent;
+        if (!response || typeof response.server_time !== 'number') {
+            return;
+        }
+        clockSamples.push({ offset: response.server_time - (sent + rtt / 2), rtt: rtt });
+        if (clockSamples.length > CLOCK_SAMPLES) {
+            clockSamples.shift();
+        }
+        const best = clockSamples.reduce((a, b) => (b.rtt < a.rtt ? b : a));
+        clockOffset = best.offset;
+        clockRtt = Math.round(best.rtt * 10) / 10;
+    });
+}
+
+// Sincronizar el reloj periódicamente y enviar cada segundo las trazas pendientes;
+// la respuesta trae el desglose de latencia por tramo que se muestra en pantalla
+function startLatencyTracing() {
+    clearInterval(traceInterval);
+    clearInterval(clockSyncInterval);
+    clockSamples = [];
+    clockOffset = null;
+    frameTraces = [];
+    // Varias muestras al conectar para tener pronto una estimación fiable
+    for (let i = 0; i < 4; i++) {
+        setTimeout(syncClock, i * 250);
+    }
+    clockSyncInterval = setInterval(syncClock, CLOCK_SYNC_INTERVAL);
+    
+    traceInterval = setInterval(() => {
+        if (!socket || !socket.connected || clockOffset === null || frameTraces.length === 0) {
+            return;
+        }
+        const frames = frameTraces;
+        frameTraces = [];
+        socket.emit('frame_trace', { frames: frames, offset_ms: clockOffset, rtt_ms: clockRtt }, (response) => {
+            if (response && response.breakdown) {
+                latencyBreakdown = response.breakdown;
+            }
+        });
+    }, TRACE_INTERVAL);
+}
+
+// Texto del desglose de latencia (mediana por tramo) para la superposición de estadísticas
+function formatLatency(breakdown) {
+    if (!breakdown || !breakdown.total) {
+        return '';
+    }
+    const part = (name) => (breakdown[name] ? breakdown[name].p50 : '-');
+    const server = ['publish', 'send_queue']
+        .reduce((total, name) => total + (breakdown[name] ? breakdown[name].p50 : 0), 0);
+    return ` | Latencia: ${breakdown.total.p50} ms (cámara ${part('camera')} · codif. ${part('encode')}` +
+        ` · servidor ${Math.round(server * 10) / 10} · red ${part('network')} · navegador ${part('browser')})`;
+}
+
+// Decodificar y dibujar un frame JPEG binario; si llega otro durante la decodificación
+// solo se conserva el más reciente y el descartado se confirma de inmediato
+function drawBinaryFrame(item, ctx, canvas) {
+    if (decodingFrame) {
+        if (pendingFrame) {
+            pendingFrame.ack();
+        }
+        pendingFrame = item;
+        return;
+    }
+    decodingFrame = true;
+    const start = performance.now();
+    createImageBitmap(new Blob([item.frame], { type: 'image/jpeg' }))
+        .then((bitmap) => {
+            ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+            bitmap.close();
+            recordDecode(start);
+            recordTrace(item.seq, item.received);
+        })
+        .catch((error) => {
+            console.error('Error al decodificar frame:', error);
+        })
+        .finally(() => {
+            decodingFrame = false;
+            item.ack();
+            if (pendingFrame) {
+                const next = pendingFrame;
+                pendingFrame = null;
+                drawBinaryFrame(next, ctx, canvas);
+            }
+        });
+}
+
 // Iniciar verificación periódica del estado de conexión
 function startConnectionCheck() {
     // Verificar el estado de conexión cada 5 segundos
@@ -8,8 +8,10 @@ Servo servoDS04;      // Servo para el control de rotación (DS04) - 0-360 grado
 const int SERVO_MG995_PIN = 9;  // Pin para servo MG995
 const int SERVO_DS04_PIN = 10;  // Pin para servo DS04
 
-// Intervalo para reportar ángulos en ms
+// Intervalo para reportar ángulos en ms (se reduce a velocidades altas, ver ajustarTelemetria)
 const unsigned long ANGLE_REPORT_INTERVAL = 100; 
+const unsigned long ANGLE_REPORT_INTERVAL_FAST = 25;
+unsigned long angleReportInterval = ANGLE_REPORT_INTERVAL;
 unsigned long lastAngleReport = 0;
 
 // Estado de los servos
@@ -34,8 +36,45 @@ unsigned long lastDS04Update = 0;
 // Determina cuán rápido se mueve el servo (cuánto tiempo entre cada incremento de ángulo)
 const int speedDelays[] = {50, 25, 5}; 
 
+// Protocolo binario opcional: [SYNC][OPCODE][SEQ][P0..P4][CRC8]
+// El CRC8 (polinomio 0x07) cubre OPCODE..P4. Se activa con el comando de texto "proto,bin"
+// P0 es el servo (0 = MG995, 1 = DS04)
+const uint8_t PACKET_SYNC = 0xA5;
+const uint8_t PACKET_SIZE = 9;
+const uint8_t OP_SERVO_MOVE = 0x10;    // P1..P2 ángulo (big endian), P3 velocidad, P4 flags
+const uint8_t OP_SERVO_STOP = 0x11;    // P1 flags
+const uint8_t OP_SERVO_SPEED = 0x12;   // P1 velocidad
+const uint8_t OP_SERVO_REVERSE = 0x13;
+const uint8_t OP_SERVO_LIMIT = 0x14;   // P1..P2 límite (big endian)
+const uint8_t FLAG_CALIBRATION = 0x01;
+const uint8_t FLAG_FORCE_STOP = 0x02;
+bool modoBinario = false;
+// Los mensajes informativos solo se envían a los comandos que llegaron como texto:
+// el PI sigue mandando en texto lo que no cabe en un paquete y espera esas respuestas
+bool respuestaTexto = true;
+
+// Negociación de velocidad: se arranca siempre a BAUD_BASE y el PI pide "baud,<velocidad>".
+// Si tras el cambio no llega "ping" en BAUD_CONFIRM_TIMEOUT ms se vuelve a BAUD_BASE
+const long BAUD_BASE = 9600;
+const long BAUD_RATES[] = {115200, 57600, 9600};
+const unsigned long BAUD_CONFIRM_TIMEOUT = 1000;
+bool baudPendiente = false;
+unsigned long baudCambio = 0;
+
+// Referencias al estado de un servo (declarada antes de las funciones que la usan)
+struct EstadoServo {
+  Servo* servo;
+  int* currentAngle;
+  int* targetAngle;
+  int* servoSpeed;
+  bool* isMoving;
+  bool* isReverse;
+  int* servoLimit;
+  unsigned long* lastUpdate;
+};
+
 void setup() {
-  Serial.begin(9600);
+  Serial.begin(BAUD_BASE);
   
   // Configurar pines de servos
   servoMG995.attach(SERVO_MG995_PIN);
@@ -48,14 +87,42 @@ void setup() {
 }
 
 void loop() {
+  comprobarBaudios();
+
   // Procesar comandos seriales
   if (Serial.available() > 0) {
-    String command = Serial.readStringUntil('\n');
-    command.trim(); // Eliminar espacios en blanco
+    // En modo binario, el byte de sincronización inicia un paquete de tamaño fijo
+    if (modoBinario && Serial.peek() == PACKET_SYNC) {
+      respuestaTexto = false;
+      procesarPaqueteBinario();
+      respuestaTexto = true;
+    } else {
+      String command = Serial.readStringUntil('\n');
+      command.trim(); // Eliminar espacios en blanco
 
-    // Procesar solo si es un comando para servo
-    if (command.startsWith("servo")) {
-      procesarComandoServo(command);
+      // Negociación de protocolo
+      if (command == "proto,bin") {
+        modoBinario = true;
+        Serial.println("proto,bin,ok");
+      } else if (command == "proto,text") {
+        modoBinario = false;
+        Serial.println("proto,text,ok");
+      }
+      // Negociación de velocidad
+      else if (command.startsWith("baud,")) {
+        cambiarBaudios(command.substring(5).toInt());
+      } else if (command == "ping") {
+        baudPendiente = false;
+        Serial.println("pong");
+      }
+      // Identificación para el descubrimiento de puertos
+      else if (command == "id") {
+        Serial.println("id,servos");
+      }
+      // Procesar solo si es un comando para servo
+      else if (command.startsWith("servo")) {
+        procesarComandoServo(command);
+      }
     }
   }
   
@@ -95,8 +162,8 @@ void calibrarServos() {
 void reportarAngulos() {
   unsigned long currentMillis = millis();
   
-  // Reportar cada ANGLE_REPORT_INTERVAL ms (cada 100ms por defecto)
-  if (currentMillis - lastAngleReport >= ANGLE_REPORT_INTERVAL) {
+  // Reportar cada angleReportInterval ms (cada 100ms a la velocidad base)
+  if (currentMillis - lastAngleReport >= angleReportInterval) {
     lastAngleReport = currentMillis;
     
     // Reportar ángulo del MG995
@@ -109,6 +176,33 @@ void reportarAngulos() {
   }
 }
 
+// Seleccionar variables según el servo; devuelve false si el tipo es desconocido
+bool seleccionarServo(String servoType, EstadoServo &estado) {
+  if (servoType == "mg995") {
+    estado.servo = &servoMG995;
+    estado.currentAngle = &servoMG995Angle;
+    estado.targetAngle = &servoMG995Target;
+    estado.servoSpeed = &servoMG995Speed;
+    estado.isMoving = &servoMG995Moving;
+    estado.isReverse = &servoMG995Reverse;
+    estado.servoLimit = &servoMG995Limit;
+    estado.lastUpdate = &lastMG995Update;
+    return true;
+  } 
+  else if (servoType == "ds04") {
+    estado.servo = &servoDS04;
+    estado.currentAngle = &servoDS04Angle;
+    estado.targetAngle = &servoDS04Target;
+    estado.servoSpeed = &servoDS04Speed;
+    estado.isMoving = &servoDS04Moving;
+    estado.isReverse = &servoDS04Reverse;
+    estado.servoLimit = &servoDS04Limit;
+    estado.lastUpdate = &lastDS04Update;
+    return true;
+  }
+  return false;
+}
+
 // Procesar comandos para servos
 void procesarComandoServo(String command) {
   // Formato: servo,tipo,accion,parametros
@@ -135,36 +229,8 @@ void procesarComandoServo(String command) {
   }
   
   // Seleccionar variables según el servo
-  Servo* targetServo;
-  int* currentAngle;
-  int* targetAngle;
-  int* servoSpeed;
-  bool* isMoving;
-  bool* isReverse;
-  int* servoLimit;
-  unsigned long* lastUpdate;
-  
-  if (servoType == "mg995") {
-    targetServo = &servoMG995;
-    currentAngle = &servoMG995Angle;
-    targetAngle = &servoMG995Target;
-    servoSpeed = &servoMG995Speed;
-    isMoving = &servoMG995Moving;
-    isReverse = &servoMG995Reverse;
-    servoLimit = &servoMG995Limit;
-    lastUpdate = &lastMG995Update;
-  } 
-  else if (servoType == "ds04") {
-    targetServo = &servoDS04;
-    currentAngle = &servoDS04Angle;
-    targetAngle = &servoDS04Target;
-    servoSpeed = &servoDS04Speed;
-    isMoving = &servoDS04Moving;
-    isReverse = &servoDS04Reverse;
-    servoLimit = &servoDS04Limit;
-    lastUpdate = &lastDS04Update;
-  } 
-  else {
+  EstadoServo estado;
+  if (!seleccionarServo(servoType, estado)) {
     Serial.println("Tipo de servo desconocido");
     return;
   }
@@ -194,143 +260,267 @@ void procesarComandoServo(String command) {
         speed = restParams.toInt();
       }
       
-      // Validar límites según tipo de servo
-      if (servoType == "mg995") {
-        // Aplicar límite configurado
-        if (angle > *servoLimit) {
-          angle = *servoLimit;
-        }
-        angle = constrain(angle, 0, 180);
-      } else if (servoType == "ds04") {
-        // Aplicar límite configurado
-        if (angle > *servoLimit) {
-          angle = *servoLimit;
-        }
-        angle = constrain(angle, 0, 360);
-      }
-      
-      // Validar velocidad
-      speed = constrain(speed, 1, 3);
-      
-      // Si es calibración a 0°, mover inmediatamente
-      if (isCalibration && angle == 0) {
-        Serial.print("Calibrando servo ");
-        Serial.print(servoType);
-        Serial.println(" a 0 grados");
-        
-        // Posición 0° inmediatamente
-        *currentAngle = 0;
-        *targetAngle = 0;
-        *isMoving = false;
-        
-        if (servoType == "mg995") {
-          targetServo->write(0);
-        } else {
-          // Para DS04, 90° es posición detenida
-          targetServo->write(90);
-        }
-        
-        // Reportar nueva posición
-        Serial.print("servo_angle,");
-        Serial.print(servoType);
-        Serial.println(",0");
-        return;
-      }
-      
-      // Si es DS04 en posición central con force_stop
-      if (servoType == "ds04" && angle == 90 && forceStop) {
-        *isMoving = false;
-        // Establecer posición central
-        targetServo->write(90);
-        *currentAngle = 90;
-        *targetAngle = 90;
-        Serial.println("DS04 detenido en posición central (forzado)");
-        
-        // Reportar nueva posición
-        Serial.print("servo_angle,ds04,");
-        Serial.println(90);
-        return;
-      }
-      
-      // Aplicar inversión de dirección si está activada
-      int finalAngle = angle;
-      if (*isReverse) {
-        if (servoType == "mg995") {
-          finalAngle = 180 - angle;
-        } else if (servoType == "ds04") {
-          finalAngle = 360 - angle;
-        }
-      }
-      
-      // Configurar movimiento
-      *targetAngle = finalAngle;
-      *servoSpeed = speed;
-      *isMoving = true;
-      *lastUpdate = millis();
-      
-      Serial.print("Moviendo servo ");
-      Serial.print(servoType);
-      Serial.print(" a ángulo ");
-      Serial.print(angle);
-      Serial.print(" con velocidad ");
-      Serial.println(speed);
+      moverServo(servoType, estado, angle, speed, isCalibration, forceStop);
     }
   }
   else if (action == "stop") {
-    // Detener el servo inmediatamente
-    *isMoving = false;
+    detenerServo(servoType, estado);
+  }
+  else if (action == "speed") {
+    ajustarVelocidadServo(servoType, estado, actionParams.toInt());
+  } 
+  else if (action == "reverse") {
+    invertirServo(servoType, estado);
+  }
+  else if (action == "limit") {
+    ajustarLimiteServo(servoType, estado, actionParams.toInt());
+  }
+}
+
+// Cambiar la velocidad del puerto serie si está admitida; responde a la velocidad actual
+void cambiarBaudios(long velocidad) {
+  bool admitida = false;
+  for (unsigned int i = 0; i < sizeof(BAUD_RATES) / sizeof(BAUD_RATES[0]); i++) {
+    if (BAUD_RATES[i] == velocidad) {
+      admitida = true;
+    }
+  }
+
+  Serial.print("baud,");
+  Serial.print(velocidad);
+  if (!admitida) {
+    Serial.println(",error");
+    return;
+  }
+  Serial.println(",ok");
+  Serial.flush(); // Terminar de enviar la confirmación antes de cambiar
+
+  Serial.begin(velocidad);
+  baudPendiente = velocidad != BAUD_BASE;
+  baudCambio = millis();
+  ajustarTelemetria(velocidad);
+}
+
+// Volver a la velocidad base si el PI no confirmó el cambio
+void comprobarBaudios() {
+  if (baudPendiente && millis() - baudCambio > BAUD_CONFIRM_TIMEOUT) {
+    baudPendiente = false;
+    Serial.begin(BAUD_BASE);
+    ajustarTelemetria(BAUD_BASE);
+  }
+}
+
+// Reportar ángulos más a menudo cuando la velocidad del puerto lo permite
+void ajustarTelemetria(long velocidad) {
+  angleReportInterval = velocidad >= 57600 ? ANGLE_REPORT_INTERVAL_FAST : ANGLE_REPORT_INTERVAL;
+}
+
+// Calcular CRC8 (polinomio 0x07, valor inicial 0)
+uint8_t crc8(const uint8_t *data, uint8_t length) {
+  uint8_t crc = 0;
+  for (uint8_t i = 0; i < length; i++) {
+    crc ^= data[i];
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+    }
+  }
+  return crc;
+}
+
+// Procesar un paquete binario; responde "ack,<seq>" o "nak,<seq>"
+void procesarPaqueteBinario() {
+  uint8_t packet[PACKET_SIZE];
+  if (Serial.readBytes(packet, PACKET_SIZE) < PACKET_SIZE) {
+    return; // Paquete incompleto: se descarta
+  }
+  
+  uint8_t opcode = packet[1];
+  uint8_t seq = packet[2];
+  String servoType = packet[3] == 0 ? "mg995" : (packet[3] == 1 ? "ds04" : "");
+  EstadoServo estado;
+  bool valido = crc8(packet + 1, PACKET_SIZE - 2) == packet[PACKET_SIZE - 1] &&
+                seleccionarServo(servoType, estado);
+  
+  if (valido && opcode == OP_SERVO_MOVE) {
+    moverServo(servoType, estado, (packet[4] << 8) | packet[5], packet[6],
+               packet[7] & FLAG_CALIBRATION, packet[7] & FLAG_FORCE_STOP);
+  }
+  else if (valido && opcode == OP_SERVO_STOP) {
+    detenerServo(servoType, estado);
+  }
+  else if (valido && opcode == OP_SERVO_SPEED) {
+    ajustarVelocidadServo(servoType, estado, packet[4]);
+  }
+  else if (valido && opcode == OP_SERVO_REVERSE) {
+    invertirServo(servoType, estado);
+  }
+  else if (valido && opcode == OP_SERVO_LIMIT) {
+    ajustarLimiteServo(servoType, estado, (packet[4] << 8) | packet[5]);
+  }
+  else {
+    Serial.print("nak,");
+    Serial.println(seq);
+    return;
+  }
+  
+  Serial.print("ack,");
+  Serial.println(seq);
+}
+
+// Mover un servo a un ángulo con la velocidad indicada
+void moverServo(String servoType, EstadoServo &estado, int angle, int speed, bool isCalibration, bool forceStop) {
+  // Validar límites según tipo de servo
+  if (servoType == "mg995") {
+    // Aplicar límite configurado
+    if (angle > *estado.servoLimit) {
+      angle = *estado.servoLimit;
+    }
+    angle = constrain(angle, 0, 180);
+  } else if (servoType == "ds04") {
+    // Aplicar límite configurado
+    if (angle > *estado.servoLimit) {
+      angle = *estado.servoLimit;
+    }
+    angle = constrain(angle, 0, 360);
+  }
+  
+  // Validar velocidad
+  speed = constrain(speed, 1, 3);
+  
+  // Si es calibración a 0°, mover inmediatamente
+  if (isCalibration && angle == 0) {
+    if (respuestaTexto) {
+      Serial.print("Calibrando servo ");
+      Serial.print(servoType);
+      Serial.println(" a 0 grados");
+    }
     
-    // Para DS04, enviar señal central
-    if (servoType == "ds04") {
-      targetServo->write(90);
-      Serial.println("DS04 detenido en posición central");
+    // Posición 0° inmediatamente
+    *estado.currentAngle = 0;
+    *estado.targetAngle = 0;
+    *estado.isMoving = false;
+    
+    if (servoType == "mg995") {
+      estado.servo->write(0);
     } else {
-      // Para MG995, mantener posición actual
-      targetServo->write(*currentAngle);
-      Serial.print("MG995 detenido en posición ");
-      Serial.println(*currentAngle);
+      // Para DS04, 90° es posición detenida
+      estado.servo->write(90);
     }
     
-    // Actualizar objetivo para que coincida con posición actual
-    *targetAngle = *currentAngle;
-    
-    // Confirmar detención
-    Serial.print("servo_stopped,");
-    Serial.println(servoType);
+    // Reportar nueva posición
+    Serial.print("servo_angle,");
+    Serial.print(servoType);
+    Serial.println(",0");
+    return;
   }
-  else if (action == "speed") {
-    // Cambiar velocidad
-    int speed = actionParams.toInt();
-    speed = constrain(speed, 1, 3);
-    *servoSpeed = speed;
+  
+  // Si es DS04 en posición central con force_stop
+  if (servoType == "ds04" && angle == 90 && forceStop) {
+    *estado.isMoving = false;
+    // Establecer posición central
+    estado.servo->write(90);
+    *estado.currentAngle = 90;
+    *estado.targetAngle = 90;
+    if (respuestaTexto) {
+      Serial.println("DS04 detenido en posición central (forzado)");
+    }
     
+    // Reportar nueva posición
+    Serial.print("servo_angle,ds04,");
+    Serial.println(90);
+    return;
+  }
+  
+  // Aplicar inversión de dirección si está activada
+  int finalAngle = angle;
+  if (*estado.isReverse) {
+    if (servoType == "mg995") {
+      finalAngle = 180 - angle;
+    } else if (servoType == "ds04") {
+      finalAngle = 360 - angle;
+    }
+  }
+  
+  // Configurar movimiento
+  *estado.targetAngle = finalAngle;
+  *estado.servoSpeed = speed;
+  *estado.isMoving = true;
+  *estado.lastUpdate = millis();
+  
+  if (respuestaTexto) {
+    Serial.print("Moviendo servo ");
+    Serial.print(servoType);
+    Serial.print(" a ángulo ");
+    Serial.print(angle);
+    Serial.print(" con velocidad ");
+    Serial.println(speed);
+  }
+}
+
+// Detener el servo inmediatamente
+void detenerServo(String servoType, EstadoServo &estado) {
+  *estado.isMoving = false;
+  
+  // Para DS04, enviar señal central
+  if (servoType == "ds04") {
+    estado.servo->write(90);
+    if (respuestaTexto) {
+      Serial.println("DS04 detenido en posición central");
+    }
+  } else {
+    // Para MG995, mantener posición actual
+    estado.servo->write(*estado.currentAngle);
+    if (respuestaTexto) {
+      Serial.print("MG995 detenido en posición ");
+      Serial.println(*estado.currentAngle);
+    }
+  }
+  
+  // Actualizar objetivo para que coincida con posición actual
+  *estado.targetAngle = *estado.currentAngle;
+  
+  // Confirmar detención
+  Serial.print("servo_stopped,");
+  Serial.println(servoType);
+}
+
+// Cambiar velocidad
+void ajustarVelocidadServo(String servoType, EstadoServo &estado, int speed) {
+  speed = constrain(speed, 1, 3);
+  *estado.servoSpeed = speed;
+  
+  if (respuestaTexto) {
     Serial.print("Velocidad del servo ");
     Serial.print(servoType);
     Serial.print(" ajustada a ");
     Serial.println(speed);
-  } 
-  else if (action == "reverse") {
-    // Invertir dirección
-    *isReverse = !(*isReverse);
-    
+  }
+}
+
+// Invertir dirección
+void invertirServo(String servoType, EstadoServo &estado) {
+  *estado.isReverse = !(*estado.isReverse);
+  
+  if (respuestaTexto) {
     Serial.print("Dirección del servo ");
     Serial.print(servoType);
     Serial.print(" ");
-    Serial.println(*isReverse ? "invertida" : "normal");
+    Serial.println(*estado.isReverse ? "invertida" : "normal");
   }
-  else if (action == "limit") {
-    // Establecer límite de ángulo
-    int limit = actionParams.toInt();
-    
-    // Validar límite según tipo de servo
-    if (servoType == "mg995") {
-      limit = constrain(limit, 0, 180);
-    } else if (servoType == "ds04") {
-      limit = constrain(limit, 0, 360);
-    }
-    
-    *servoLimit = limit;
-    
+}
+
+// Establecer límite de ángulo
+void ajustarLimiteServo(String servoType, EstadoServo &estado, int limit) {
+  // Validar límite según tipo de servo
+  if (servoType == "mg995") {
+    limit = constrain(limit, 0, 180);
+  } else if (servoType == "ds04") {
+    limit = constrain(limit, 0, 360);
+  }
+  
+  *estado.servoLimit = limit;
+  
+  if (respuestaTexto) {
     Serial.print("Límite de ángulo para ");
     Serial.print(servoType);
     Serial.print(" establecido a ");
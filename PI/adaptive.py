@@ -0,0 +1,230 @@
+# Control adaptativo de calidad, FPS y resolución del video según la respuesta de los clientes
+import collections
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Límites por defecto; se pueden ajustar con configure()
+DEFAULT_BOUNDS = {
+    'quality': {'min': 30, 'max': 90, 'step': 10},
+    'fps': [10, 15, 20, 30],
+    'resolutions': [[320, 240], [480, 360], [640, 480]]
+}
+
+
+def _positive_int(value, name):
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ValueError(f"{name} debe ser un entero positivo: {value!r}")
+    return value
+
+
+def _validate_bounds(bounds):
+    """Comprobar los límites recibidos del cliente; devuelve una copia normalizada"""
+    if not isinstance(bounds, dict):
+        raise ValueError("Los límites deben ser un objeto")
+    unknown = set(bounds) - set(DEFAULT_BOUNDS)
+    if unknown:
+        raise ValueError(f"Límites desconocidos: {', '.join(sorted(unknown))}")
+    validated = {}
+    if 'quality' in bounds:
+        quality = bounds['quality']
+        if not isinstance(quality, dict) or set(quality) != {'min', 'max', 'step'}:
+            raise ValueError("quality debe tener min, max y step")
+        low, high = _positive_int(quality['min'], 'quality.min'), _positive_int(quality['max'], 'quality.max')
+        step = _positive_int(quality['step'], 'quality.step')
+        if not low <= high <= 100:
+            raise ValueError(f"quality debe cumplir 1 <= min <= max <= 100: {low}-{high}")
+        validated['quality'] = {'min': low, 'max': high, 'step': step}
+    if 'fps' in bounds:
+        fps = bounds['fps']
+        if not isinstance(fps, list) or not fps:
+            raise ValueError("fps debe ser una lista no vacía")
+        validated['fps'] = sorted({_positive_int(value, 'fps') for value in fps})
+    if 'resolutions' in bounds:
+        resolutions = bounds['resolutions']
+        if not isinstance(resolutions, list) or not resolutions:
+            raise ValueError("resolutions debe ser una lista no vacía")
+        validated['resolutions'] = []
+        for value in resolutions:
+            if not isinstance(value, (list, tuple)) or len(value) != 2:
+                raise ValueError(f"Cada resolución debe ser [ancho, alto]: {value!r}")
+            validated['resolutions'].append([_positive_int(value[0], 'ancho'), _positive_int(value[1], 'alto')])
+    return validated
+
+
+class AdaptiveController:
+    """Ajusta el perfil de video en lazo cerrado.
+
+    Cada `interval` segundos combina lo que informan los clientes (tiempo de
+    decodificación y FPS recibidos) con lo que mide el servidor (frames
+    descartados y retraso de envío) y, según el cliente en peor estado, baja un
+    escalón de inmediato o sube uno tras varias evaluaciones sanas seguidas.
+
+    Empieza desactivado: se activa con configure(enabled=True) y un ajuste
+    manual de calidad, FPS o resolución lo suspende (ver suspend()).
+    """
+
+    def __init__(self, camera, interval=2.0, healthy_rounds=3, history=50, enabled=False):
+        self.camera = camera
+        self.interval = interval
+        self.healthy_rounds = healthy_rounds
+        self.bounds = {key: (dict(value) if isinstance(value, dict) else list(value))
+                       for key, value in DEFAULT_BOUNDS.items()}
+        # Umbrales de congestión / salud
+        self.max_drop_ratio = 0.2
+        self.ok_drop_ratio = 0.05
+        self.max_lag_ms = 300
+        self.ok_lag_ms = 100
+        self.enabled = enabled
+        self.feedback = {}  # client_id -> último informe del cliente
+        self.decisions = collections.deque(maxlen=history)
+        self._previous = {}  # client_id -> (sent, dropped) de la evaluación anterior
+        self._healthy = 0
+
+    def configure(self, enabled=None, bounds=None):
+        """Activar/desactivar el control y ajustar los límites.
+
+        Lanza ValueError si los límites no son válidos; en ese caso no se aplica nada.
+        """
+        if bounds:
+            self.bounds.update(_validate_bounds(bounds))
+        if enabled is not None:
+            self.enabled = bool(enabled)
+            self._healthy = 0
+            logger.info(f"Control adaptativo de video {'activado' if self.enabled else 'desactivado'}")
+
+    def suspend(self, setting):
+        """Un ajuste manual tiene prioridad: desactivar el control hasta que se vuelva a pedir"""
+        if self.enabled:
+            self.enabled = False
+            self._healthy = 0
+            logger.info(f"Control adaptativo de video desactivado por un ajuste manual de {setting}")
+
+    def report(self, client_id, decode_ms=None, fps=None):
+        """Registrar el informe periódico de un cliente"""
+        self.feedback[client_id] = {
+            'decode_ms': float(decode_ms) if decode_ms is not None else None,
+            'fps': float(fps) if fps is not None else None,
+            'time': time.monotonic()
+        }
+
+    def remove_client(self, client_id):
+        self.feedback.pop(client_id, None)
+        self._previous.pop(client_id, None)
+
+    def _client_metrics(self):
+        """Métricas por cliente desde la última evaluación"""
+        metrics = {}
+        now = time.monotonic()
+        for client_id, stats in self.camera.broadcaster.stats().items():
+            sent, dropped = stats['sent'], stats['dropped']
+            prev_sent, prev_dropped = self._previous.get(client_id, (sent, dropped))
+            self._previous[client_id] = (sent, dropped)
+            delta_sent, delta_dropped = sent - prev_sent, dropped - prev_dropped
+            total = delta_sent + delta_dropped
+            feedback = self.feedback.get(client_id)
+            if feedback and now - feedback['time'] > 3 * self.interval:
+                feedback = None  # Informe caducado
+            metrics[client_id] = {
+                'drop_ratio': delta_dropped / total if total else 0.0,
+                'lag_ms': stats['lag_ms'],
+                'backlog': stats.get('backlog', 0),
+                'decode_ms': feedback['decode_ms'] if feedback else None,
+                'fps': feedback['fps'] if feedback else None
+            }
+        return metrics
+
+    def _assess(self, m):
+        """'congested', 'decode' (cliente sin CPU suficiente), 'healthy' o 'steady'"""
+        target_fps = self.camera.fps
+        budget_ms = 1000.0 / target_fps
+        if m['decode_ms'] is not None and m['decode_ms'] > 0.8 * budget_ms:
+            return 'decode'
+        if (m['drop_ratio'] > self.max_drop_ratio or m['lag_ms'] > self.max_lag_ms or
+                (m['fps'] is not None and m['fps'] < 0.7 * target_fps)):
+            return 'congested'
+        if (m['drop_ratio'] <= self.ok_drop_ratio and m['lag_ms'] <= self.ok_lag_ms and
+                (m['fps'] is None or m['fps'] >= 0.9 * target_fps) and
+                (m['decode_ms'] is None or m['decode_ms'] <= 0.5 * budget_ms)):
+            return 'healthy'
+        return 'steady'
+
+    def evaluate(self):
+        """Una iteración del control; devuelve la decisión tomada o None"""
+        metrics = self._client_metrics()
+        if not metrics:
+            return None
+        states = {client_id: self._assess(m) for client_id, m in metrics.items()}
+        worst = next((state for state in ('decode', 'congested', 'steady') if state in states.values()), 'healthy')
+
+        if worst in ('decode', 'congested'):
+            self._healthy = 0
+            # Con el decodificador saturado solo ayuda reducir píxeles o frames
+            order = ('resolution', 'fps') if worst == 'decode' else ('quality', 'fps', 'resolution')
+            change = self._step(order, -1)
+        elif worst == 'healthy':
+            self._healthy += 1
+            if self._healthy < self.healthy_rounds:
+                return None
+            self._healthy = 0
+            change = self._step(('resolution', 'fps', 'quality'), +1)
+        else:
+            self._healthy = 0
+            return None
+        if change is None:
+            return None
+
+        decision = dict(change, reason=worst, time=time.time(),
+                        clients={client_id: dict(m, state=states[client_id]) for client_id, m in metrics.items()})
+        self.decisions.append(decision)
+        logger.info(f"Video adaptativo ({worst}): {change['setting']} {change['from']} -> {change['to']}")
+        return decision
+
+    def _step(self, order, direction):
+        """Mover un escalón el primer parámetro de `order` que no esté en su límite"""
+        for setting in order:
+            if setting == 'quality' and self.camera.active_codec() != 'mjpeg':
+                continue  # La calidad JPEG no afecta al flujo H.264
+            current, candidate = self._neighbour(setting, direction)
+            if candidate is None:
+                continue
+            if setting == 'quality':
+                self.camera.set_quality(candidate)
+            elif setting == 'fps':
+                self.camera.set_fps(candidate)
+            else:
+                self.camera.set_resolution(*candidate)
+            return {'setting': setting, 'from': current, 'to': candidate}
+        return None
+
+    def _neighbour(self, setting, direction):
+        """(valor actual, valor del escalón siguiente o None)"""
+        if setting == 'quality':
+            limits = self.bounds['quality']
+            current = self.camera.quality
+            candidate = min(limits['max'], max(limits['min'], current + direction * limits['step']))
+            return current, (candidate if candidate != current else None)
+        if setting == 'fps':
+            ladder = sorted(self.bounds['fps'])
+            current = self.camera.fps
+            size = lambda value: value
+        else:
+            size = lambda value: value[0] * value[1]
+            ladder = sorted((list(value) for value in self.bounds['resolutions']), key=size)
+            current = [self.camera.width, self.camera.height]
+        if direction < 0:
+            lower = [value for value in ladder if size(value) < size(current)]
+            return current, (lower[-1] if lower else None)
+        higher = [value for value in ladder if size(value) > size(current)]
+        return current, (higher[0] if higher else None)
+
+    def stats(self):
+        """Estado del control para /server_info"""
+        return {
+            'enabled': self.enabled,
+            'bounds': self.bounds,
+            'healthy_rounds': self._healthy,
+            'feedback': self.feedback,
+            'decisions': list(self.decisions)
+        }
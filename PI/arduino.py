@@ -0,0 +1,724 @@
+# Enlace serie con los Arduinos: hilo lector continuo y correlación comando/respuesta
+import collections
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from eventlet import tpool
+
+logger = logging.getLogger(__name__)
+
+# Líneas de los sketches que indican un comando rechazado
+ERROR_LINES = ("Modo no válido", "Tipo de servo desconocido", "nak,")
+# Respuesta local de un comando reemplazado en la cola antes de enviarse
+REPLACED_RESPONSE = "Reemplazado por un comando más reciente"
+
+# Los sketches arrancan siempre a esta velocidad; otras se negocian con "baud,<velocidad>"
+BASE_BAUDRATE = 9600
+# Tiempo tras el que el Arduino vuelve a la velocidad base si no recibe "ping"
+BAUD_CONFIRM_TIMEOUT = 1.0
+
+# Protocolo binario: paquetes de tamaño fijo
+#   [SYNC][OPCODE][SEQ][P0][P1][P2][P3][P4][CRC8]
+# El CRC8 (polinomio 0x07) cubre OPCODE..P4. El Arduino responde "ack,<seq>" o "nak,<seq>".
+PACKET_SYNC = 0xA5
+PACKET_SIZE = 9
+
+# Opcodes de Motores.ino: P0..P3 velocidades, P4 máscara de reversa (bit i = motor i+1)
+OP_MOTOR_OFF = 0x01
+OP_MOTOR_DRIVE = 0x02
+# Opcodes de Servomotores.ino: P0 servo (0 = mg995, 1 = ds04)
+OP_SERVO_MOVE = 0x10     # P1..P2 ángulo (big endian), P3 velocidad, P4 flags
+OP_SERVO_STOP = 0x11     # P1 flags
+OP_SERVO_SPEED = 0x12    # P1 velocidad
+OP_SERVO_REVERSE = 0x13
+OP_SERVO_LIMIT = 0x14    # P1..P2 límite (big endian)
+
+SERVO_IDS = {'mg995': 0, 'ds04': 1}
+FLAG_CALIBRATION = 0x01
+FLAG_FORCE_STOP = 0x02
+FLAG_PRIORITY = 0x04
+
+# Tabla del CRC-8 (polinomio 0x07, valor inicial 0)
+_CRC8_TABLE = []
+for _byte in range(256):
+    _crc = _byte
+    for _ in range(8):
+        _crc = ((_crc << 1) ^ 0x07) & 0xFF if _crc & 0x80 else (_crc << 1) & 0xFF
+    _CRC8_TABLE.append(_crc)
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc = _CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def encode_packet(opcode, seq, payload):
+    """Construye un paquete binario de tamaño fijo"""
+    body = bytes([opcode, seq & 0xFF]) + bytes(payload).ljust(5, b'\x00')
+    return bytes([PACKET_SYNC]) + body + bytes([crc8(body)])
+
+
+def _flags(values):
+    flags = 0
+    if 'calibration' in values:
+        flags |= FLAG_CALIBRATION
+    if 'force_stop' in values:
+        flags |= FLAG_FORCE_STOP
+    if 'priority' in values:
+        flags |= FLAG_PRIORITY
+    return flags
+
+
+def motor_opcode(command):
+    """Traduce un comando de texto de motores a (opcode, payload); None si no tiene equivalente"""
+    parts = command.split(',')
+    mode = parts[0]
+    try:
+        if command == "off,0":
+            return OP_MOTOR_OFF, b''
+        if mode == "synchronized" and len(parts) >= 3:
+            pairs = [(parts[1], parts[2])] * 4
+        elif mode == "differential" and len(parts) >= 5:
+            pairs = [(parts[1], parts[2])] * 2 + [(parts[3], parts[4])] * 2
+        elif mode == "independent" and len(parts) >= 9:
+            pairs = [(parts[i], parts[i + 1]) for i in range(1, 9, 2)]
+        else:
+            return None
+        speeds = bytes(max(0, min(255, int(speed))) for speed, _ in pairs)
+    except ValueError:
+        return None
+    directions = 0
+    for index, (_, direction) in enumerate(pairs):
+        if direction.startswith("reverse"):
+            directions |= 1 << index
+    return OP_MOTOR_DRIVE, speeds + bytes([directions])
+
+
+def servo_opcode(command):
+    """Traduce un comando de texto de servos a (opcode, payload); None si no tiene equivalente"""
+    parts = command.split(',')
+    if len(parts) < 3 or parts[0] != "servo" or parts[1] not in SERVO_IDS:
+        return None
+    servo_id = SERVO_IDS[parts[1]]
+    action = parts[2]
+    values = parts[3:]
+    try:
+        if action == "move" and len(values) >= 2:
+            angle = max(0, min(360, int(values[0])))
+            return OP_SERVO_MOVE, bytes([servo_id, angle >> 8, angle & 0xFF, int(values[1]), _flags(values[2:])])
+        if action == "stop":
+            return OP_SERVO_STOP, bytes([servo_id, _flags(values)])
+        if action == "speed" and values:
+            return OP_SERVO_SPEED, bytes([servo_id, int(values[0])])
+        if action == "reverse":
+            return OP_SERVO_REVERSE, bytes([servo_id])
+        if action == "limit" and values:
+            limit = max(0, min(360, int(values[0])))
+            return OP_SERVO_LIMIT, bytes([servo_id, limit >> 8, limit & 0xFF])
+    except ValueError:
+        return None
+    return None
+
+
+def parse_line(line):
+    """Convierte una línea recibida del Arduino en un evento tipado (tipo, datos)"""
+    if line.startswith("servo_angle"):
+        parts = line.split(',')
+        if len(parts) >= 3:
+            try:
+                return 'servo_angle', {'servo_type': parts[1], 'angle': int(parts[2])}
+            except ValueError:
+                logger.warning(f"Valor de ángulo no válido: {parts[2]}")
+                return 'message', {'line': line}
+    elif line.startswith("servo_stopped"):
+        parts = line.split(',')
+        if len(parts) >= 2:
+            return 'servo_stopped', {'servo_type': parts[1]}
+    elif line.startswith(ERROR_LINES):
+        return 'error', {'line': line}
+    return 'message', {'line': line}
+
+
+def motor_ack_matcher(command):
+    """Devuelve la función que reconoce la última línea de respuesta de Motores.ino a un comando"""
+    mode = command.split(',', 1)[0]
+    if command == "off,0":
+        prefix = "Motores apagados"
+    elif mode == "synchronized":
+        prefix = "Todos los motores a velocidad"
+    elif mode == "differential":
+        prefix = "M3 y M4 a velocidad"
+    elif mode == "independent":
+        prefix = "Motor 4 a velocidad"
+    else:
+        return None
+    return lambda line: line.startswith(prefix)
+
+
+def servo_ack_matcher(servo_type, action):
+    """Devuelve la función que reconoce la respuesta de Servomotores.ino a una acción"""
+    if action == "move":
+        prefixes = (f"Moviendo servo {servo_type}", f"Calibrando servo {servo_type}",
+                    "DS04 detenido en posición central (forzado)")
+    elif action == "stop":
+        prefixes = (f"servo_stopped,{servo_type}",)
+    elif action == "speed":
+        prefixes = (f"Velocidad del servo {servo_type}",)
+    elif action == "reverse":
+        prefixes = (f"Dirección del servo {servo_type}",)
+    elif action == "limit":
+        prefixes = (f"Límite de ángulo para {servo_type}",)
+    else:
+        return None
+    return lambda line: line.startswith(prefixes)
+
+
+class ArduinoLink:
+    """Puerto serie con un hilo lector que procesa cada línea en cuanto llega.
+
+    Los comandos devuelven un Future que se resuelve con (success, response)
+    cuando llega la respuesta correspondiente, o con (False, ...) al vencer el timeout.
+
+    Los comandos salientes pasan por una cola acotada y un hilo escritor que
+    mantiene un solo comando en vuelo. Un comando con clave `coalesce` reemplaza
+    al que aún no se envió con la misma clave, y los prioritarios se adelantan
+    a la cola descartando los pendientes de su misma clave.
+    """
+
+    def __init__(self, name, serial_port, on_event=None, on_disconnect=None, ack_timeout=2.0,
+                 max_queue=16, encoder=None):
+        self.name = name
+        self.serial = serial_port
+        self.on_event = on_event
+        self.on_disconnect = on_disconnect
+        self.ack_timeout = ack_timeout
+        self.active = False
+        self.reader_thread = None
+        self.writer_thread = None
+        self.pending = collections.deque()  # (matcher, future, enviado, límite)
+        self.lock = threading.Lock()
+        # Cola de salida: comandos aún no escritos en el puerto
+        self.max_queue = max_queue
+        self.queue = collections.deque()
+        self.queue_cond = threading.Condition()
+        self.in_flight = None
+        # Protocolo negociado: 'text' (CSV) o 'binary' (paquetes con CRC8)
+        self.protocol = 'text'
+        self.encoder = encoder  # motor_opcode / servo_opcode
+        self.seq = 0
+        # Velocidad negociada y latencia medida (ms) en cada velocidad probada
+        self.baudrate = BASE_BAUDRATE
+        self.baud_rtt_ms = {}
+        # Leer en un hilo nativo (tpool) si las lecturas bloquean el hub de eventlet
+        self.offload_reads = False
+        # Estadísticas
+        self.commands_sent = 0
+        self.acks = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.priority_sent = 0
+        self.max_queue_depth = 0
+        self.last_rtt_ms = None
+
+    def start(self):
+        self.active = True
+        # Timeout corto para que el lector revise periódicamente los comandos vencidos
+        self.serial.timeout = 0.1
+        self.reader_thread = threading.Thread(target=self._reader)
+        self.reader_thread.daemon = True
+        self.reader_thread.start()
+        self.writer_thread = threading.Thread(target=self._writer)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def close(self):
+        self.active = False
+        with self.queue_cond:
+            queued = list(self.queue)
+            self.queue.clear()
+            self.queue_cond.notify_all()
+        for entry in queued:
+            self._finish(entry['future'], False, "Conexión cerrada")
+        self._fail_pending("Conexión cerrada")
+        try:
+            if self.serial.is_open:
+                self.serial.close()
+        except Exception:
+            pass
+
+    def send(self, command, match=None, timeout=None, coalesce=None, priority=False):
+        """Encola un comando y devuelve un Future con la respuesta del Arduino"""
+        future = Future()
+        if not self.active:
+            future.set_result((False, "Puerto serie no disponible"))
+            return future
+        entry = {
+            'command': command,
+            'match': match,
+            'timeout': timeout if timeout is not None else self.ack_timeout,
+            'coalesce': coalesce,
+            'priority': priority,
+            'future': future
+        }
+        replaced = []
+        with self.queue_cond:
+            if coalesce is not None:
+                # Un comando nuevo deja obsoletos los no enviados con la misma clave,
+                # salvo los prioritarios, que nunca se reemplazan
+                for queued in list(self.queue):
+                    if queued['coalesce'] == coalesce and not queued['priority']:
+                        self.queue.remove(queued)
+                        replaced.append(queued)
+            if priority:
+                # Detrás de los prioritarios ya encolados, delante de todo lo demás
+                position = 0
+                while position < len(self.queue) and self.queue[position]['priority']:
+                    position += 1
+                self.queue.insert(position, entry)
+            else:
+                if len(self.queue) >= self.max_queue:
+                    # Cola llena: se descarta el comando normal más antiguo
+                    for queued in self.queue:
+                        if not queued['priority']:
+                            self.queue.remove(queued)
+                            self.dropped += 1
+                            self._finish(queued['future'], False, "Descartado: cola de comandos llena")
+                            break
+                self.queue.append(entry)
+            self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+            self.queue_cond.notify()
+        for queued in replaced:
+            self.coalesced += 1
+            self._finish(queued['future'], True, REPLACED_RESPONSE)
+        return future
+
+    def ping(self, count=3, timeout=0.5):
+        """Latencia media de ida y vuelta (ms) de "ping"/"pong"; None si no hay respuesta"""
+        samples = []
+        for _ in range(count):
+            start = time.monotonic()
+            success, _ = self.send("ping", match=lambda line: line == "pong", timeout=timeout).result()
+            if not success:
+                return None
+            samples.append((time.monotonic() - start) * 1000)
+        return sum(samples) / len(samples)
+
+    def negotiate_baudrate(self, rates):
+        """Prueba las velocidades de mayor a menor y conserva la más rápida que responde.
+
+        El Arduino confirma el cambio a la velocidad actual y pasa a la nueva; si no
+        recibe "ping" a tiempo vuelve solo a la velocidad base.
+        """
+        self.baud_rtt_ms = {}
+        base_rtt = self.ping()
+        if base_rtt is None:
+            logger.info(f"Arduino de {self.name}: firmware sin negociación de baudios, "
+                        f"se mantienen {BASE_BAUDRATE}")
+            return self.baudrate
+        self.baud_rtt_ms[BASE_BAUDRATE] = round(base_rtt, 2)
+
+        for rate in sorted(set(rates), reverse=True):
+            if rate <= BASE_BAUDRATE:
+                break
+            prefix = f"baud,{rate},"
+            success, response = self.send(f"baud,{rate}", match=lambda line: line.startswith(prefix),
+                                          timeout=0.5).result()
+            if not success or response != f"baud,{rate},ok":
+                self.baud_rtt_ms[rate] = None
+                continue
+            switched = time.monotonic()
+            self.serial.baudrate = rate
+            rtt = self.ping()
+            self.baud_rtt_ms[rate] = round(rtt, 2) if rtt is not None else None
+            if rtt is not None:
+                self.baudrate = rate
+                logger.info(f"Arduino de {self.name}: {rate} baudios (RTT {rtt:.1f} ms, "
+                            f"{base_rtt:.1f} ms a {BASE_BAUDRATE})")
+                return rate
+            # Volver a la velocidad base cuando el Arduino también lo haya hecho
+            self.serial.baudrate = BASE_BAUDRATE
+            remaining = BAUD_CONFIRM_TIMEOUT + 0.1 - (time.monotonic() - switched)
+            if remaining > 0:
+                time.sleep(remaining)
+            self.serial.reset_input_buffer()
+            logger.warning(f"Arduino de {self.name}: sin respuesta a {rate} baudios")
+        return self.baudrate
+
+    def negotiate_binary(self, timeout=0.5):
+        """Pide al firmware el protocolo binario; el firmware antiguo no lo reconoce
+        y el enlace sigue en texto"""
+        if self.encoder is None:
+            return False
+        self.protocol = 'text'
+        success, response = self.send("proto,bin", match=lambda line: line.startswith("proto,bin"),
+                                      timeout=timeout).result()
+        if success and response == "proto,bin,ok":
+            self.protocol = 'binary'
+            logger.info(f"Arduino de {self.name}: protocolo binario activado")
+            return True
+        logger.info(f"Arduino de {self.name}: firmware sin protocolo binario, se usa texto")
+        return False
+
+    def _writer(self):
+        """Hilo escritor: un comando en vuelo salvo los prioritarios, que se envían de inmediato"""
+        while self.active:
+            with self.queue_cond:
+                if not self.queue:
+                    self.queue_cond.wait(0.5)
+                    continue
+                entry = self.queue[0]
+                if not entry['priority'] and self.in_flight is not None and not self.in_flight.done():
+                    # Esperar la respuesta del comando anterior o la llegada de uno prioritario
+                    self.queue_cond.wait(0.05)
+                    continue
+                self.queue.popleft()
+            self._write(entry)
+
+    def _encode(self, entry):
+        """Bytes a escribir y reconocedor de la respuesta según el protocolo negociado"""
+        if self.protocol == 'binary':
+            packet = self.encoder(entry['command'])
+            if packet is not None:
+                self.seq = (self.seq + 1) & 0xFF
+                ack = f"ack,{self.seq}"
+                return encode_packet(packet[0], self.seq, packet[1]), lambda line: line == ack
+        # Texto, o comandos sin equivalente binario
+        return f"{entry['command']}\n".encode(), entry['match']
+
+    def _write(self, entry):
+        future = entry['future']
+        data, match = self._encode(entry)
+        now = time.monotonic()
+        with self.lock:
+            self.pending.append((match, future, now, now + entry['timeout']))
+        self.in_flight = future
+        future.add_done_callback(self._wake_writer)
+        try:
+            self.serial.write(data)
+            self.commands_sent += 1
+            if entry['priority']:
+                self.priority_sent += 1
+        except Exception as e:
+            self._handle_disconnect(e)
+
+    def _wake_writer(self, future):
+        with self.queue_cond:
+            self.queue_cond.notify()
+
+    def _finish(self, future, success, response):
+        if not future.done():
+            future.set_result((success, response))
+
+    def _reader(self):
+        """Hilo lector: ensambla líneas y las despacha como eventos"""
+        buffer = bytearray()
+        while self.active:
+            try:
+                size = self.serial.in_waiting or 1
+                data = tpool.execute(self.serial.read, size) if self.offload_reads else self.serial.read(size)
+            except Exception as e:
+                self._handle_disconnect(e)
+                return
+            if data:
+                buffer.extend(data)
+                while True:
+                    newline = buffer.find(b'\n')
+                    if newline == -1:
+                        break
+                    line = buffer[:newline].decode(errors='replace').strip()
+                    del buffer[:newline + 1]
+                    if line:
+                        self._dispatch(line)
+            self._expire()
+
+    def _dispatch(self, line):
+        kind, data = parse_line(line)
+        if kind != 'servo_angle':
+            self._resolve(kind, line)
+        if self.on_event:
+            try:
+                self.on_event(kind, data)
+            except Exception as e:
+                logger.error(f"Error al procesar evento de {self.name}: {e}")
+
+    def _resolve(self, kind, line):
+        """Resuelve el comando pendiente más antiguo al que corresponde la línea"""
+        with self.lock:
+            if kind == 'error':
+                entry = self.pending.popleft() if self.pending else None
+            else:
+                entry = None
+                for index, candidate in enumerate(self.pending):
+                    match = candidate[0]
+                    # Sin reconocedor, cualquier línea responde solo al comando más antiguo
+                    if (match is None and index == 0) or (match is not None and match(line)):
+                        entry = candidate
+                        break
+                if entry is not None:
+                    self.pending.remove(entry)
+        if entry is None:
+            return
+        _, future, sent, _ = entry
+        self.last_rtt_ms = (time.monotonic() - sent) * 1000
+        if future.done():
+            return
+        if kind == 'error':
+            self.errors += 1
+            future.set_result((False, line))
+        else:
+            self.acks += 1
+            future.set_result((True, line))
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            for entry in list(self.pending):
+                if entry[3] <= now:
+                    self.pending.remove(entry)
+                    expired.append(entry)
+        for _, future, _, _ in expired:
+            self.timeouts += 1
+            if not future.done():
+                future.set_result((False, f"Sin respuesta del Arduino de {self.name}"))
+
+    def _fail_pending(self, reason):
+        with self.lock:
+            entries = list(self.pending)
+            self.pending.clear()
+        for _, future, _, _ in entries:
+            if not future.done():
+                future.set_result((False, reason))
+
+    def _handle_disconnect(self, error):
+        if not self.active:
+            return
+        logger.error(f"Error en el puerto serie de {self.name}: {error}")
+        self.close()
+        if self.on_disconnect:
+            self.on_disconnect()
+
+    def stats(self):
+        return {
+            'protocol': self.protocol,
+            'baudrate': self.baudrate,
+            'baud_rtt_ms': self.baud_rtt_ms,
+            'queue_depth': len(self.queue),
+            'max_queue_depth': self.max_queue_depth,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'priority_sent': self.priority_sent,
+            'commands_sent': self.commands_sent,
+            'acks': self.acks,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'pending': len(self.pending),
+            'last_rtt_ms': round(self.last_rtt_ms, 1) if self.last_rtt_ms is not None else None
+        }
+
+
+# Descubrimiento de Arduinos
+# Los enlaces de /dev/serial/by-id incluyen el número de serie USB y no cambian al reconectar
+BY_ID_DIR = '/dev/serial/by-id'
+PORT_PATTERNS = ['/dev/ttyACM*', '/dev/ttyUSB*']
+ROLES = ('motores', 'servos')
+
+
+def classify_line(line):
+    """Rol del Arduino que envió la línea, o None si no lo identifica"""
+    if line.startswith("id,"):
+        role = line[3:]
+        return role if role in ROLES else None
+    if line.startswith("Sistema de control de motores") or "Motores apagados" in line:
+        return 'motores'
+    if line.startswith(("Sistema de control de servos", "servo_angle", "servo_stopped")):
+        return 'servos'
+    return None
+
+
+def candidate_ports():
+    """Puertos candidatos: primero los enlaces estables de by-id y luego los tty sin enlace"""
+    ports = []
+    seen = set()
+    for path in sorted(glob.glob(os.path.join(BY_ID_DIR, '*'))):
+        real = os.path.realpath(path)
+        if real not in seen:
+            seen.add(real)
+            ports.append(path)
+    for pattern in PORT_PATTERNS:
+        for path in sorted(glob.glob(pattern)):
+            if path not in seen:
+                seen.add(path)
+                ports.append(path)
+    return ports
+
+
+def open_serial_port(path):
+    """Abre un puerto a la velocidad base (el Arduino se reinicia al abrirlo)"""
+    import serial
+    return serial.Serial(path, BASE_BAUDRATE, timeout=0.1)
+
+
+def _read_role(port, timeout):
+    """Lee líneas hasta identificar el rol o agotar el tiempo"""
+    deadline = time.monotonic() + timeout
+    buffer = bytearray()
+    while time.monotonic() < deadline:
+        data = port.read(port.in_waiting or 1)
+        if not data:
+            continue
+        buffer.extend(data)
+        while b'\n' in buffer:
+            raw, _, rest = buffer.partition(b'\n')
+            buffer = bytearray(rest)
+            role = classify_line(raw.decode(errors='replace').strip())
+            if role:
+                return role
+    return None
+
+
+def identify_port(path, open_serial=open_serial_port, reset_timeout=2.5, reply_timeout=1.0):
+    """Abre un puerto e identifica el Arduino conectado.
+
+    Primero espera el mensaje de arranque que el sketch imprime tras el reinicio;
+    si no llega pregunta "id" y, para firmware antiguo, prueba los comandos de
+    la conexión original. Devuelve (rol, puerto abierto) o (None, None).
+    """
+    try:
+        port = open_serial(path)
+    except Exception as e:
+        logger.debug(f"No se pudo abrir {path}: {e}")
+        return None, None
+    try:
+        role = _read_role(port, reset_timeout)
+        for probe in ("id", "off,0", "servo,mg995,stop"):
+            if role:
+                break
+            port.write(f"{probe}\n".encode())
+            role = _read_role(port, reply_timeout)
+        if role:
+            port.reset_input_buffer()
+            return role, port
+        logger.debug(f"El dispositivo en {path} no respondió como Arduino del robot")
+    except Exception as e:
+        logger.debug(f"Error al identificar {path}: {e}")
+    try:
+        port.close()
+    except Exception:
+        pass
+    return None, None
+
+
+def _load_port_cache(cache_path):
+    if not cache_path:
+        return {}
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_port_cache(cache_path, cache):
+    if not cache_path:
+        return
+    try:
+        with open(cache_path, 'w') as f:
+            json.dump(cache, f, indent=2)
+    except OSError as e:
+        logger.warning(f"No se pudo guardar la caché de puertos: {e}")
+
+
+def _probe_all(paths, roles, open_serial):
+    """Identifica todos los puertos a la vez; devuelve [(ruta, rol, puerto)]
+
+    Vuelve en cuanto aparecen todos los roles pedidos; los puertos que se
+    identifiquen después se cierran en su propio hilo.
+    """
+    results = []
+    lock = threading.Lock()
+    done = threading.Event()
+    remaining = [len(paths)]
+
+    def probe(path):
+        role, port = identify_port(path, open_serial)
+        with lock:
+            remaining[0] -= 1
+            if port is not None and done.is_set():
+                port.close()
+            elif port is not None:
+                results.append((path, role, port))
+            if remaining[0] == 0 or set(roles) <= {r for _, r, _ in results}:
+                done.set()
+
+    if not paths:
+        return results
+    for path in paths:
+        thread = threading.Thread(target=probe, args=(path,))
+        thread.daemon = True
+        thread.start()
+    done.wait()
+    with lock:
+        return list(results)
+
+
+def discover_arduinos(roles=ROLES, exclude=(), cache_path=None, open_serial=open_serial_port):
+    """Localiza en una sola pasada los Arduinos de los roles pedidos.
+
+    Los puertos guardados en caché se abren directamente sin probar los demás;
+    solo si falta algún rol se prueban en paralelo todos los puertos candidatos.
+    Devuelve {rol: (ruta, puerto abierto)}.
+    """
+    excluded = {os.path.realpath(path) for path in exclude if path}
+    cache = _load_port_cache(cache_path)
+    found = {}
+
+    def usable(path):
+        real = os.path.realpath(path)
+        return real not in excluded and all(os.path.realpath(p) != real for p, _ in found.values())
+
+    # 1. Puertos conocidos: se acepta cualquier rol pedido que responda en ellos,
+    # aunque la caché lo tuviera en otro puerto (p. ej. cables intercambiados)
+    cached = {cache[role] for role in roles if cache.get(role) and os.path.exists(cache[role])}
+    identified = {}  # ruta -> rol que respondió
+    for path, role, port in _probe_all([path for path in cached if usable(path)], roles, open_serial):
+        identified[path] = role
+        if role in roles and role not in found:
+            found[role] = (path, port)
+            if cache.get(role) != path:
+                logger.info(f"Arduino de {role} identificado en {path}")
+        else:
+            port.close()
+
+    # Las entradas que ya no apuntan a su Arduino se olvidan
+    stale = [role for role in roles if cache.get(role) and identified.get(cache[role]) != role]
+    for role in stale:
+        logger.warning(f"{cache.pop(role)} ya no corresponde al Arduino de {role}")
+
+    # 2. Descubrimiento completo de los roles que faltan. Solo se descartan los
+    # puertos de la caché que ya respondieron; los que no, se vuelven a probar
+    missing = [role for role in roles if role not in found]
+    if missing:
+        tried = {os.path.realpath(path) for path in identified}
+        paths = [path for path in candidate_ports() if usable(path) and os.path.realpath(path) not in tried]
+        for path, role, port in _probe_all(paths, missing, open_serial):
+            if role in missing and role not in found:
+                found[role] = (path, port)
+                logger.info(f"Arduino de {role} identificado en {path}")
+            else:
+                port.close()
+
+    for role, (path, _) in found.items():
+        cache[role] = path
+    if found or stale:
+        _save_port_cache(cache_path, cache)
+    return found
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Benchmark del demultiplexor MJPEG frente al bucle original de _stream_video
+#
+# Uso:
+#   libcamera-vid -t 10000 --codec mjpeg --width 1920 --height 1080 -o captura.mjpeg
+#   python3 PI/benchmarks/bench_demuxer.py captura.mjpeg [otra.mjpeg ...]
+#
+# Sin argumentos genera una captura sintética con frames del tamaño indicado.
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mjpeg import MjpegDemuxer
+
+
+def legacy_split(data, chunk_size):
+    """Bucle original: busca desde 0 en cada chunk y copia el resto del buffer"""
+    frame_buffer = bytearray()
+    frames = 0
+    for offset in range(0, len(data), chunk_size):
+        frame_buffer.extend(data[offset:offset + chunk_size])
+        start_marker = frame_buffer.find(b'\xff\xd8')
+        end_marker = frame_buffer.find(b'\xff\xd9')
+        if start_marker != -1 and end_marker != -1 and end_marker > start_marker:
+            frame_data = frame_buffer[start_marker:end_marker + 2]
+            frame_buffer = frame_buffer[end_marker + 2:]
+            frames += 1
+    return frames
+
+
+def demuxer_split(data, chunk_size):
+    """Demultiplexor incremental leyendo del flujo directamente a su buffer"""
+    demuxer = MjpegDemuxer()
+    stream = io.BufferedReader(io.BytesIO(data))
+    frames = 0
+    while demuxer.read_from(stream, chunk_size):
+        for _ in demuxer.iter_frames():
+            frames += 1
+    return frames
+
+
+def synthetic_capture(frame_count, frame_size):
+    """Genera un flujo MJPEG falso sin marcadores dentro del cuerpo"""
+    frames = []
+    for _ in range(frame_count):
+        body = os.urandom(frame_size).replace(b'\xff', b'\x00')
+        frames.append(b'\xff\xd8' + body + b'\xff\xd9')
+    return b''.join(frames)
+
+
+def run(name, func, data, chunk_size, repeat):
+    best = None
+    frames = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frames = func(data, chunk_size)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    mb_s = len(data) / best / 1e6
+    print(f"  {name:<10} {frames:>6} frames  {best * 1000:9.1f} ms  {mb_s:8.1f} MB/s  {frames / best:9.0f} frames/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del demultiplexor MJPEG")
+    parser.add_argument('captures', nargs='*', help="Capturas MJPEG grabadas con libcamera-vid")
+    parser.add_argument('--chunk-size', type=int, default=4096)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--frames', type=int, default=300, help="Frames de la captura sintética")
+    parser.add_argument('--frame-size', type=int, default=200 * 1024, help="Bytes por frame sintético")
+    args = parser.parse_args()
+
+    sources = [(path, open(path, 'rb').read()) for path in args.captures]
+    if not sources:
+        sources = [("sintética", synthetic_capture(args.frames, args.frame_size))]
+
+    for name, data in sources:
+        print(f"{name}: {len(data) / 1e6:.1f} MB, chunk {args.chunk_size} bytes")
+        run("original", legacy_split, data, args.chunk_size, args.repeat)
+        run("demuxer", demuxer_split, data, args.chunk_size, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# Benchmark de extremo a extremo: servidor completo con Arduinos simulados y cámara sintética
+#
+# Uso:
+#   python3 PI/benchmarks/bench_end_to_end.py [--clients 4] [--seconds 20] [--protocol binary]
+#   python3 PI/benchmarks/bench_end_to_end.py --compare results/anterior.json
+#
+# Lanza `web.py --simulate` y lo conecta a N clientes Socket.IO concurrentes que
+# reciben video y envían comandos `synchronized_mode` y `control_servos`.
+# Mide la latencia comando -> respuesta (callback del evento), frames/s y
+# bytes/frame por cliente, y CPU y memoria (RSS) del proceso servidor. El
+# resultado se guarda en JSON en PI/benchmarks/results/ para comparar ejecuciones.
+#
+# Necesita el cliente de python-socketio: pip install "python-socketio[client]"
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+try:
+    import socketio
+except ImportError:
+    socketio = None
+
+PI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SERVER_URL = 'http://127.0.0.1:5001'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))], 2)
+
+
+def summary(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': round(max(values), 2) if values else None
+    }
+
+
+def server_info():
+    with urllib.request.urlopen(SERVER_URL + '/server_info', timeout=2) as response:
+        return json.load(response)
+
+
+def start_server(args, log):
+    command = [sys.executable, os.path.join(PI_DIR, 'web.py'), '--simulate',
+               '--sim-delay-ms', str(args.sim_delay_ms), '--sim-jitter-ms', str(args.sim_jitter_ms),
+               '--sim-fps', str(args.fps)]
+    server = subprocess.Popen(command, cwd=PI_DIR, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (código {server.returncode})")
+        try:
+            info = server_info()
+            if info.get('motors_connected') and info.get('servos_connected'):
+                return server
+        except OSError:
+            pass
+        time.sleep(0.5)
+    stop_server(server)
+    raise RuntimeError("El servidor no conectó con los Arduinos simulados a tiempo")
+
+
+def stop_server(server):
+    if server.poll() is None:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+class ProcessSampler:
+    """Muestrea CPU y RSS de un proceso leyendo /proc"""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _cpu_ticks(self):
+        with open(f'/proc/{self.pid}/stat') as f:
+            # El nombre del proceso puede tener espacios: partir tras el último ')'
+            fields = f.read().rsplit(')', 1)[1].split()
+        return int(fields[11]) + int(fields[12])  # utime + stime
+
+    def _rss_kb(self):
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+        return 0
+
+    def _run(self):
+        last_ticks, last_time = self._cpu_ticks(), time.monotonic()
+        while not self.stop_event.wait(self.interval):
+            try:
+                ticks, now = self._cpu_ticks(), time.monotonic()
+                self.cpu.append((ticks - last_ticks) / CLOCK_TICKS / (now - last_time) * 100)
+                self.rss.append(self._rss_kb() / 1024)
+                last_ticks, last_time = ticks, now
+            except OSError:
+                break
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        return {
+            'cpu_percent_mean': round(sum(self.cpu) / len(self.cpu), 1) if self.cpu else None,
+            'cpu_percent_max': round(max(self.cpu), 1) if self.cpu else None,
+            'rss_mb_mean': round(sum(self.rss) / len(self.rss), 1) if self.rss else None,
+            'rss_mb_max': round(max(self.rss), 1) if self.rss else None
+        }
+
+
+class BenchClient:
+    """Cliente Socket.IO que recibe video y envía comandos a intervalos fijos"""
+
+    def __init__(self, index, args):
+        self.index = index
+        self.args = args
+        self.random = random.Random(index)
+        self.sio = socketio.Client(reconnection=False)
+        self.frames = 0
+        self.frame_bytes = 0
+        self.first_frame = None
+        self.last_frame = None
+        self.latencies = {'synchronized_mode': [], 'control_servos': []}
+        self.failures = {'synchronized_mode': 0, 'control_servos': 0}
+        self.timeouts = 0
+        self.sio.on('video_frame', self._on_frame)
+
+    def _on_frame(self, data):
+        now = time.monotonic()
+        frame = data.get('frame') if isinstance(data, dict) else data
+        self.frames += 1
+        self.frame_bytes += len(frame) if frame is not None else 0
+        self.first_frame = self.first_frame or now
+        self.last_frame = now
+
+    def connect(self):
+        self.sio.connect(SERVER_URL, transports=['websocket'])
+        self.sio.call('video_protocol', {'protocol': self.args.protocol}, timeout=5)
+
+    def _command(self):
+        if self.random.random() < self.args.servo_ratio:
+            event = 'control_servos'
+            data = {'action': 'move', 'servo_type': self.random.choice(('mg995', 'ds04')),
+                    'angle': self.random.randint(0, 180), 'speed': 3}
+        else:
+            event = 'synchronized_mode'
+            data = {'speed': self.random.randint(0, 255), 'reverse': self.random.random() < 0.5}
+        return event, data
+
+    def run(self, until):
+        next_command = time.monotonic() + self.random.uniform(0, self.args.interval)
+        while time.monotonic() < until:
+            time.sleep(max(0, next_command - time.monotonic()))
+            next_command += self.args.interval
+            event, data = self._command()
+            start = time.perf_counter()
+            try:
+                response = self.sio.call(event, data, timeout=self.args.command_timeout)
+            except socketio.exceptions.TimeoutError:
+                self.timeouts += 1
+                continue
+            self.latencies[event].append((time.perf_counter() - start) * 1000)
+            if not (response or {}).get('success'):
+                self.failures[event] += 1
+
+    def result(self):
+        duration = (self.last_frame - self.first_frame) if self.frames > 1 else 0
+        return {
+            'frames': self.frames,
+            'fps': round((self.frames - 1) / duration, 2) if duration else 0,
+            'bytes_per_frame': round(self.frame_bytes / self.frames) if self.frames else 0,
+            'commands': {event: len(values) for event, values in self.latencies.items()},
+            'failures': self.failures,
+            'timeouts': self.timeouts
+        }
+
+
+def run_benchmark(args):
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    log = tempfile.NamedTemporaryFile(prefix=f'bench-e2e-{stamp}-', suffix='.log', delete=False)
+    print(f"Arrancando el servidor simulado (registro en {log.name})")
+    server = start_server(args, log)
+    sampler = ProcessSampler(server.pid)
+    clients = []
+    try:
+        for index in range(args.clients):
+            client = BenchClient(index, args)
+            client.connect()
+            clients.append(client)
+        # Dejar que el video arranque antes de medir
+        time.sleep(args.warmup)
+        sampler.start()
+        until = time.monotonic() + args.seconds
+        threads = [threading.Thread(target=client.run, args=(until,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        process = sampler.stop()
+        info = server_info()
+    finally:
+        for client in clients:
+            try:
+                client.sio.disconnect()
+            except Exception:
+                pass
+        stop_server(server)
+        log.close()
+
+    latencies = {event: summary([value for client in clients for value in client.latencies[event]])
+                 for event in ('synchronized_mode', 'control_servos')}
+    per_client = [client.result() for client in clients]
+    return {
+        'benchmark': 'end_to_end',
+        'timestamp': stamp,
+        'commit': git_commit(),
+        'host': {'machine': platform.machine(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'config': {key: value for key, value in vars(args).items() if key not in ('compare', 'output')},
+        'latency_ms': latencies,
+        'video': {
+            'fps_per_client': summary([client['fps'] for client in per_client]),
+            'bytes_per_frame': round(sum(c['bytes_per_frame'] for c in per_client) / len(per_client))
+            if per_client else 0,
+            'total_frames': sum(client['frames'] for client in per_client)
+        },
+        'server': process,
+        'clients': per_client,
+        'server_info': {key: info.get(key) for key in ('serial', 'video_clients', 'native_capture', 'simulators')}
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PI_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(result):
+    for event, stats in result['latency_ms'].items():
+        print(f"  {event:<18} {stats['count']:>6} cmds  p50 {stats['p50']} ms  p95 {stats['p95']} ms  "
+              f"p99 {stats['p99']} ms  max {stats['max']} ms")
+    video = result['video']
+    print(f"  video              p50 {video['fps_per_client']['p50']} fps/cliente  "
+          f"{video['bytes_per_frame']} bytes/frame")
+    server = result['server']
+    print(f"  servidor           CPU media {server['cpu_percent_mean']} %  RSS máx {server['rss_mb_max']} MB")
+
+
+def compare(result, path):
+    """Diferencias de las métricas principales frente a un resultado anterior"""
+    with open(path) as f:
+        previous = json.load(f)
+    print(f"Comparación con {os.path.basename(path)} ({previous.get('commit')}):")
+    rows = [(f"{event} p50 (ms)", ('latency_ms', event, 'p50')) for event in result['latency_ms']]
+    rows += [(f"{event} p95 (ms)", ('latency_ms', event, 'p95')) for event in result['latency_ms']]
+    rows += [("fps/cliente p50", ('video', 'fps_per_client', 'p50')),
+             ("bytes/frame", ('video', 'bytes_per_frame')),
+             ("CPU media (%)", ('server', 'cpu_percent_mean')),
+             ("RSS máx (MB)", ('server', 'rss_mb_max'))]
+    for label, keys in rows:
+        old, new = previous, result
+        for key in keys:
+            old = old.get(key) if isinstance(old, dict) else None
+            new = new.get(key) if isinstance(new, dict) else None
+        change = f"{(new - old) / old * 100:+.1f} %" if old and new is not None else "-"
+        print(f"  {label:<32} {old!s:>10} -> {new!s:>10}  {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo del servidor con hardware simulado")
+    parser.add_argument('--clients', type=int, default=4, help="Clientes Socket.IO concurrentes")
+    parser.add_argument('--seconds', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=3.0, help="Segundos de video antes de medir")
+    parser.add_argument('--interval', type=float, default=0.1, help="Segundos entre comandos de cada cliente")
+    parser.add_argument('--servo-ratio', type=float, default=0.3, help="Fracción de comandos que van a los servos")
+    parser.add_argument('--protocol', choices=('binary', 'base64'), default='binary')
+    parser.add_argument('--fps', type=int, default=30, help="FPS de la cámara sintética")
+    parser.add_argument('--sim-delay-ms', type=float, default=2.0)
+    parser.add_argument('--sim-jitter-ms', type=float, default=1.0)
+    parser.add_argument('--command-timeout', type=float, default=5.0)
+    parser.add_argument('--startup-timeout', type=float, default=30.0)
+    parser.add_argument('--output', help="Fichero JSON de resultados (por defecto en benchmarks/results/)")
+    parser.add_argument('--compare', metavar='JSON', help="Resultado anterior con el que comparar")
+    args = parser.parse_args()
+
+    if socketio is None:
+        sys.exit('Falta el cliente Socket.IO: pip install "python-socketio[client]"')
+
+    print(f"Benchmark de extremo a extremo: {args.clients} clientes, {args.seconds:.0f} s, "
+          f"un comando cada {args.interval * 1000:.0f} ms por cliente")
+    result = run_benchmark(args)
+    print_result(result)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"e2e-{result['timestamp']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Resultado guardado en {output}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == '__main__':
+    main()
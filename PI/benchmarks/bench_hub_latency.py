@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# Latencia de un "comando de motor" con el hub de eventlet bajo carga de video
+#
+# Uso:
+#   python3 PI/benchmarks/bench_hub_latency.py [--device 0] [--seconds 10]
+#
+# Compara tres escenarios:
+#   sin-video  solo el bucle de comandos
+#   verde      captura + cv2.imencode en un hilo verde (el camino OpenCV original)
+#   nativo     NativeCapture: captura + codificación en un hilo nativo
+# El comando se simula con un eco por un socketpair atendido por otro hilo verde,
+# de modo que su latencia mide lo que tarda el hub en atender E/S.
+# Sin --device se usa una cámara sintética que tarda lo mismo que una real en cap.read().
+import argparse
+import os
+import sys
+
+import eventlet
+eventlet.monkey_patch()
+
+import socket
+import threading
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from capture import NativeCapture
+from simulator import SyntheticCamera
+
+
+def green_video(device, stop, quality):
+    """Camino original: captura y codificación dentro de un hilo verde"""
+    cap = cv2.VideoCapture(device)
+    while not stop.is_set():
+        ret, frame = cap.read()
+        if ret:
+            cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        eventlet.sleep(0)
+    cap.release()
+
+
+def native_video(device, stop, quality):
+    """Captura en hilo nativo; el lado verde solo recoge los frames"""
+    capture = NativeCapture(device, 640, 480, 30, quality)
+    capture.start()
+    seq = 0
+    while not stop.is_set():
+        latest = capture.exchange.get(seq, timeout=0.5)
+        if latest is not None:
+            seq = latest[0]
+    capture.stop()
+
+
+def echo_server(sock):
+    while True:
+        data = sock.recv(64)
+        if not data:
+            break
+        sock.sendall(data)
+
+
+def measure(seconds, interval):
+    """Latencias (ms) de ida y vuelta de un comando cada `interval` segundos"""
+    client, server = socket.socketpair()
+    eventlet.spawn_n(echo_server, server)
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        client.sendall(b"off,0\n")
+        client.recv(64)
+        latencies.append((time.perf_counter() - start) * 1000)
+        eventlet.sleep(interval)
+    client.close()
+    return latencies
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run(name, video, device, seconds, interval, quality):
+    stop = threading.Event()
+    worker = eventlet.spawn(video, device, stop, quality) if video else None
+    eventlet.sleep(0.5)  # Dejar que la captura arranque
+    latencies = measure(seconds, interval)
+    stop.set()
+    if worker is not None:
+        worker.wait()
+    print(f"  {name:<10} {len(latencies):>5} cmds  p50 {percentile(latencies, 50):7.2f} ms  "
+          f"p95 {percentile(latencies, 95):7.2f} ms  p99 {percentile(latencies, 99):7.2f} ms  "
+          f"max {max(latencies):7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de comandos con video en el hub de eventlet")
+    parser.add_argument('--device', type=int, default=None, help="Cámara V4L2 real (por defecto sintética)")
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--interval', type=float, default=0.02, help="Segundos entre comandos")
+    parser.add_argument('--quality', type=int, default=80)
+    args = parser.parse_args()
+
+    device = args.device
+    if device is None:
+        cv2.VideoCapture = SyntheticCamera
+        device = 0
+
+    print(f"Latencia de comando ({args.seconds:.0f} s por escenario, un comando cada {args.interval * 1000:.0f} ms)")
+    run("sin-video", None, device, args.seconds, args.interval, args.quality)
+    run("verde", green_video, device, args.seconds, args.interval, args.quality)
+    run("nativo", native_video, device, args.seconds, args.interval, args.quality)
+
+
+if __name__ == '__main__':
+    main()
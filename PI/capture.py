@@ -0,0 +1,150 @@
+# Captura OpenCV en un hilo nativo del sistema operativo, fuera del hub de eventlet
+from eventlet import patcher, tpool
+
+import cv2
+
+# Primitivas originales: eventlet.monkey_patch() convierte las del módulo threading/time
+# en verdes, y un hilo nativo no puede bloquearse sobre ellas
+native_threading = patcher.original('threading')
+native_time = patcher.original('time')
+
+
+class FrameExchange:
+    """Ranura única entre el hilo de captura y el lado Socket.IO.
+
+    El productor sustituye la referencia al último frame (una asignación atómica,
+    sin bloqueo); la condición solo se usa para despertar al consumidor, que
+    espera en el pool de hilos nativos de eventlet para no bloquear el hub.
+    """
+
+    def __init__(self):
+        self._latest = (0, None)
+        self._condition = native_threading.Condition()
+        self.overwritten = 0
+
+    def put(self, item):
+        seq = self._latest[0] + 1
+        self._latest = (seq, item)
+        with self._condition:
+            self._condition.notify_all()
+        return seq
+
+    def _wait(self, last_seq, timeout):
+        with self._condition:
+            if self._latest[0] == last_seq:
+                self._condition.wait(timeout)
+        return self._latest
+
+    def get(self, last_seq, timeout=0.5):
+        """(seq, item) más reciente posterior a `last_seq`, o None si no llegó a tiempo"""
+        latest = self._latest
+        if latest[0] == last_seq:
+            latest = tpool.execute(self._wait, last_seq, timeout)
+            if latest[0] == last_seq:
+                return None
+        if latest[0] > last_seq + 1:
+            # El consumidor no llegó a ver los frames intermedios
+            self.overwritten += latest[0] - last_seq - 1
+        return latest
+
+
+class NativeCapture:
+    """cap.read() y cv2.imencode en un hilo nativo.
+
+    Los ajustes (resolución, FPS, calidad, si hay que codificar) se leen en
+    cada iteración de atributos simples; el hilo no usa logging ni otras
+    primitivas parcheadas por eventlet y deja los errores en `last_error`.
+    """
+
+    def __init__(self, device_id, width, height, fps, quality, opener=None):
+        self.device_id = device_id
+        self.opener = opener       # Sustituto de cv2.VideoCapture (p. ej. cámara simulada)
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.quality = quality
+        self.streaming = True      # False: solo mantener la cámara abierta (espera activa)
+        self.encode = True         # False: nadie recibe la rendition completa
+        self.exchange = FrameExchange()
+        self.running = False
+        self.opened = native_threading.Event()
+        self.thread = None
+        self.last_error = None
+        self.read_errors = 0
+        self.capture_ms = 0.0
+        self.encode_ms = 0.0
+
+    def start(self, timeout=5.0):
+        """Abre la cámara en el hilo nativo; devuelve False si no se pudo"""
+        self.running = True
+        self.thread = native_threading.Thread(target=self._run, name='captura-opencv')
+        self.thread.daemon = True
+        self.thread.start()
+        tpool.execute(self.opened.wait, timeout)
+        return self.last_error is None and self.opened.is_set()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            tpool.execute(self.thread.join, 2)
+
+    def _run(self):
+        cap = (self.opener or cv2.VideoCapture)(self.device_id)
+        try:
+            if not cap.isOpened():
+                self.last_error = f"No se pudo abrir la cámara {self.device_id}"
+                return
+            size = fps = None
+            self.opened.set()
+            while self.running:
+                if size != (self.width, self.height):
+                    size = (self.width, self.height)
+                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+                    fps = None  # Algunos drivers reajustan los FPS al cambiar el tamaño
+                if fps != self.fps:
+                    fps = self.fps
+                    cap.set(cv2.CAP_PROP_FPS, fps)
+                start = native_time.monotonic()
+                if not self.streaming:
+                    # En espera activa: mantener la cámara abierta sin decodificar
+                    cap.grab()
+                    native_time.sleep(max(0, 1.0 / self.fps - (native_time.monotonic() - start)))
+                    continue
+                ret, frame = cap.read()
+                if not ret:
+                    self.read_errors += 1
+                    native_time.sleep(0.1)
+                    continue
+                captured = native_time.time()
+                read_ms = native_time.monotonic() * 1000
+                if frame.shape[1] != size[0] or frame.shape[0] != size[1]:
+                    # La cámara no admite la resolución pedida: escalar aquí
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                self.capture_ms = round((native_time.monotonic() - start) * 1000, 1)
+                # Etapas del frame para las trazas de latencia (ms monotónicos)
+                stages = {'read': read_ms, 'extracted': native_time.monotonic() * 1000}
+                jpeg = None
+                if self.encode:
+                    encode_start = native_time.monotonic()
+                    # Se entrega el array de imencode: el anillo de frames lo copia una sola vez
+                    _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                    self.encode_ms = round((native_time.monotonic() - encode_start) * 1000, 1)
+                    stages['encoded'] = native_time.monotonic() * 1000
+                self.exchange.put((frame, jpeg, captured, stages))
+                # Control de velocidad para respetar los FPS solicitados
+                native_time.sleep(max(0, 1.0 / self.fps - (native_time.monotonic() - start)))
+        except Exception as e:
+            self.last_error = str(e)
+        finally:
+            self.opened.set()
+            cap.release()
+
+    def stats(self):
+        return {
+            'capture_ms': self.capture_ms,
+            'encode_ms': self.encode_ms,
+            'read_errors': self.read_errors,
+            'overwritten': self.exchange.overwritten,
+            'last_error': self.last_error
+        }
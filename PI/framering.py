@@ -0,0 +1,184 @@
+# Anillo de frames en memoria compartida: la captura escribe cada frame una vez y
+# los consumidores (Socket.IO, /stream.mjpg, grabador, análisis) lo leen sin copiarlo
+import logging
+import struct
+import time
+from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
+
+# Cabecera de cada ranura: secuencia, longitud, marca de tiempo, indicadores
+SLOT_HEADER = struct.Struct('<QIdI')
+# Cabecera del anillo: número de ranuras, tamaño de ranura, última secuencia escrita
+RING_HEADER = struct.Struct('<IIQ')
+
+FLAG_KEYFRAME = 1
+FLAG_H264 = 2
+
+
+class FrameView:
+    """Frame del anillo leído sin copia; `view` deja de ser válido si se sobrescribe la ranura"""
+
+    __slots__ = ('ring', 'seq', 'view', 'timestamp', 'flags')
+
+    def __init__(self, ring, seq, view, timestamp, flags):
+        self.ring = ring
+        self.seq = seq
+        self.view = view
+        self.timestamp = timestamp
+        self.flags = flags
+
+    @property
+    def keyframe(self):
+        return bool(self.flags & FLAG_KEYFRAME)
+
+    def valid(self):
+        """False si el escritor ya reutilizó la ranura (el contenido de `view` no es fiable)"""
+        return self.ring._slot_seq(self.seq) == self.seq
+
+    def tobytes(self):
+        """Copia del frame (p. ej. para enviarlo por Socket.IO); cuenta como copia"""
+        data = self.view.tobytes()
+        self.ring.copies += 1
+        self.ring.bytes_copied += len(data)
+        return data
+
+    def __len__(self):
+        return len(self.view)
+
+
+class FrameRing:
+    """Anillo de tamaño fijo de ranuras de frame en memoria compartida.
+
+    Cada ranura lleva su número de secuencia: el escritor lo pone a 0 mientras
+    copia y lo fija al terminar, de modo que un lector detecta si la ranura se
+    sobrescribió mientras la usaba. Otros procesos pueden abrir el anillo por
+    su nombre con `FrameRing.attach()`.
+    """
+
+    def __init__(self, slots=16, slot_size=1024 * 1024, name=None, create=True):
+        if create:
+            size = RING_HEADER.size + slots * (SLOT_HEADER.size + slot_size)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            RING_HEADER.pack_into(self.shm.buf, 0, slots, slot_size, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            slots, slot_size, _ = RING_HEADER.unpack_from(self.shm.buf, 0)
+        self.slots = slots
+        self.slot_size = slot_size
+        self.owner = create
+        self._stride = SLOT_HEADER.size + slot_size
+        # Estadísticas
+        self.writes = 0
+        self.bytes_written = 0
+        self.copies = 0           # Copias hechas por consumidores que necesitaban bytes
+        self.bytes_copied = 0
+        self.oversize = 0         # Frames que no cabían en una ranura
+        self.overwritten = 0      # Lecturas que llegaron tarde
+
+    @classmethod
+    def attach(cls, name):
+        """Abrir desde otro proceso un anillo ya creado"""
+        return cls(name=name, create=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def last_seq(self):
+        if self.shm.buf is None:
+            return 0  # Anillo ya cerrado
+        return RING_HEADER.unpack_from(self.shm.buf, 0)[2]
+
+    def _offset(self, seq):
+        return RING_HEADER.size + (seq % self.slots) * self._stride
+
+    def _slot_seq(self, seq):
+        if self.shm.buf is None:
+            return 0
+        return struct.unpack_from('<Q', self.shm.buf, self._offset(seq))[0]
+
+    def write(self, data, timestamp=None, flags=0):
+        """Copiar un frame (cualquier objeto con protocolo buffer) a la siguiente ranura.
+
+        Devuelve la secuencia asignada, o None si el frame no cabe.
+        """
+        if self.shm.buf is None:
+            # Anillo cerrado durante el apagado: el bucle de captura aún puede entregar un frame
+            return None
+        data = memoryview(data).cast('B')
+        size = data.nbytes
+        if size > self.slot_size:
+            self.oversize += 1
+            return None
+        seq = self.last_seq + 1
+        offset = self._offset(seq)
+        buf = self.shm.buf
+        # Marcar la ranura como en escritura antes de tocar los datos
+        SLOT_HEADER.pack_into(buf, offset, 0, 0, 0.0, 0)
+        start = offset + SLOT_HEADER.size
+        buf[start:start + size] = data
+        SLOT_HEADER.pack_into(buf, offset, seq, size, timestamp if timestamp is not None else time.time(), flags)
+        RING_HEADER.pack_into(buf, 0, self.slots, self.slot_size, seq)
+        self.writes += 1
+        self.bytes_written += size
+        return seq
+
+    def get(self, seq):
+        """FrameView de la secuencia indicada, o None si ya se sobrescribió"""
+        if self.shm.buf is None:
+            return None
+        offset = self._offset(seq)
+        slot_seq, size, timestamp, flags = SLOT_HEADER.unpack_from(self.shm.buf, offset)
+        if slot_seq != seq:
+            self.overwritten += 1
+            return None
+        start = offset + SLOT_HEADER.size
+        return FrameView(self, seq, self.shm.buf[start:start + size], timestamp, flags)
+
+    def latest(self):
+        """Último frame escrito, o None si el anillo está vacío"""
+        seq = self.last_seq
+        return self.get(seq) if seq else None
+
+    def read_since(self, seq):
+        """Frames posteriores a `seq` que siguen en el anillo, del más antiguo al más reciente"""
+        last = self.last_seq
+        first = max(seq + 1, last - self.slots + 1, 1)
+        if seq and first > seq + 1:
+            self.overwritten += first - seq - 1
+        frames = []
+        for current in range(first, last + 1):
+            frame = self.get(current)
+            if frame is not None:
+                frames.append(frame)
+        return frames
+
+    def close(self):
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+        try:
+            self.shm.close()
+        except BufferError as e:
+            # Algún consumidor conserva todavía una vista; se libera al recogerla
+            logger.debug(f"No se pudo cerrar el anillo de frames: {e}")
+
+    def stats(self):
+        """Uso de memoria y contadores de copias para /server_info"""
+        return {
+            'name': self.name,
+            'slots': self.slots,
+            'slot_size': self.slot_size,
+            'memory_bytes': self.shm.size,
+            'last_seq': self.last_seq,
+            'writes': self.writes,
+            'bytes_written': self.bytes_written,
+            'consumer_copies': self.copies,
+            'consumer_bytes_copied': self.bytes_copied,
+            'oversize': self.oversize,
+            'overwritten_reads': self.overwritten
+        }
@@ -0,0 +1,123 @@
+# Separador incremental de flujos H.264 Annex-B (libcamera-vid --codec h264 --inline)
+import logging
+
+logger = logging.getLogger(__name__)
+
+START_CODE = b'\x00\x00\x01'
+
+# Tipos de unidad NAL relevantes
+NAL_SLICE = 1
+NAL_IDR = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+# NAL que solo pueden aparecer al comienzo de una unidad de acceso
+AU_PREFIX_TYPES = (NAL_SEI, NAL_SPS, NAL_PPS, NAL_AUD)
+
+
+class AnnexBSplitter:
+    """Agrupa las NAL de un flujo Annex-B en unidades de acceso (un frame cada una).
+
+    Una unidad de acceso se entrega cuando empieza la siguiente, es decir, con
+    un frame de retraso. Cada unidad conserva sus códigos de inicio, que es el
+    formato que acepta VideoDecoder de WebCodecs sin descripción avcC.
+    """
+
+    def __init__(self, max_access_unit=4 * 1024 * 1024):
+        self.max_access_unit = max_access_unit
+        self._buffer = bytearray()
+        self._scan = 0          # Posición desde la que buscar el siguiente código de inicio
+        self._au_start = -1     # Inicio de la unidad de acceso en curso (-1 si no hay)
+        self._au_has_slice = False
+        self._au_key = False
+        self.codec = None       # Cadena RFC 6381 (avc1.PPCCLL) obtenida del SPS
+        # Estadísticas
+        self.access_units = 0
+        self.keyframes = 0
+        self.bytes_in = 0
+        self.discarded_bytes = 0
+
+    def reset(self):
+        """Descarta los datos pendientes (p. ej. al reiniciar la cámara)"""
+        self._buffer.clear()
+        self._scan = 0
+        self._au_start = -1
+        self._au_has_slice = self._au_key = False
+
+    def feed(self, data):
+        """Añade bytes al buffer interno"""
+        self._buffer.extend(data)
+        self.bytes_in += len(data)
+
+    def read_from(self, stream, size=65536):
+        """Lee del flujo lo disponible; devuelve los bytes leídos (0 = EOF)"""
+        read = getattr(stream, 'read1', None) or stream.read
+        data = read(size)
+        if not data:
+            return 0
+        self.feed(data)
+        return len(data)
+
+    def iter_access_units(self):
+        """Generador de (unidad de acceso en bytes, es_keyframe)"""
+        buffer = self._buffer
+        while True:
+            pos = buffer.find(START_CODE, self._scan)
+            if pos == -1:
+                break
+            # Un código de inicio de 4 bytes pertenece a la NAL siguiente
+            nal_start = pos - 1 if pos > 0 and buffer[pos - 1] == 0 else pos
+            if self._au_start == -1:
+                self.discarded_bytes += nal_start
+                self._au_start = nal_start
+            # La cabecera NAL y el primer byte del slice deben estar ya en el buffer
+            if pos + 5 > len(buffer):
+                break
+            nal_type = buffer[pos + 3] & 0x1F
+            if nal_type == NAL_SPS and pos + 7 > len(buffer):
+                break
+
+            if self._au_has_slice and (nal_type in AU_PREFIX_TYPES or
+                                       (nal_type in (NAL_SLICE, NAL_IDR) and buffer[pos + 4] & 0x80)):
+                # first_mb_in_slice == 0 (ue(v) codificado como un único bit 1): frame nuevo
+                access_unit = bytes(buffer[self._au_start:nal_start])
+                keyframe = self._au_key
+                self.access_units += 1
+                self.keyframes += keyframe
+                self._au_start = nal_start
+                self._au_has_slice = self._au_key = False
+                yield access_unit, keyframe
+
+            if nal_type in (NAL_SLICE, NAL_IDR):
+                self._au_has_slice = True
+                self._au_key = self._au_key or nal_type == NAL_IDR
+            elif nal_type == NAL_SPS:
+                self.codec = 'avc1.%02x%02x%02x' % (buffer[pos + 4], buffer[pos + 5], buffer[pos + 6])
+            self._scan = pos + 3
+
+        # Compactar: conservar solo la unidad de acceso en curso
+        if self._au_start > 0:
+            del buffer[:self._au_start]
+            self._scan = max(0, self._scan - self._au_start)
+            self._au_start = 0
+        elif self._au_start == -1 and len(buffer) > 3:
+            # Sin código de inicio todavía: conservar solo lo que podría ser uno partido
+            self.discarded_bytes += len(buffer) - 3
+            del buffer[:-3]
+            self._scan = 0
+        if len(buffer) > self.max_access_unit:
+            logger.warning("Unidad de acceso H.264 demasiado grande, descartando datos")
+            self.discarded_bytes += len(buffer)
+            self.reset()
+
+    def stats(self):
+        """Estadísticas del separador"""
+        return {
+            'access_units': self.access_units,
+            'keyframes': self.keyframes,
+            'bytes_in': self.bytes_in,
+            'discarded_bytes': self.discarded_bytes,
+            'pending': len(self._buffer),
+            'codec': self.codec
+        }
@@ -0,0 +1,149 @@
+# Detección de conexión/desconexión de dispositivos serie USB por eventos del sistema
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Nodos de dispositivo que pueden ser un Arduino
+DEVICE_PATTERNS = ('ttyACM*', 'ttyUSB*')
+
+# Constantes de inotify (linux/inotify.h)
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class DeviceWatcher:
+    """Avisa cuando aparece o desaparece un puerto serie.
+
+    Usa pyudev si está instalado y, si no, inotify sobre /dev. Solo en sistemas
+    sin ninguno de los dos recurre a comparar la lista de /dev periódicamente,
+    lo que tampoco abre ningún puerto. `on_event(acción, ruta)` recibe
+    'add' o 'remove' y la ruta del nodo (/dev/ttyACM0).
+    """
+
+    def __init__(self, on_event, patterns=DEVICE_PATTERNS, dev_dir='/dev', poll_interval=2.0):
+        self.on_event = on_event
+        self.patterns = patterns
+        self.dev_dir = dev_dir
+        self.poll_interval = poll_interval
+        self.backend = None
+        self.running = False
+        self.thread = None
+        self.events = 0
+
+    def start(self):
+        """Elige el backend disponible e inicia el hilo de vigilancia"""
+        for backend, target in (('udev', self._watch_udev), ('inotify', self._watch_inotify)):
+            try:
+                source = getattr(self, f'_open_{backend}')()
+            except Exception as e:
+                logger.debug(f"Backend {backend} no disponible: {e}")
+                continue
+            self.backend = backend
+            break
+        else:
+            self.backend, target, source = 'poll', self._watch_poll, None
+        logger.info(f"Detección de dispositivos USB mediante {self.backend}")
+        self.running = True
+        self.thread = threading.Thread(target=target, args=(source,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=2)
+
+    def _matches(self, path):
+        name = os.path.basename(path or '')
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+    def _notify(self, action, path):
+        if not self._matches(path):
+            return
+        self.events += 1
+        logger.info(f"Dispositivo serie {'conectado' if action == 'add' else 'desconectado'}: {path}")
+        try:
+            self.on_event(action, path)
+        except Exception as e:
+            logger.error(f"Error al procesar evento de {path}: {e}")
+
+    # Backend pyudev
+    def _open_udev(self):
+        import pyudev
+        monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        monitor.filter_by(subsystem='tty')
+        monitor.start()
+        return monitor
+
+    def _watch_udev(self, monitor):
+        while self.running:
+            readable, _, _ = select.select([monitor], [], [], 1.0)
+            if not readable:
+                continue
+            device = monitor.poll(timeout=0)
+            if device is not None and device.action in ('add', 'remove'):
+                self._notify(device.action, device.device_node)
+
+    # Backend inotify (sin dependencias, vía libc)
+    def _open_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        # IN_ATTRIB: udev cambia los permisos del nodo cuando ya se puede abrir
+        if libc.inotify_add_watch(fd, self.dev_dir.encode(), IN_CREATE | IN_DELETE | IN_ATTRIB) < 0:
+            error = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(error, f"inotify_add_watch {self.dev_dir}")
+        return fd
+
+    def _watch_inotify(self, fd):
+        try:
+            while self.running:
+                readable, _, _ = select.select([fd], [], [], 1.0)
+                if not readable:
+                    continue
+                data = os.read(fd, 4096)
+                offset = 0
+                while offset + INOTIFY_EVENT.size <= len(data):
+                    _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                    offset += INOTIFY_EVENT.size
+                    name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+                    offset += length
+                    path = os.path.join(self.dev_dir, name)
+                    if mask & IN_DELETE:
+                        self._notify('remove', path)
+                    elif mask & (IN_CREATE | IN_ATTRIB):
+                        self._notify('add', path)
+        finally:
+            os.close(fd)
+
+    # Último recurso: comparar la lista de nodos sin abrir ningún puerto
+    def _list_devices(self):
+        try:
+            names = os.listdir(self.dev_dir)
+        except OSError:
+            return set()
+        return {os.path.join(self.dev_dir, name) for name in names if self._matches(name)}
+
+    def _watch_poll(self, _):
+        known = self._list_devices()
+        while self.running:
+            time.sleep(self.poll_interval)
+            current = self._list_devices()
+            for path in sorted(current - known):
+                self._notify('add', path)
+            for path in sorted(known - current):
+                self._notify('remove', path)
+            known = current
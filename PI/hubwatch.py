@@ -0,0 +1,163 @@
+# Vigilancia del hub de eventlet: retraso del bucle y bloqueos atribuidos al código que los causa
+import collections
+import logging
+import os
+import sys
+import time
+import traceback
+
+import eventlet
+from eventlet import patcher
+
+# El monitor es un hilo nativo: detecta el bloqueo mientras ocurre, aunque el hub no avance
+native_threading = patcher.original('threading')
+native_time = patcher.original('time')
+
+logger = logging.getLogger(__name__)
+
+MAIN_THREAD = native_threading.main_thread().ident
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class HubWatchdog:
+    """Mide continuamente cuánto tarda el hub en atender un latido periódico.
+
+    Un hilo verde late cada `interval` segundos y anota el retraso respecto a
+    lo previsto. Un hilo nativo comprueba el último latido: si el hub lleva más
+    de `stall_ms` sin latir, muestrea la pila del hilo principal para saber qué
+    código lo retiene. Al terminar el bloqueo se atribuye a un sitio registrado
+    (p. ej. la lectura serie o la de libcamera-vid) o a la función del proyecto
+    más interna de la pila. Con `auto_offload`, un sitio que bloquea
+    `offload_after` veces llama a su función de descarga (mover esa E/S a tpool).
+
+    El hilo nativo no usa logging: deja los bloqueos en una cola que el hilo
+    verde registra y notifica.
+    """
+
+    def __init__(self, interval=0.02, stall_ms=50.0, auto_offload=False, offload_after=3, window=500,
+                 on_lag=None, on_stall=None):
+        self.interval = interval
+        self.stall_ms = stall_ms
+        self.auto_offload = auto_offload
+        self.offload_after = offload_after
+        self.on_lag = on_lag        # on_lag(segundos) en cada latido
+        self.on_stall = on_stall    # on_stall(bloqueo) al terminar cada bloqueo
+        self.sites = {}             # nombre -> {'match': (fichero, función), 'offload', 'stalls', 'offloaded'}
+        self.lags = collections.deque(maxlen=window)
+        self.stalls = collections.deque(maxlen=50)
+        self.finished = collections.deque()  # Bloqueos pendientes de notificar desde el hilo verde
+        self.last_beat = time.monotonic()
+        self.running = False
+        self.max_lag_ms = 0.0
+        self.total_stalls = 0
+        self._current = None        # Bloqueo en curso (solo lo toca el hilo nativo)
+
+    def register_site(self, name, filename, function, offload=None):
+        """Sitio al que atribuir los bloqueos cuya pila pasa por `filename:function`"""
+        self.sites[name] = {'match': (filename, function), 'offload': offload, 'stalls': 0, 'offloaded': False}
+
+    def start(self):
+        self.running = True
+        self.last_beat = time.monotonic()
+        eventlet.spawn(self._heartbeat)
+        monitor = native_threading.Thread(target=self._monitor, name='vigilancia-hub')
+        monitor.daemon = True
+        monitor.start()
+
+    def stop(self):
+        self.running = False
+
+    def _heartbeat(self):
+        while self.running:
+            before = time.monotonic()
+            eventlet.sleep(self.interval)
+            now = time.monotonic()
+            self.last_beat = now
+            lag = max(0.0, now - before - self.interval)
+            self.lags.append(lag * 1000)
+            self.max_lag_ms = max(self.max_lag_ms, lag * 1000)
+            if self.on_lag is not None:
+                self.on_lag(lag)
+            while self.finished:
+                self._report(self.finished.popleft())
+
+    def _monitor(self):
+        while self.running:
+            native_time.sleep(self.interval / 2)
+            beat = self.last_beat
+            silent = time.monotonic() - beat - self.interval
+            current = self._current
+            if current is not None and beat != current['beat']:
+                # El hub volvió a latir: el bloqueo terminó
+                current['duration_ms'] = round((beat - current['beat'] - self.interval) * 1000, 1)
+                self.finished.append(current)
+                self._current = None
+            elif silent * 1000 > self.stall_ms:
+                frames = self._sample()
+                if current is None:
+                    self._current = current = {'beat': beat, 'time': time.time(), 'samples': collections.Counter(),
+                                               'stack': None}
+                if frames:
+                    current['samples'][self._attribute(frames)] += 1
+                    if current['stack'] is None:
+                        current['stack'] = ''.join(traceback.format_list(
+                            [(path, line, function, None) for path, line, function in reversed(frames)]))
+
+    def _sample(self):
+        """Marcos del hilo principal, del más interno al más externo: [(fichero, línea, función)]"""
+        frame = sys._current_frames().get(MAIN_THREAD)
+        frames = []
+        while frame is not None:
+            frames.append((frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name))
+            frame = frame.f_back
+        return frames
+
+    def _attribute(self, frames):
+        """Sitio registrado por el que pasa la pila o, si no, la función del proyecto más interna"""
+        for path, _, function in frames:
+            for name, site in self.sites.items():
+                if (os.path.basename(path), function) == site['match']:
+                    return name
+        for path, line, function in frames:
+            if os.path.dirname(os.path.abspath(path)) == PROJECT_DIR and not path.endswith('hubwatch.py'):
+                return f"{os.path.basename(path)}:{function}"
+        path, line, function = frames[0]
+        return f"{os.path.basename(path)}:{function}"
+
+    def _report(self, stall):
+        samples = stall.pop('samples')
+        stall['site'] = samples.most_common(1)[0][0] if samples else 'desconocido'
+        del stall['beat']
+        self.total_stalls += 1
+        self.stalls.append(stall)
+        logger.warning(f"Hub de eventlet bloqueado {stall['duration_ms']:.0f} ms en {stall['site']}"
+                       + (f"\n{stall['stack']}" if stall['stack'] else ""))
+        if self.on_stall is not None:
+            self.on_stall(stall)
+        site = self.sites.get(stall['site'])
+        if site is None:
+            return
+        site['stalls'] += 1
+        if (self.auto_offload and not site['offloaded'] and site['offload'] is not None
+                and site['stalls'] >= self.offload_after):
+            site['offloaded'] = True
+            logger.warning(f"{stall['site']} bloqueó el hub {site['stalls']} veces: se pasa a tpool")
+            site['offload']()
+
+    def stats(self):
+        """Retraso del hub (p50, p99 y máximo en ms) y últimos bloqueos para /server_info"""
+        lags = sorted(self.lags)
+        return {
+            'interval_ms': self.interval * 1000,
+            'stall_ms': self.stall_ms,
+            'lag_ms': {
+                'p50': round(lags[len(lags) // 2], 2),
+                'p99': round(lags[min(len(lags) - 1, int(len(lags) * 0.99))], 2),
+                'max': round(self.max_lag_ms, 2)
+            } if lags else None,
+            'stalls': self.total_stalls,
+            'auto_offload': self.auto_offload,
+            'sites': {name: {'stalls': site['stalls'], 'offloaded': site['offloaded']}
+                      for name, site in self.sites.items()},
+            'recent_stalls': list(self.stalls)
+        }
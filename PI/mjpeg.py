@@ -0,0 +1,134 @@
+# Demultiplexor incremental de flujos MJPEG (libcamera-vid --codec mjpeg)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marcadores JPEG de inicio (SOI) y fin (EOI) de imagen
+SOI = b'\xff\xd8'
+EOI = b'\xff\xd9'
+
+
+class MjpegDemuxer:
+    """Separa frames JPEG completos de un flujo de bytes sin volver a escanear datos ya vistos"""
+
+    def __init__(self, capacity=256 * 1024, max_frame_size=8 * 1024 * 1024):
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._head = 0          # Inicio de los datos pendientes
+        self._tail = 0          # Fin de los datos válidos
+        self._scan = 0          # Posición desde la que continuar la búsqueda
+        self._frame_start = -1  # Posición del SOI del frame en curso (-1 si no hay)
+        # Estadísticas
+        self.frame_count = 0
+        self.bytes_in = 0
+        self.discarded_bytes = 0
+
+    @property
+    def pending(self):
+        """Bytes recibidos que todavía no forman parte de un frame entregado"""
+        return self._tail - self._head
+
+    def reset(self):
+        """Descarta los datos pendientes (p. ej. al reiniciar la cámara)"""
+        self._head = self._tail = self._scan = 0
+        self._frame_start = -1
+
+    def _reserve(self, size):
+        """Garantiza espacio libre para `size` bytes al final del buffer"""
+        if self._tail + size <= len(self._buffer):
+            return
+        pending = self._tail - self._head
+        if pending + size > len(self._buffer):
+            # Crecer duplicando la capacidad; el memoryview debe liberarse antes
+            capacity = len(self._buffer)
+            while pending + size > capacity:
+                capacity *= 2
+            new_buffer = bytearray(capacity)
+            new_buffer[:pending] = self._view[self._head:self._tail]
+            self._view.release()
+            self._buffer = new_buffer
+            self._view = memoryview(self._buffer)
+        elif pending:
+            # Compactar: mover solo el frame parcial al inicio del buffer
+            self._view[:pending] = self._view[self._head:self._tail]
+        offset = self._head
+        self._head = 0
+        self._tail = pending
+        self._scan -= offset
+        if self._frame_start != -1:
+            self._frame_start -= offset
+
+    def feed(self, data):
+        """Añade bytes al buffer interno"""
+        size = len(data)
+        self._reserve(size)
+        self._view[self._tail:self._tail + size] = data
+        self._tail += size
+        self.bytes_in += size
+
+    def read_from(self, stream, size=65536):
+        """Lee directamente del flujo al buffer interno; devuelve los bytes leídos (0 = EOF)"""
+        self._reserve(size)
+        target = self._view[self._tail:self._tail + size]
+        # readinto1 devuelve lo disponible sin esperar a llenar el bloque completo
+        readinto = getattr(stream, 'readinto1', None) or getattr(stream, 'readinto', None)
+        if readinto is not None:
+            count = readinto(target) or 0
+        else:
+            chunk = stream.read(size)
+            count = len(chunk) if chunk else 0
+            target[:count] = chunk or b''
+        target.release()
+        self._tail += count
+        self.bytes_in += count
+        return count
+
+    def iter_frames(self, copy=True):
+        """Generador de frames JPEG completos disponibles en el buffer.
+
+        Con copy=False entrega memoryviews del buffer interno, válidos solo hasta
+        la siguiente llamada a feed() o read_from().
+        """
+        while True:
+            if self._frame_start == -1:
+                start = self._buffer.find(SOI, self._scan, self._tail)
+                if start == -1:
+                    # Conservar el último byte por si el marcador quedó partido entre lecturas
+                    keep = max(self._head, self._tail - 1)
+                    self.discarded_bytes += keep - self._head
+                    self._head = self._scan = keep
+                    return
+                self.discarded_bytes += start - self._head
+                self._head = start
+                self._frame_start = start
+                self._scan = start + 2
+
+            end = self._buffer.find(EOI, self._scan, self._tail)
+            if end == -1:
+                self._scan = max(self._frame_start + 2, self._tail - 1)
+                if self._tail - self._frame_start > self.max_frame_size:
+                    logger.warning("Frame MJPEG demasiado grande, descartando datos")
+                    self.discarded_bytes += self._tail - self._frame_start
+                    self._head = self._scan = self._tail
+                    self._frame_start = -1
+                return
+
+            end += 2
+            frame = self._view[self._frame_start:end]
+            if copy:
+                frame = bytes(frame)
+            self._head = self._scan = end
+            self._frame_start = -1
+            self.frame_count += 1
+            yield frame
+
+    def stats(self):
+        """Estadísticas del demultiplexor"""
+        return {
+            'frames': self.frame_count,
+            'bytes_in': self.bytes_in,
+            'discarded_bytes': self.discarded_bytes,
+            'buffer_capacity': len(self._buffer),
+            'pending': self.pending
+        }
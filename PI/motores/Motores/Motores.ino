@@ -6,19 +6,64 @@ AF_DCMotor motor2(2); // Motor 2 en el canal 2
 AF_DCMotor motor3(3); // Motor 3 en el canal 3
 AF_DCMotor motor4(4); // Motor 4 en el canal 4
 
+// Protocolo binario opcional: [SYNC][OPCODE][SEQ][P0..P4][CRC8]
+// El CRC8 (polinomio 0x07) cubre OPCODE..P4. Se activa con el comando de texto "proto,bin"
+const uint8_t PACKET_SYNC = 0xA5;
+const uint8_t PACKET_SIZE = 9;
+const uint8_t OP_MOTOR_OFF = 0x01;   // Apagar motores
+const uint8_t OP_MOTOR_DRIVE = 0x02; // P0..P3 velocidades, P4 máscara de reversa (bit i = motor i+1)
+bool modoBinario = false;
+
+// Negociación de velocidad: se arranca siempre a BAUD_BASE y el PI pide "baud,<velocidad>".
+// Si tras el cambio no llega "ping" en BAUD_CONFIRM_TIMEOUT ms se vuelve a BAUD_BASE
+const long BAUD_BASE = 9600;
+const long BAUD_RATES[] = {115200, 57600, 9600};
+const unsigned long BAUD_CONFIRM_TIMEOUT = 1000;
+bool baudPendiente = false;
+unsigned long baudCambio = 0;
+
 void setup() {
-  Serial.begin(9600);
+  Serial.begin(BAUD_BASE);
   Serial.println("Sistema de control de motores inicializado");
 }
 
 void loop() {
+  comprobarBaudios();
+
   // Procesar comandos seriales
   if (Serial.available() > 0) {
+    // En modo binario, el byte de sincronización inicia un paquete de tamaño fijo
+    if (modoBinario && Serial.peek() == PACKET_SYNC) {
+      procesarPaqueteBinario();
+      return;
+    }
+
     String command = Serial.readStringUntil('\n');
     command.trim(); // Eliminar espacios en blanco
 
+    // Negociación de protocolo
+    if (command == "proto,bin") {
+      modoBinario = true;
+      Serial.println("proto,bin,ok");
+    }
+    else if (command == "proto,text") {
+      modoBinario = false;
+      Serial.println("proto,text,ok");
+    }
+    // Negociación de velocidad
+    else if (command.startsWith("baud,")) {
+      cambiarBaudios(command.substring(5).toInt());
+    }
+    else if (command == "ping") {
+      baudPendiente = false;
+      Serial.println("pong");
+    }
+    // Identificación para el descubrimiento de puertos
+    else if (command == "id") {
+      Serial.println("id,motores");
+    }
     // Comando para apagar motores
-    if (command == "off,0") {
+    else if (command == "off,0") {
       apagarMotores();
       Serial.println("Motores apagados.");
     } 
@@ -29,6 +74,79 @@ void loop() {
   }
 }
 
+// Cambiar la velocidad del puerto serie si está admitida; responde a la velocidad actual
+void cambiarBaudios(long velocidad) {
+  bool admitida = false;
+  for (unsigned int i = 0; i < sizeof(BAUD_RATES) / sizeof(BAUD_RATES[0]); i++) {
+    if (BAUD_RATES[i] == velocidad) {
+      admitida = true;
+    }
+  }
+
+  Serial.print("baud,");
+  Serial.print(velocidad);
+  if (!admitida) {
+    Serial.println(",error");
+    return;
+  }
+  Serial.println(",ok");
+  Serial.flush(); // Terminar de enviar la confirmación antes de cambiar
+
+  Serial.begin(velocidad);
+  baudPendiente = velocidad != BAUD_BASE;
+  baudCambio = millis();
+}
+
+// Volver a la velocidad base si el PI no confirmó el cambio
+void comprobarBaudios() {
+  if (baudPendiente && millis() - baudCambio > BAUD_CONFIRM_TIMEOUT) {
+    baudPendiente = false;
+    Serial.begin(BAUD_BASE);
+  }
+}
+
+// Calcular CRC8 (polinomio 0x07, valor inicial 0)
+uint8_t crc8(const uint8_t *data, uint8_t length) {
+  uint8_t crc = 0;
+  for (uint8_t i = 0; i < length; i++) {
+    crc ^= data[i];
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+    }
+  }
+  return crc;
+}
+
+// Procesar un paquete binario; responde "ack,<seq>" o "nak,<seq>"
+void procesarPaqueteBinario() {
+  uint8_t packet[PACKET_SIZE];
+  if (Serial.readBytes(packet, PACKET_SIZE) < PACKET_SIZE) {
+    return; // Paquete incompleto: se descarta
+  }
+
+  uint8_t opcode = packet[1];
+  uint8_t seq = packet[2];
+  bool valido = crc8(packet + 1, PACKET_SIZE - 2) == packet[PACKET_SIZE - 1];
+
+  if (valido && opcode == OP_MOTOR_OFF) {
+    detenerMotores();
+  }
+  else if (valido && opcode == OP_MOTOR_DRIVE) {
+    uint8_t reversa = packet[7];
+    for (int i = 0; i < 4; i++) {
+      ajustarMotor(i + 1, packet[3 + i], reversa & (1 << i));
+    }
+  }
+  else {
+    Serial.print("nak,");
+    Serial.println(seq);
+    return;
+  }
+
+  Serial.print("ack,");
+  Serial.println(seq);
+}
+
 // Procesar comando para motores
 void procesarComandoMotor(String command) {
   int firstComma = command.indexOf(','); // Primera coma
@@ -153,6 +271,16 @@ void controlarMotoresM3M4(int velocidad, bool reverse) {
 }
 
 void controlarMotorIndividual(int motorNum, int velocidad, bool reverse) {
+    ajustarMotor(motorNum, velocidad, reverse);
+
+    Serial.print("Motor ");
+    Serial.print(motorNum);
+    Serial.print(" a velocidad: ");
+    Serial.println(velocidad);
+}
+
+// Ajustar un motor sin generar respuesta por el puerto serie
+void ajustarMotor(int motorNum, int velocidad, bool reverse) {
     switch (motorNum) {
         case 1:
             motor1.setSpeed(velocidad);
@@ -171,14 +299,16 @@ void controlarMotorIndividual(int motorNum, int velocidad, bool reverse) {
             motor4.run(reverse ? BACKWARD : FORWARD);
             break;
     }
-
-    Serial.print("Motor ");
-    Serial.print(motorNum);
-    Serial.print(" a velocidad: ");
-    Serial.println(velocidad);
 }
 
 void apagarMotores() {
+  detenerMotores();
+
+  Serial.println("Todos los motores han sido apagados.");
+}
+
+// Detener todos los motores sin generar respuesta por el puerto serie
+void detenerMotores() {
   motor1.setSpeed(0);
   motor2.setSpeed(0);
   motor3.setSpeed(0);
@@ -188,6 +318,4 @@ void apagarMotores() {
   motor2.run(RELEASE); // Detener motor 2
   motor3.run(RELEASE); // Detener motor 3
   motor4.run(RELEASE); // Detener motor 4
-
-  Serial.println("Todos los motores han sido apagados.");
 }
@@ -0,0 +1,239 @@
+# Instrumentación opcional de manejadores: tiempo total, bloqueo del hub y perfil por muestreo
+import collections
+import functools
+import logging
+import sys
+import time
+import traceback
+
+import greenlet
+from eventlet import patcher
+
+# Los muestreadores son hilos nativos: siguen funcionando aunque el hub esté bloqueado
+native_threading = patcher.original('threading')
+native_time = patcher.original('time')
+
+logger = logging.getLogger(__name__)
+
+# Los hilos verdes y el hub de eventlet corren todos en el hilo principal
+MAIN_THREAD = native_threading.main_thread().ident
+
+
+def _stack(limit=20):
+    """Pila actual del hilo principal (la del hilo verde que tiene el hub)"""
+    frame = sys._current_frames().get(MAIN_THREAD)
+    return ''.join(traceback.format_stack(frame, limit=limit)) if frame is not None else None
+
+
+class HandlerProfiler:
+    """Mide cada llamada a un manejador Socket.IO o ruta Flask envuelto con `wrap()`.
+
+    El tiempo total incluye las esperas en las que el manejador cede el hub
+    (time.sleep parcheado, E/S verde). El tiempo de bloqueo es el tramo más
+    largo que el manejador corrió sin ceder: mientras dura, ningún otro cliente
+    ni Arduino es atendido. Se obtiene con greenlet.settrace, y un hilo nativo
+    toma una muestra de la pila cuando un tramo supera `blocking_ms`.
+    """
+
+    def __init__(self, slow_ms=100.0, blocking_ms=50.0, window=200, on_call=None):
+        self.slow_ms = slow_ms
+        self.blocking_ms = blocking_ms
+        self.window = window
+        self.on_call = on_call  # on_call(nombre, total_s, bloqueo_s), p. ej. para /metrics
+        self.handlers = {}
+        self.running = {}       # greenlet -> llamada en curso
+        self.slow_calls = collections.deque(maxlen=50)
+        self.enabled = False
+        self._previous_trace = None
+        self._watcher = None
+
+    def start(self):
+        self.enabled = True
+        self._previous_trace = greenlet.settrace(self._trace)
+        self._watcher = native_threading.Thread(target=self._watch, name='perfil-manejadores')
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def stop(self):
+        self.enabled = False
+        greenlet.settrace(self._previous_trace)
+
+    def instrument_flask(self, app):
+        for endpoint, view in list(app.view_functions.items()):
+            app.view_functions[endpoint] = self.wrap(f"http:{endpoint}", view)
+
+    def instrument_socketio(self, server):
+        """Envolver los manejadores ya registrados en un servidor python-socketio"""
+        for namespace, handlers in server.handlers.items():
+            for event, handler in list(handlers.items()):
+                name = f"socketio:{event}" if namespace == '/' else f"socketio:{namespace}:{event}"
+                handlers[event] = self.wrap(name, handler)
+
+    def wrap(self, name, handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return handler(*args, **kwargs)
+            current = greenlet.getcurrent()
+            now = time.monotonic()
+            call = {'name': name, 'start': now, 'since': now, 'max_run': 0.0, 'stack': None}
+            outer = self.running.get(current)
+            if outer is not None:
+                self._close_segment(outer, now)
+            self.running[current] = call
+            failed = False
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                now = time.monotonic()
+                self._close_segment(call, now)
+                if outer is not None:
+                    outer['since'] = now
+                    self.running[current] = outer
+                else:
+                    self.running.pop(current, None)
+                self._record(call, now - call['start'], failed)
+        return wrapper
+
+    def _close_segment(self, call, now):
+        if call['since'] is not None:
+            call['max_run'] = max(call['max_run'], now - call['since'])
+            call['since'] = None
+
+    def _trace(self, event, args):
+        if event in ('switch', 'throw'):
+            origin, target = args
+            now = time.monotonic()
+            call = self.running.get(origin)
+            if call is not None:
+                self._close_segment(call, now)
+            call = self.running.get(target)
+            if call is not None:
+                call['since'] = now
+        if self._previous_trace is not None:
+            self._previous_trace(event, args)
+
+    def _watch(self):
+        """Muestrear la pila de los manejadores que llevan demasiado tiempo sin ceder el hub"""
+        interval = self.blocking_ms / 2000
+        while self.enabled:
+            native_time.sleep(interval)
+            now = time.monotonic()
+            for call in list(self.running.values()):
+                since = call['since']
+                if since is not None and call['stack'] is None and (now - since) * 1000 > self.blocking_ms:
+                    call['stack'] = _stack()
+
+    def _record(self, call, wall, failed):
+        name = call['name']
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = {
+                'calls': 0, 'errors': 0, 'slow': 0,
+                'wall_ms': collections.deque(maxlen=self.window),
+                'blocking_ms': collections.deque(maxlen=self.window),
+                'max_wall_ms': 0.0, 'max_blocking_ms': 0.0
+            }
+        wall_ms, blocking_ms = wall * 1000, call['max_run'] * 1000
+        stats['calls'] += 1
+        stats['errors'] += failed
+        stats['wall_ms'].append(wall_ms)
+        stats['blocking_ms'].append(blocking_ms)
+        stats['max_wall_ms'] = max(stats['max_wall_ms'], wall_ms)
+        stats['max_blocking_ms'] = max(stats['max_blocking_ms'], blocking_ms)
+        if self.on_call is not None:
+            self.on_call(name, wall, call['max_run'])
+        if wall_ms > self.slow_ms or blocking_ms > self.blocking_ms:
+            stats['slow'] += 1
+            self.slow_calls.append({
+                'handler': name,
+                'time': time.time(),
+                'wall_ms': round(wall_ms, 1),
+                'blocking_ms': round(blocking_ms, 1),
+                'stack': call['stack']
+            })
+            logger.warning(f"Manejador lento {name}: {wall_ms:.0f} ms en total, bloqueó el hub {blocking_ms:.0f} ms"
+                           + (f"\n{call['stack']}" if call['stack'] else ""))
+
+    def stats(self):
+        """Resumen por manejador y últimas llamadas lentas para /debug/handlers"""
+        def summary(values):
+            values = sorted(values)
+            if not values:
+                return None
+            return {'p50': round(values[len(values) // 2], 1),
+                    'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 1)}
+
+        return {
+            'enabled': self.enabled,
+            'slow_ms': self.slow_ms,
+            'blocking_ms': self.blocking_ms,
+            'handlers': {
+                name: {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'slow': stats['slow'],
+                    'wall_ms': summary(stats['wall_ms']),
+                    'blocking_ms': summary(stats['blocking_ms']),
+                    'max_wall_ms': round(stats['max_wall_ms'], 1),
+                    'max_blocking_ms': round(stats['max_blocking_ms'], 1)
+                }
+                for name, stats in sorted(self.handlers.items())
+            },
+            'slow_calls': list(self.slow_calls)
+        }
+
+
+class SamplingProfiler:
+    """Perfil por muestreo del hilo principal desde un hilo nativo.
+
+    Acumula pilas en formato "colapsado" (una línea "f1;f2;f3 muestras" por
+    pila), el que aceptan flamegraph.pl, speedscope o inferno. Las muestras en
+    el bucle del hub sin trabajo aparecen como tiempo ocioso de eventlet.
+    """
+
+    def __init__(self, hz=100):
+        self.interval = 1.0 / hz
+        self.samples = collections.Counter()
+        self.total = 0
+        self.started = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.started = time.time()
+        self.thread = native_threading.Thread(target=self._run, name='perfil-muestreo')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            native_time.sleep(self.interval)
+            frame = sys._current_frames().get(MAIN_THREAD)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+                self.total += 1
+
+    def collapsed(self, reset=False):
+        """Texto colapsado de las muestras acumuladas; con reset=True se empieza de nuevo"""
+        samples = self.samples
+        if reset:
+            self.samples = collections.Counter()
+            self.total = 0
+            self.started = time.time()
+        # El hilo muestreador sigue insertando pilas: dict() copia el contador de una vez
+        # (bajo el GIL) y se ordena la copia
+        samples = sorted(dict(samples).items(), key=lambda item: item[1], reverse=True)
+        return ''.join(f"{stack} {count}\n" for stack, count in samples)
@@ -0,0 +1,239 @@
+# Grabación a bordo con búfer previo al evento ("modo dashcam")
+import collections
+import datetime
+import json
+import math
+import os
+import time
+
+from eventlet import patcher
+
+# El escritor es un hilo nativo: las escrituras a disco no pasan por el hub de eventlet
+native_threading = patcher.original('threading')
+native_queue = patcher.original('queue')
+
+# Extensión del fichero de video según el códec de la captura
+EXTENSIONS = {'mjpeg': '.mjpg', 'h264': '.h264'}
+
+
+class DashcamRecorder:
+    """Conserva en memoria los últimos `pre_seconds` de video y, al dispararse,
+    los guarda en disco junto con los `post_seconds` siguientes.
+
+    Cada segmento se escribe como flujo MJPEG (JPEG concatenados) o H.264
+    Annex-B, con un índice CSV de marcas de tiempo y un JSON de metadatos. El
+    bucle de captura solo añade frames a una cola; un hilo nativo hace
+    escrituras secuenciales grandes con un búfer de `write_buffer` bytes. Ese
+    hilo no usa logging y deja los errores en `last_error`.
+    """
+
+    def __init__(self, output_dir, pre_seconds=10.0, post_seconds=5.0, max_bytes=32 * 1024 * 1024,
+                 max_segments=20, write_buffer=1024 * 1024, enabled=False):
+        self.output_dir = output_dir
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self.write_buffer = write_buffer
+        self.enabled = enabled
+        self.frames = collections.deque()  # (timestamp, datos, keyframe, códec)
+        self.buffered_bytes = 0
+        self.segment = None                # Segmento en grabación
+        self.queue = native_queue.Queue()
+        self.writer = None
+        # Estadísticas
+        self.segments = collections.deque(maxlen=max_segments)
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.dropped_frames = 0
+        self.last_error = None
+
+    def configure(self, enabled=None, pre_seconds=None, post_seconds=None):
+        """Activar/desactivar el búfer y ajustar sus duraciones.
+
+        Lanza ValueError si una duración no es válida; en ese caso no se aplica nada.
+        """
+        for name, value in (('pre_seconds', pre_seconds), ('post_seconds', post_seconds)):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                      or not math.isfinite(value) or value < 0):
+                raise ValueError(f"{name} debe ser un número finito no negativo: {value!r}")
+        if pre_seconds is not None:
+            self.pre_seconds = float(pre_seconds)
+        if post_seconds is not None:
+            self.post_seconds = float(post_seconds)
+        if enabled is not None:
+            self.enabled = bool(enabled)
+            if not self.enabled:
+                self._finish_segment()
+                self._clear()
+
+    def add(self, frame_data, timestamp=None, keyframe=True, codec='mjpeg'):
+        """Añadir un frame capturado; se llama desde el bucle de captura"""
+        if not self.enabled:
+            return
+        if timestamp is None:
+            timestamp = getattr(frame_data, 'timestamp', None) or time.time()
+        if hasattr(frame_data, 'tobytes'):
+            frame_data = frame_data.tobytes()
+        if self.frames and self.frames[-1][3] != codec:
+            # Un segmento solo contiene un códec
+            self._finish_segment()
+            self._clear()
+        frame = (timestamp, frame_data, keyframe, codec)
+        self.frames.append(frame)
+        self.buffered_bytes += len(frame_data)
+        self._trim(timestamp)
+
+        if self.segment is not None:
+            if timestamp > self.segment['until']:
+                self._finish_segment()
+            else:
+                self._write_frame(frame)
+
+    def _trim(self, now):
+        """Descartar lo que excede la duración o la memoria del búfer previo"""
+        frames = self.frames
+        while len(frames) > 1 and (frames[0][0] < now - self.pre_seconds or self.buffered_bytes > self.max_bytes):
+            self.buffered_bytes -= len(frames.popleft()[1])
+
+    def _clear(self):
+        self.frames.clear()
+        self.buffered_bytes = 0
+
+    def trigger(self, reason='manual'):
+        """Guardar el búfer previo y los segundos siguientes; devuelve el nombre del segmento"""
+        if not self.enabled or not self.frames:
+            return None
+        now = time.time()
+        if self.segment is not None:
+            # Un nuevo evento durante la grabación la prolonga
+            self.segment['until'] = max(self.segment['until'], now + self.post_seconds)
+            self.segment['reasons'].append(reason)
+            return self.segment['name']
+
+        codec = self.frames[-1][3]
+        stamp = datetime.datetime.fromtimestamp(now).strftime('%Y%m%d-%H%M%S-%f')[:-3]
+        name = f"dashcam-{stamp}-{reason}"
+        self.segment = {
+            'name': name,
+            'codec': codec,
+            'trigger_time': now,
+            'until': now + self.post_seconds,
+            'reasons': [reason]
+        }
+        self._ensure_writer()
+        self.queue.put(('open', name, codec))
+        frames = list(self.frames)
+        if codec == 'h264':
+            # El video H.264 guardado debe empezar en un keyframe
+            first = next((index for index, frame in enumerate(frames) if frame[2]), None)
+            frames = frames[first:] if first is not None else []
+        for frame in frames:
+            self._write_frame(frame)
+        return name
+
+    def _write_frame(self, frame):
+        self.queue.put(('frame', frame))
+
+    def _finish_segment(self):
+        if self.segment is None:
+            return
+        segment, self.segment = self.segment, None
+        metadata = {key: segment[key] for key in ('name', 'codec', 'trigger_time', 'reasons')}
+        metadata.update(pre_seconds=self.pre_seconds, post_seconds=self.post_seconds)
+        self.queue.put(('close', metadata))
+
+    def stop(self):
+        """Cerrar el segmento en curso y esperar a que el escritor vacíe la cola"""
+        self.enabled = False
+        self._finish_segment()
+        self._clear()
+        if self.writer is not None and self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join(5)
+        self.writer = None
+
+    def _ensure_writer(self):
+        if self.writer is not None and self.writer.is_alive():
+            return
+        self.writer = native_threading.Thread(target=self._write_loop, name='dashcam-escritor')
+        self.writer.daemon = True
+        self.writer.start()
+
+    def _write_loop(self):
+        video = index = None
+        count = offset = 0
+        first = last = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                if item[0] == 'open':
+                    _, name, codec = item
+                    os.makedirs(self.output_dir, exist_ok=True)
+                    base = os.path.join(self.output_dir, name)
+                    video = open(base + EXTENSIONS[codec], 'wb', buffering=self.write_buffer)
+                    index = open(base + '.csv', 'w', buffering=self.write_buffer)
+                    index.write('frame,timestamp,offset,size,keyframe\n')
+                    count = offset = 0
+                    first = last = None
+                elif item[0] == 'frame':
+                    timestamp, data, keyframe, _ = item[1]
+                    if video is None:
+                        self.dropped_frames += 1
+                        continue
+                    video.write(data)
+                    index.write(f"{count},{timestamp:.6f},{offset},{len(data)},{int(keyframe)}\n")
+                    count += 1
+                    offset += len(data)
+                    first = timestamp if first is None else first
+                    last = timestamp
+                    self.frames_written += 1
+                    self.bytes_written += len(data)
+                elif item[0] == 'close' and video is not None:
+                    metadata = dict(item[1], video=os.path.basename(video.name), index=os.path.basename(index.name),
+                                    frames=count, bytes=offset, start_time=first, end_time=last)
+                    video.close()
+                    index.close()
+                    video = index = None
+                    with open(os.path.join(self.output_dir, metadata['name'] + '.json'), 'w') as f:
+                        json.dump(metadata, f, indent=2)
+                    self.segments.append(metadata)
+                    self._prune()
+            except Exception as e:
+                self.last_error = str(e)
+                if video is not None:
+                    video.close()
+                    index.close()
+                    video = index = None
+        if video is not None:
+            video.close()
+            index.close()
+
+    def _prune(self):
+        """Borrar los segmentos más antiguos por encima de `max_segments`"""
+        names = sorted(entry[:-5] for entry in os.listdir(self.output_dir)
+                       if entry.startswith('dashcam-') and entry.endswith('.json'))
+        for name in names[:-self.max_segments]:
+            for extension in ('.json', '.csv') + tuple(EXTENSIONS.values()):
+                path = os.path.join(self.output_dir, name + extension)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def stats(self):
+        """Estado del grabador para /server_info"""
+        return {
+            'enabled': self.enabled,
+            'pre_seconds': self.pre_seconds,
+            'post_seconds': self.post_seconds,
+            'buffered_frames': len(self.frames),
+            'buffered_bytes': self.buffered_bytes,
+            'recording': self.segment['name'] if self.segment else None,
+            'queued': self.queue.qsize(),
+            'frames_written': self.frames_written,
+            'bytes_written': self.bytes_written,
+            'dropped_frames': self.dropped_frames,
+            'segments': list(self.segments),
+            'last_error': self.last_error
+        }
@@ -0,0 +1,96 @@
+# Versiones reducidas del video (renditions) generadas a partir de una sola captura
+import logging
+import time
+
+import cv2
+import eventlet
+import numpy as np
+from eventlet import tpool
+
+logger = logging.getLogger(__name__)
+
+# Divisor de la resolución de salida para cada rendition
+RENDITIONS = {
+    'full': 1,
+    'half': 2,
+    'thumb': 4
+}
+
+# Escalas que libjpeg aplica durante la decodificación
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def scale_frame(source, source_size, size, quality):
+    """Reducir un frame (JPEG en bytes o imagen BGR) y codificarlo como JPEG.
+
+    Se ejecuta en un hilo nativo: OpenCV libera el GIL durante el trabajo pesado.
+    """
+    width, height = size
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        factor = source_size[0] // width
+        exact = source_size == (width * factor, height * factor)
+        flag = REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR) if exact else cv2.IMREAD_COLOR
+        image = cv2.imdecode(np.frombuffer(source, np.uint8), flag)
+    else:
+        image = source
+    if image.shape[1] != width or image.shape[0] != height:
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+def rendition_size(name, width, height):
+    """Resolución de una rendition para una salida de width x height (múltiplos de 2)"""
+    divisor = RENDITIONS[name]
+    return (max(2, width // divisor) & ~1, max(2, height // divisor) & ~1)
+
+
+class RenditionEncoder:
+    """Genera bajo demanda las renditions que tienen al menos un suscriptor.
+
+    El escalado y la codificación van al pool de hilos nativos de eventlet
+    (tpool) para no bloquear el hub. Cada rendition tiene como mucho un frame
+    en proceso: si llega otro mientras tanto se descarta para esa rendition.
+    """
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self.busy = set()
+        self.stats_by_rendition = {
+            name: {'encoded': 0, 'skipped': 0, 'errors': 0, 'encode_ms': 0.0}
+            for name in RENDITIONS if name != 'full'
+        }
+
+    def submit(self, source, source_size, metadata, quality):
+        """Encolar el frame para todas las renditions reducidas con suscriptores"""
+        for name in self.broadcaster.renditions_in_use():
+            if name == 'full':
+                continue
+            size = rendition_size(name, metadata['width'], metadata['height'])
+            if name in self.busy:
+                self.stats_by_rendition[name]['skipped'] += 1
+                continue
+            self.busy.add(name)
+            eventlet.spawn_n(self._encode, name, source, source_size, size, metadata, quality)
+
+    def _encode(self, name, source, source_size, size, metadata, quality):
+        stats = self.stats_by_rendition[name]
+        try:
+            start = time.monotonic()
+            # Los frames del anillo compartido se leen sin copia desde su ranura
+            frame_data = tpool.execute(scale_frame, getattr(source, 'view', source), source_size, size, quality)
+            if hasattr(source, 'valid') and not source.valid():
+                # La ranura se sobrescribió durante el escalado: el resultado no es fiable
+                stats['skipped'] += 1
+                return
+            stats['encode_ms'] = round((time.monotonic() - start) * 1000, 1)
+            stats['encoded'] += 1
+            self.broadcaster.publish(frame_data, dict(metadata, width=size[0], height=size[1]), rendition=name)
+        except Exception as e:
+            stats['errors'] += 1
+            logger.error(f"Error al generar la rendition {name}: {e}")
+        finally:
+            self.busy.discard(name)
+
+    def stats(self):
+        return self.stats_by_rendition
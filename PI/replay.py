@@ -0,0 +1,339 @@
+# Reproducción determinista de una sesión grabada (telemetría + segmento de dashcam)
+import bisect
+import collections
+import csv
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import telemetry as tlm
+from arduino import BASE_BAUDRATE, PACKET_SIZE, PACKET_SYNC, crc8, encode_packet, motor_opcode, servo_opcode
+
+logger = logging.getLogger(__name__)
+
+ROLE_DEVICES = {'motores': tlm.DEVICE_MOTORS, 'servos': tlm.DEVICE_SERVOS}
+SERVO_NAMES = {servo_id: name for name, servo_id in tlm.SERVO_IDS.items()}
+# Respuestas generadas por el servidor, no por el Arduino: no se reproducen por el puerto
+LOCAL_RESPONSES = ("Reemplazado", "Descartado", "Conexión cerrada", "Puerto serie no disponible",
+                   "No hay conexión", "Error:")
+TIMEOUT_RESPONSE = "Sin respuesta del Arduino"
+PACKET_ACK = re.compile(r'^(ack|nak),\d+$')
+
+
+def _packet_key(packet):
+    """Opcode y carga útil de un paquete binario, sin secuencia ni CRC"""
+    return bytes(packet[1:2]) + bytes(packet[3:8])
+
+
+class ReplaySession:
+    """Eventos de una sesión grabada con tiempos relativos a su primer registro.
+
+    Se carga de un directorio de telemetría de una sola ejecución del servidor
+    (los tiempos monotónicos de ejecuciones distintas no son comparables) y,
+    opcionalmente, de un segmento MJPEG del modo dashcam para el video.
+    """
+
+    def __init__(self, directory, video=None):
+        records, texts, headers = tlm.load_directory(directory)
+        if not len(records):
+            raise ValueError(f"No hay registros de telemetría en {directory}")
+        self.directory = directory
+        self.start = float(records['t'][0])
+        self.duration = float(records['t'][-1]) - self.start
+        self.inputs = []          # (offset, evento, args)
+        self.servo_angles = []    # (offset, servo, ángulo)
+        self.responses = {role: collections.defaultdict(collections.deque) for role in ROLE_DEVICES}
+        self.binary = {role: False for role in ROLE_DEVICES}
+        self.recorded_latency_ms = {role: [] for role in ROLE_DEVICES}
+        self.recorded_frames = int(np.count_nonzero(records['kind'] == tlm.KIND_FRAME))
+
+        commands = {}
+        last_ack = {}
+        roles = {device: role for role, device in ROLE_DEVICES.items()}
+        for record in records:
+            offset = float(record['t']) - self.start
+            kind = record['kind']
+            if kind == tlm.KIND_INPUT:
+                entry = json.loads(texts[record['text']])
+                self.inputs.append((offset, entry['event'], entry['args']))
+            elif kind == tlm.KIND_SERVO_ANGLE:
+                self.servo_angles.append((offset, SERVO_NAMES.get(int(record['a'])), int(record['b'])))
+            elif kind == tlm.KIND_COMMAND and record['device'] in roles:
+                commands[(int(record['device']), int(record['ref']))] = (texts[record['text']], offset)
+            elif kind == tlm.KIND_ACK and record['device'] in roles:
+                role = roles[int(record['device'])]
+                command = commands.pop((int(record['device']), int(record['ref'])), None)
+                response = texts[record['text']] or ''
+                if command is None or response.startswith(LOCAL_RESPONSES):
+                    continue
+                text, sent = command
+                if PACKET_ACK.match(response):
+                    self.binary[role] = True
+                # Tiempo de respuesta del Arduino: desde que el comando pudo escribirse
+                # (tras la respuesta anterior del mismo enlace) hasta su respuesta
+                ready = max(sent, last_ack.get(role, sent))
+                delay_ms = min(float(record['value']), (offset - ready) * 1000)
+                last_ack[role] = offset
+                reply = None if response.startswith(TIMEOUT_RESPONSE) else response
+                self.responses[role][text].append((reply, max(0.0, delay_ms)))
+                if reply is not None:
+                    self.recorded_latency_ms[role].append(float(record['value']))
+
+        self.video = FramePlayback(video, headers[0], self.start) if video else None
+
+
+class FramePlayback:
+    """Frames de un segmento MJPEG del modo dashcam (.mjpg + índice .csv)"""
+
+    def __init__(self, path, header, session_start):
+        self.path = path
+        base = os.path.splitext(path)[0]
+        with open(base + '.csv') as f:
+            rows = list(csv.DictReader(f))
+        # Convertir la hora de pared de cada frame al reloj monotónico de la sesión
+        to_monotonic = header['monotonic_time'] - header['wall_time']
+        self.offsets = [float(row['timestamp']) + to_monotonic - session_start for row in rows]
+        self.spans = [(int(row['offset']), int(row['size'])) for row in rows]
+        self.timestamps = [float(row['timestamp']) for row in rows]
+        self.position = 0   # Siguiente frame sin reproducir ni saltar
+        self.skipped = 0
+        self.played = 0
+        with open(path, 'rb') as f:
+            f.seek(self.spans[0][0])
+            first = f.read(self.spans[0][1])
+        image = cv2.imdecode(np.frombuffer(first, np.uint8), cv2.IMREAD_COLOR)
+        self.size = (image.shape[1], image.shape[0])
+
+    def play(self, engine):
+        """Generador de (jpeg, hora de pared grabada) al ritmo del reloj de `engine`.
+
+        Los frames que ya vencieron al (re)empezar se saltan, como haría una cámara real.
+        """
+        index = max(self.position, bisect.bisect_left(self.offsets, engine.elapsed()))
+        self.skipped += index - self.position
+        self.position = index
+        with open(self.path, 'rb') as f:
+            while self.position < len(self.offsets):
+                index = self.position
+                delay = engine.due(self.offsets[index]) - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                offset, size = self.spans[index]
+                f.seek(offset)
+                data = f.read(size)
+                self.played += 1
+                self.position += 1
+                yield data, self.timestamps[index]
+
+
+class ReplaySerial:
+    """Puerto serie simulado con la interfaz de pyserial que usa ArduinoLink.
+
+    A cada comando recibido (texto o paquete binario) responde con la respuesta
+    grabada para ese mismo comando tras el tiempo de respuesta grabado (dividido
+    por la velocidad de reproducción). Las respuestas de un mismo comando se
+    consumen en orden; agotadas, se repite la última. Un comando nunca visto no
+    recibe respuesta, igual que un timeout.
+    """
+
+    def __init__(self, role, session, engine):
+        self.role = role
+        self.engine = engine
+        self.binary = session.binary[role]
+        self.responses = {}
+        self.packet_responses = {}
+        encoder = motor_opcode if role == 'motores' else servo_opcode
+        for command, outcomes in session.responses[role].items():
+            self.responses[command] = collections.deque(outcomes)
+            packet = encoder(command)
+            if packet is not None:
+                self.packet_responses[_packet_key(encode_packet(packet[0], 0, packet[1]))] = self.responses[command]
+        self.is_open = True
+        self.timeout = 0.1
+        self.baudrate = BASE_BAUDRATE
+        self._input = bytearray()
+        self._scheduled = []   # (instante, orden, bytes)
+        self._order = 0
+        self._ready = bytearray()
+        self._wakeup = threading.Event()
+        # Estadísticas
+        self.commands = 0
+        self.answered = 0
+        self.unmatched = 0
+
+    def schedule(self, due, line):
+        """Enviar `line` al servidor en el instante monotónico `due`"""
+        self._order += 1
+        heapq.heappush(self._scheduled, (due, self._order, line.encode() + b'\r\n'))
+        self._wakeup.set()
+
+    def _respond(self, outcomes, ack=None):
+        self.commands += 1
+        if outcomes:
+            outcome = outcomes.popleft() if len(outcomes) > 1 else outcomes[0]
+        else:
+            self.unmatched += 1
+            return
+        reply, delay_ms = outcome
+        if reply is None:
+            return
+        if ack is not None:
+            # Paquete binario: la respuesta lleva la secuencia del paquete recibido
+            reply = f"{reply.split(',', 1)[0]},{ack}" if PACKET_ACK.match(reply) else reply
+        self.answered += 1
+        self.schedule(time.monotonic() + delay_ms / 1000 / self.engine.speed, reply)
+
+    def write(self, data):
+        self._input += data
+        while self._input:
+            if self._input[0] == PACKET_SYNC:
+                if len(self._input) < PACKET_SIZE:
+                    break
+                packet = bytes(self._input[:PACKET_SIZE])
+                del self._input[:PACKET_SIZE]
+                if crc8(packet[1:8]) != packet[8]:
+                    continue
+                self._respond(self.packet_responses.get(_packet_key(packet)), ack=packet[2])
+                continue
+            newline = self._input.find(b'\n')
+            if newline == -1:
+                break
+            line = self._input[:newline].decode(errors='replace').strip()
+            del self._input[:newline + 1]
+            if line == "ping":
+                self.schedule(time.monotonic(), "pong")
+            elif line == "proto,bin":
+                # Mismo protocolo que en la sesión grabada
+                if self.binary:
+                    self.schedule(time.monotonic(), "proto,bin,ok")
+            elif line:
+                self._respond(self.responses.get(line))
+        return len(data)
+
+    def _release_due(self):
+        now = time.monotonic()
+        while self._scheduled and self._scheduled[0][0] <= now:
+            self._ready += heapq.heappop(self._scheduled)[2]
+
+    @property
+    def in_waiting(self):
+        self._release_due()
+        return len(self._ready)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout or 0)
+        while self.is_open:
+            self._release_due()
+            now = time.monotonic()
+            if self._ready or now >= deadline:
+                break
+            next_due = self._scheduled[0][0] if self._scheduled else deadline
+            # Una respuesta programada mientras se espera despierta al lector
+            self._wakeup.wait(max(0, min(next_due, deadline) - now))
+            self._wakeup.clear()
+        data = bytes(self._ready[:size])
+        del self._ready[:size]
+        return data
+
+    def reset_input_buffer(self):
+        self._ready.clear()
+
+    def close(self):
+        self.is_open = False
+
+    def stats(self):
+        return {'commands': self.commands, 'answered': self.answered, 'unmatched': self.unmatched,
+                'binary': self.binary}
+
+
+class ReplayEngine:
+    """Reproduce una sesión: puertos serie simulados, video grabado y entradas de control.
+
+    `dispatch(evento, args)` ejecuta una entrada Socket.IO grabada (normalmente el
+    manejador correspondiente de web.py). `speed` > 1 acelera la reproducción.
+    """
+
+    def __init__(self, session, dispatch, speed=1.0):
+        self.session = session
+        self.dispatch = dispatch
+        self.speed = speed
+        self.started = None
+        self.finished = None
+        self.ports = {role: ReplaySerial(role, session, self) for role in ROLE_DEVICES}
+        self.inputs_sent = 0
+        self.input_errors = 0
+
+    def elapsed(self):
+        """Tiempo de sesión (s) reproducido hasta ahora"""
+        return (time.monotonic() - self.started) * self.speed if self.started is not None else 0.0
+
+    def due(self, offset):
+        """Instante monotónico en que debe reproducirse un evento de la sesión"""
+        return self.started + offset / self.speed
+
+    def start(self):
+        self.started = time.monotonic()
+        for offset, servo, angle in self.session.servo_angles:
+            if servo is not None:
+                self.ports['servos'].schedule(self.due(offset), f"servo_angle,{servo},{angle}")
+
+    def run(self):
+        """Enviar las entradas grabadas a su hora; vuelve al terminar la sesión"""
+        if self.started is None:
+            self.start()
+        for offset, event, args in self.session.inputs:
+            delay = self.due(offset) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.dispatch(event, args)
+                self.inputs_sent += 1
+            except Exception as e:
+                self.input_errors += 1
+                logger.error(f"Error al reproducir '{event}': {e}")
+        remaining = self.due(self.session.duration) - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        self.finished = time.monotonic()
+
+    def report(self, replayed_directory=None):
+        """Resumen de la reproducción; con `replayed_directory` (la telemetría de la propia
+        reproducción) compara las latencias de comandos con las grabadas"""
+        video = self.session.video
+        report = {
+            'session': self.session.directory,
+            'speed': self.speed,
+            'duration_s': round(self.session.duration, 3),
+            'wall_s': round(self.finished - self.started, 3) if self.finished else None,
+            'inputs': len(self.session.inputs),
+            'inputs_sent': self.inputs_sent,
+            'input_errors': self.input_errors,
+            'serial': {role: port.stats() for role, port in self.ports.items()},
+            'recorded_latency_ms': {role: _summary(values)
+                                    for role, values in self.session.recorded_latency_ms.items()},
+            'video': {'recorded_frames': self.session.recorded_frames,
+                      'played': video.played if video else 0,
+                      'skipped': video.skipped if video else 0}
+        }
+        if replayed_directory is not None:
+            latencies = tlm.command_latencies(tlm.load_directory(replayed_directory)[0])
+            answered = latencies[latencies['success']]
+            report['replayed_latency_ms'] = {role: _summary(answered['latency_ms'][answered['device'] == device])
+                                             for role, device in ROLE_DEVICES.items()}
+        return report
+
+
+def _summary(values):
+    """Percentiles de una lista de latencias (ms)"""
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return None
+    return {'count': int(len(values)), 'p50': round(float(np.percentile(values, 50)), 2),
+            'p95': round(float(np.percentile(values, 95)), 2), 'max': round(float(values.max()), 2)}
@@ -0,0 +1,395 @@
+# Arduinos y cámara simulados para ejecutar el servidor sin hardware (pruebas de carga)
+import collections
+import os
+import random
+import tty
+
+import cv2
+import numpy as np
+from eventlet import patcher
+
+from arduino import (BASE_BAUDRATE, FLAG_CALIBRATION, FLAG_FORCE_STOP, OP_MOTOR_DRIVE, OP_MOTOR_OFF,
+                     OP_SERVO_LIMIT, OP_SERVO_MOVE, OP_SERVO_REVERSE, OP_SERVO_SPEED, OP_SERVO_STOP,
+                     PACKET_SIZE, PACKET_SYNC, crc8)
+
+# Los simuladores corren en hilos nativos, fuera del hub de eventlet, como un Arduino real
+native_threading = patcher.original('threading')
+native_time = patcher.original('time')
+native_select = patcher.original('select')
+
+# Mismas constantes que los sketches
+BAUD_RATES = (115200, 57600, 9600)
+BAUD_CONFIRM_TIMEOUT = 1.0
+SPEED_DELAYS = (0.050, 0.025, 0.005)           # s entre pasos de servo por velocidad (1-3)
+ANGLE_REPORT_INTERVAL = 0.100
+ANGLE_REPORT_INTERVAL_FAST = 0.025
+SERVO_RANGES = {'mg995': 180, 'ds04': 360}
+SERVO_NAMES = ('mg995', 'ds04')
+
+
+class SimulatedArduino:
+    """Emula Motores.ino o Servomotores.ino detrás de un par pty.
+
+    El servidor abre `path` (el extremo esclavo) con pyserial como un puerto
+    real. Cada respuesta sale tras `delay_ms` más un retraso aleatorio de hasta
+    `jitter_ms` y el tiempo de transmisión a los baudios negociados, y las
+    líneas salen en orden como por una UART.
+    """
+
+    def __init__(self, role, delay_ms=2.0, jitter_ms=1.0, seed=None):
+        if role not in ('motores', 'servos'):
+            raise ValueError(f"Rol de Arduino desconocido: {role}")
+        self.role = role
+        self.delay = delay_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.random = random.Random(seed)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        self.baudrate = BASE_BAUDRATE
+        self.baud_pending = None        # Instante del cambio de baudios sin confirmar
+        self.binary = False
+        self.text_reply = True          # Mensajes informativos solo para comandos de texto
+        self.running = False
+        self.thread = None
+        self._input = bytearray()
+        self._output = collections.deque()  # (instante, bytes)
+        self._tx_free = 0.0                 # Instante en que la UART queda libre
+        self.motors = [[0, False] for _ in range(4)]  # [velocidad, reversa]
+        self.servos = {name: {'angle': 0, 'target': 0, 'speed': 2, 'moving': False, 'reverse': False,
+                              'limit': SERVO_RANGES[name], 'last_update': 0.0} for name in SERVO_NAMES}
+        self.report_interval = ANGLE_REPORT_INTERVAL
+        self.last_report = 0.0
+        # Estadísticas
+        self.commands = 0
+        self.packets = 0
+        self.lines_sent = 0
+
+    def start(self):
+        self.running = True
+        if self.role == 'motores':
+            self._send("Sistema de control de motores inicializado")
+        else:
+            self._send("servo_angle,mg995,0")
+            self._send("servo_angle,ds04,0")
+            self._send("Sistema de control de servos inicializado - Servos calibrados a 0°")
+        self.thread = native_threading.Thread(target=self._run, name=f"simulador-{self.role}")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(2)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _send(self, line, received=None):
+        """Programar una línea de respuesta"""
+        data = f"{line}\r\n".encode()
+        now = native_time.monotonic()
+        start = max(received or now, now) + self.delay + self.random.uniform(0, self.jitter)
+        # 10 bits por byte (inicio, 8 datos, parada)
+        start = max(start, self._tx_free)
+        self._tx_free = start + len(data) * 10 / self.baudrate
+        self._output.append((self._tx_free, data))
+
+    def _run(self):
+        while self.running:
+            now = native_time.monotonic()
+            timeout = 0.005
+            if self._output:
+                timeout = max(0, min(timeout, self._output[0][0] - now))
+            try:
+                readable, _, _ = native_select.select([self.master], [], [], timeout)
+                if readable:
+                    self._input += os.read(self.master, 4096)
+                    self._process(native_time.monotonic())
+            except OSError:
+                break
+            now = native_time.monotonic()
+            self._tick(now)
+            while self._output and self._output[0][0] <= now:
+                try:
+                    os.write(self.master, self._output.popleft()[1])
+                    self.lines_sent += 1
+                except OSError:
+                    return
+
+    def _process(self, now):
+        while self._input:
+            if self.binary and self._input[0] == PACKET_SYNC:
+                if len(self._input) < PACKET_SIZE:
+                    return
+                packet = bytes(self._input[:PACKET_SIZE])
+                del self._input[:PACKET_SIZE]
+                self.packets += 1
+                self.text_reply = False
+                self._packet(packet, now)
+                self.text_reply = True
+                continue
+            newline = self._input.find(b'\n')
+            if newline == -1:
+                return
+            line = self._input[:newline].decode(errors='replace').strip()
+            del self._input[:newline + 1]
+            # La línea termina de llegar tras su tiempo de transmisión
+            self._command(line, now + (newline + 1) * 10 / self.baudrate)
+
+    def _command(self, command, now):
+        self.commands += 1
+        if command == "proto,bin":
+            self.binary = True
+            self._send("proto,bin,ok", now)
+        elif command == "proto,text":
+            self.binary = False
+            self._send("proto,text,ok", now)
+        elif command.startswith("baud,"):
+            self._change_baudrate(command[5:], now)
+        elif command == "ping":
+            self.baud_pending = None
+            self._send("pong", now)
+        elif command == "id":
+            self._send(f"id,{self.role}", now)
+        elif self.role == 'motores':
+            self._motor_command(command, now)
+        elif command.startswith("servo"):
+            self._servo_command(command, now)
+
+    def _change_baudrate(self, value, now):
+        try:
+            rate = int(value)
+        except ValueError:
+            rate = 0
+        if rate not in BAUD_RATES:
+            self._send(f"baud,{rate},error", now)
+            return
+        self._send(f"baud,{rate},ok", now)
+        self.baudrate = rate
+        self.baud_pending = now if rate != BASE_BAUDRATE else None
+        self.report_interval = ANGLE_REPORT_INTERVAL_FAST if rate >= 57600 else ANGLE_REPORT_INTERVAL
+
+    def _packet(self, packet, now):
+        opcode, seq = packet[1], packet[2]
+        valid = crc8(packet[1:8]) == packet[8]
+        if valid and self.role == 'motores':
+            if opcode == OP_MOTOR_OFF:
+                self.motors = [[0, False] for _ in range(4)]
+            elif opcode == OP_MOTOR_DRIVE:
+                self.motors = [[packet[3 + i], bool(packet[7] & (1 << i))] for i in range(4)]
+            else:
+                valid = False
+        elif valid:
+            servo = SERVO_NAMES[packet[3]] if packet[3] < len(SERVO_NAMES) else None
+            if servo is None:
+                valid = False
+            elif opcode == OP_SERVO_MOVE:
+                self._move(servo, (packet[4] << 8) | packet[5], packet[6],
+                           packet[7] & FLAG_CALIBRATION, packet[7] & FLAG_FORCE_STOP, now)
+            elif opcode == OP_SERVO_STOP:
+                self._stop(servo, now)
+            elif opcode == OP_SERVO_SPEED:
+                self._set_speed(servo, packet[4], now)
+            elif opcode == OP_SERVO_REVERSE:
+                self._reverse(servo, now)
+            elif opcode == OP_SERVO_LIMIT:
+                self._set_limit(servo, (packet[4] << 8) | packet[5], now)
+            else:
+                valid = False
+        self._send(f"{'ack' if valid else 'nak'},{seq}", now)
+
+    def _motor_command(self, command, now):
+        if command == "off,0":
+            self.motors = [[0, False] for _ in range(4)]
+            self._send("Todos los motores han sido apagados.", now)
+            self._send("Motores apagados.", now)
+            return
+        mode, _, rest = command.partition(',')
+        if not rest:
+            return
+        values = rest.split(',')
+        try:
+            if mode == "synchronized":
+                speed, reverse = int(values[0]), values[1] == "reverse"
+                self.motors = [[speed, reverse] for _ in range(4)]
+                self._send(f"Todos los motores a velocidad: {speed}", now)
+            elif mode == "differential":
+                pairs = [(int(values[0]), values[1] == "reverse1"), (int(values[2]), values[3] == "reverse2")]
+                self.motors = [list(pairs[0]), list(pairs[0]), list(pairs[1]), list(pairs[1])]
+                self._send(f"M1 y M2 a velocidad: {pairs[0][0]}", now)
+                self._send(f"M3 y M4 a velocidad: {pairs[1][0]}", now)
+            elif mode == "independent":
+                for motor in range(4):
+                    speed = int(values[motor * 2])
+                    self.motors[motor] = [speed, values[motor * 2 + 1] == f"reverse{motor + 1}"]
+                    self._send(f"Motor {motor + 1} a velocidad: {speed}", now)
+            else:
+                self._send("Modo no válido.", now)
+        except (IndexError, ValueError):
+            # El sketch convierte con toInt() y no valida: se responde como con velocidad 0
+            self._send("Modo no válido.", now)
+
+    def _servo_command(self, command, now):
+        parts = command.split(',')
+        if len(parts) < 3:
+            return
+        servo, action, params = parts[1], parts[2], parts[3:]
+        if servo not in self.servos:
+            self._send("Tipo de servo desconocido", now)
+            return
+        number = lambda index: int(params[index]) if len(params) > index and params[index].lstrip('-').isdigit() else 0
+        if action == "move" and len(params) >= 2:
+            flags = ','.join(params[2:])
+            self._move(servo, number(0), number(1), "calibration" in flags, "force_stop" in flags, now)
+        elif action == "stop":
+            self._stop(servo, now)
+        elif action == "speed":
+            self._set_speed(servo, number(0), now)
+        elif action == "reverse":
+            self._reverse(servo, now)
+        elif action == "limit":
+            self._set_limit(servo, number(0), now)
+
+    def _move(self, servo, angle, speed, calibration, force_stop, now):
+        state = self.servos[servo]
+        angle = max(0, min(SERVO_RANGES[servo], min(angle, state['limit'])))
+        speed = max(1, min(3, speed))
+        if calibration and angle == 0:
+            if self.text_reply:
+                self._send(f"Calibrando servo {servo} a 0 grados", now)
+            state.update(angle=0, target=0, moving=False)
+            self._send(f"servo_angle,{servo},0", now)
+            return
+        if servo == 'ds04' and angle == 90 and force_stop:
+            state.update(angle=90, target=90, moving=False)
+            if self.text_reply:
+                self._send("DS04 detenido en posición central (forzado)", now)
+            self._send("servo_angle,ds04,90", now)
+            return
+        target = SERVO_RANGES[servo] - angle if state['reverse'] else angle
+        state.update(target=target, speed=speed, moving=True, last_update=now)
+        if self.text_reply:
+            self._send(f"Moviendo servo {servo} a ángulo {angle} con velocidad {speed}", now)
+
+    def _stop(self, servo, now):
+        state = self.servos[servo]
+        state['moving'] = False
+        if self.text_reply:
+            self._send("DS04 detenido en posición central" if servo == 'ds04'
+                       else f"MG995 detenido en posición {state['angle']}", now)
+        state['target'] = state['angle']
+        self._send(f"servo_stopped,{servo}", now)
+
+    def _set_speed(self, servo, speed, now):
+        speed = max(1, min(3, speed))
+        self.servos[servo]['speed'] = speed
+        if self.text_reply:
+            self._send(f"Velocidad del servo {servo} ajustada a {speed}", now)
+
+    def _reverse(self, servo, now):
+        state = self.servos[servo]
+        state['reverse'] = not state['reverse']
+        if self.text_reply:
+            self._send(f"Dirección del servo {servo} {'invertida' if state['reverse'] else 'normal'}", now)
+
+    def _set_limit(self, servo, limit, now):
+        limit = max(0, min(SERVO_RANGES[servo], limit))
+        self.servos[servo]['limit'] = limit
+        if self.text_reply:
+            self._send(f"Límite de ángulo para {servo} establecido a {limit}", now)
+
+    def _tick(self, now):
+        """Lo que el sketch hace en cada vuelta de loop(): baudios, movimiento y telemetría"""
+        if self.baud_pending is not None and now - self.baud_pending > BAUD_CONFIRM_TIMEOUT:
+            self.baud_pending = None
+            self.baudrate = BASE_BAUDRATE
+            self.report_interval = ANGLE_REPORT_INTERVAL
+        if self.role != 'servos':
+            return
+        for servo, state in self.servos.items():
+            if not state['moving'] or now - state['last_update'] <= SPEED_DELAYS[state['speed'] - 1]:
+                continue
+            state['last_update'] = now
+            if state['angle'] == state['target']:
+                state['moving'] = False
+                if servo == 'ds04' and state['target'] == 90:
+                    self._send("DS04 detenido en posición central")
+                else:
+                    self._send(f"{servo.upper()} llegó al objetivo: {state['angle']}")
+                continue
+            step = 1 if state['speed'] == 1 else 5
+            if state['angle'] < state['target']:
+                state['angle'] = min(state['angle'] + step, state['target'])
+            else:
+                state['angle'] = max(state['angle'] - step, state['target'])
+            state['angle'] = max(0, min(state['angle'], state['limit']))
+        if now - self.last_report >= self.report_interval:
+            self.last_report = now
+            for servo in SERVO_NAMES:
+                self._send(f"servo_angle,{servo},{self.servos[servo]['angle']}")
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'baudrate': self.baudrate,
+            'binary': self.binary,
+            'commands': self.commands,
+            'packets': self.packets,
+            'lines_sent': self.lines_sent,
+            'queued': len(self._output)
+        }
+
+
+class SyntheticCamera:
+    """Imita cv2.VideoCapture: read() bloquea hasta el siguiente frame como una cámara real.
+
+    La imagen tiene ruido fijo (para que el JPEG pese como una escena real), un
+    recuadro en movimiento y el número de frame.
+    """
+
+    def __init__(self, device_id=0, fps=30):
+        self.interval = 1.0 / fps
+        self.next_frame = native_time.monotonic()
+        self.width, self.height = 640, 480
+        self.count = 0
+        self.opened = True
+        self._background = None
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        elif prop == cv2.CAP_PROP_FPS and value > 0:
+            self.interval = 1.0 / value
+        return True
+
+    def grab(self):
+        delay = self.next_frame - native_time.monotonic()
+        if delay > 0:
+            native_time.sleep(delay)  # Bloqueo real, como el driver V4L2
+        self.next_frame = max(self.next_frame + self.interval, native_time.monotonic())
+        self.count += 1
+        return True
+
+    def read(self):
+        self.grab()
+        if self._background is None or self._background.shape[:2] != (self.height, self.width):
+            rng = np.random.default_rng(0)
+            self._background = rng.integers(0, 255, (self.height, self.width, 3), dtype=np.uint8)
+        frame = self._background.copy()
+        size = max(8, self.height // 4)
+        x = (self.count * 4) % max(1, self.width - size)
+        cv2.rectangle(frame, (x, self.height // 2 - size // 2), (x + size, self.height // 2 + size // 2),
+                      (0, 0, 255), -1)
+        cv2.putText(frame, str(self.count), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        return True, frame
+
+    def release(self):
+        self.opened = False
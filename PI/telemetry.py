@@ -0,0 +1,265 @@
+# Registro binario de telemetría: comandos, respuestas, ángulos de servo y frames de video
+import collections
+import datetime
+import json
+import os
+import struct
+import time
+
+import numpy as np
+from eventlet import patcher, tpool
+
+# El escritor es un hilo nativo: las escrituras a disco no pasan por el hub de eventlet
+native_threading = patcher.original('threading')
+native_time = patcher.original('time')
+
+# Cabecera de cada fichero: firma, versión, tamaño de registro, reloj de pared y
+# reloj monotónico al abrirlo (para convertir los tiempos monotónicos a fecha)
+MAGIC = b'TLM1'
+VERSION = 1
+HEADER = struct.Struct('<4sHHdd')
+
+# Registro de tamaño fijo; todos los tiempos son time.monotonic()
+#   t      instante del evento
+#   kind   tipo de registro (KIND_*)
+#   device dispositivo (DEVICE_*)
+#   flags  FLAG_*
+#   ref    id del comando (comando/respuesta) o secuencia del frame
+#   text   id del texto en el fichero .strings (0 = sin texto)
+#   a, b   enteros según el tipo (ver abajo)
+#   value  real según el tipo (ver abajo)
+RECORD = struct.Struct('<dBBHIIiid')
+RECORD_DTYPE = np.dtype([
+    ('t', '<f8'), ('kind', 'u1'), ('device', 'u1'), ('flags', '<u2'), ('ref', '<u4'),
+    ('text', '<u4'), ('a', '<i4'), ('b', '<i4'), ('value', '<f8')
+])
+
+KIND_COMMAND = 1      # text: comando enviado
+KIND_ACK = 2          # text: respuesta; value: latencia (ms) desde el envío
+KIND_SERVO_ANGLE = 3  # a: servo (0 = mg995, 1 = ds04); b: ángulo
+KIND_FRAME = 4        # a: tamaño (bytes); value: marca de tiempo de pared de la captura
+KIND_INPUT = 5        # text: evento Socket.IO de control y sus argumentos en JSON
+
+DEVICE_MOTORS = 0
+DEVICE_SERVOS = 1
+DEVICE_CAMERA = 2
+DEVICE_CLIENT = 3
+DEVICES = {'motores': DEVICE_MOTORS, 'servos': DEVICE_SERVOS, 'camara': DEVICE_CAMERA, 'cliente': DEVICE_CLIENT}
+
+FLAG_SUCCESS = 0x01
+FLAG_KEYFRAME = 0x02
+FLAG_H264 = 0x04
+
+SERVO_IDS = {'mg995': 0, 'ds04': 1}
+
+
+class TelemetryLog:
+    """Registro solo de adición con escritura por lotes.
+
+    Los productores (hilos de los Arduinos y bucle de captura) solo añaden una
+    tupla a una deque; un hilo nativo las empaqueta cada `flush_interval`
+    segundos y las escribe de una vez. Los ficheros rotan al superar
+    `max_file_bytes` y se conservan como mucho `max_files`. Los textos de
+    comandos y respuestas se guardan una sola vez por fichero en un .strings
+    (una cadena JSON por línea; el id es el número de línea).
+    """
+
+    def __init__(self, directory, max_file_bytes=8 * 1024 * 1024, max_files=10, flush_interval=0.5,
+                 enabled=True):
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.pending = collections.deque()
+        self.next_ref = 0
+        self.writer = None
+        self.running = False
+        self.path = None
+        # Estadísticas
+        self.records = 0
+        self.bytes_written = 0
+        self.batches = 0
+        self.rotations = 0
+        self.last_error = None
+
+    def _append(self, kind, device, flags=0, ref=0, text=None, a=0, b=0, value=0.0):
+        if not self.enabled:
+            return
+        # append() de deque es atómico: no hace falta bloqueo con el hilo escritor
+        self.pending.append((time.monotonic(), kind, device, flags, ref, text, a, b, value))
+        if not self.running:
+            self.start()
+
+    def command(self, device, command):
+        """Registrar un comando enviado; devuelve su id para asociarle la respuesta"""
+        self.next_ref = (self.next_ref + 1) & 0xFFFFFFFF
+        self._append(KIND_COMMAND, DEVICES[device], ref=self.next_ref, text=command)
+        return self.next_ref
+
+    def ack(self, device, ref, success, response, latency_ms):
+        self._append(KIND_ACK, DEVICES[device], FLAG_SUCCESS if success else 0, ref, str(response),
+                     value=latency_ms)
+
+    def servo_angle(self, servo_type, angle):
+        self._append(KIND_SERVO_ANGLE, DEVICE_SERVOS, a=SERVO_IDS.get(servo_type, -1), b=int(angle))
+
+    def frame(self, seq, size, timestamp, keyframe=True, codec='mjpeg'):
+        flags = (FLAG_KEYFRAME if keyframe else 0) | (FLAG_H264 if codec == 'h264' else 0)
+        self._append(KIND_FRAME, DEVICE_CAMERA, flags, seq or 0, a=size, value=timestamp)
+
+    def input(self, event, args):
+        """Registrar una entrada de control recibida por Socket.IO (para reproducirla)"""
+        self._append(KIND_INPUT, DEVICE_CLIENT, text=json.dumps({'event': event, 'args': list(args)}))
+
+    def start(self):
+        self.running = True
+        self.writer = native_threading.Thread(target=self._write_loop, name='telemetria-escritor')
+        self.writer.daemon = True
+        self.writer.start()
+
+    def stop(self):
+        """Escribir lo pendiente y cerrar el fichero actual"""
+        self.enabled = False
+        self.running = False
+        if self.writer is not None:
+            # Se llama desde hilos verdes: esperar al escritor en tpool para no bloquear el hub
+            tpool.execute(self.writer.join, 5)
+            self.writer = None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        self.path = os.path.join(self.directory, f"telemetry-{stamp}.bin")
+        data = open(self.path, 'wb')
+        data.write(HEADER.pack(MAGIC, VERSION, RECORD.size, time.time(), time.monotonic()))
+        strings = open(self.path[:-4] + '.strings', 'w')
+        self._prune()
+        return data, strings
+
+    def _prune(self):
+        """Borrar los ficheros más antiguos por encima de `max_files`"""
+        names = sorted(entry[:-4] for entry in os.listdir(self.directory)
+                       if entry.startswith('telemetry-') and entry.endswith('.bin'))
+        for name in names[:-self.max_files]:
+            for extension in ('.bin', '.strings'):
+                path = os.path.join(self.directory, name + extension)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _write_loop(self):
+        data = strings = None
+        interned = {}
+        size = 0
+        while True:
+            stopping = not self.running
+            if not stopping:
+                native_time.sleep(self.flush_interval)
+            try:
+                if self.pending and data is None:
+                    data, strings = self._open()
+                    interned = {}
+                    size = HEADER.size
+                batch = []
+                new_strings = []
+                pending = self.pending
+                while pending:
+                    t, kind, device, flags, ref, text, a, b, value = pending.popleft()
+                    text_id = 0
+                    if text is not None:
+                        text_id = interned.get(text)
+                        if text_id is None:
+                            text_id = interned[text] = len(interned) + 1
+                            new_strings.append(json.dumps(text) + '\n')
+                    batch.append(RECORD.pack(t, kind, device, flags, ref, text_id, a, b, value))
+                if batch:
+                    # Una escritura grande por lote
+                    strings.write(''.join(new_strings))
+                    strings.flush()
+                    chunk = b''.join(batch)
+                    data.write(chunk)
+                    data.flush()
+                    size += len(chunk)
+                    self.records += len(batch)
+                    self.bytes_written += len(chunk)
+                    self.batches += 1
+                    if size >= self.max_file_bytes:
+                        data.close()
+                        strings.close()
+                        data = strings = None
+                        self.rotations += 1
+            except Exception as e:
+                self.last_error = str(e)
+            if stopping:
+                break
+        if data is not None:
+            data.close()
+            strings.close()
+
+    def stats(self):
+        """Estado del registro para /server_info"""
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'records': self.records,
+            'bytes_written': self.bytes_written,
+            'batches': self.batches,
+            'rotations': self.rotations,
+            'pending': len(self.pending),
+            'last_error': self.last_error
+        }
+
+
+def load(path):
+    """Cargar un fichero .bin: (registros como array estructurado de NumPy, textos, cabecera).
+
+    `textos[registro['text']]` da el texto de un registro (textos[0] es None).
+    """
+    with open(path, 'rb') as f:
+        magic, version, record_size, wall_time, monotonic_time = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path} no es un registro de telemetría compatible")
+    records = np.fromfile(path, dtype=RECORD_DTYPE, offset=HEADER.size)
+    texts = [None]
+    strings_path = path[:-4] + '.strings'
+    if os.path.exists(strings_path):
+        with open(strings_path) as f:
+            texts.extend(json.loads(line) for line in f if line.strip())
+    header = {'version': version, 'wall_time': wall_time, 'monotonic_time': monotonic_time}
+    return records, texts, header
+
+
+def load_directory(directory):
+    """Cargar y concatenar en orden todos los ficheros de un directorio.
+
+    Los ids de texto se renumeran para que apunten a la lista combinada.
+    """
+    all_records, all_texts, headers = [], [None], []
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('telemetry-') and name.endswith('.bin')):
+            continue
+        records, texts, header = load(os.path.join(directory, name))
+        has_text = records['text'] != 0
+        records['text'][has_text] += len(all_texts) - 1
+        all_records.append(records)
+        all_texts.extend(texts[1:])
+        headers.append(header)
+    records = np.concatenate(all_records) if all_records else np.empty(0, dtype=RECORD_DTYPE)
+    return records, all_texts, headers
+
+
+def command_latencies(records):
+    """(id, dispositivo, instante del comando, latencia en ms, éxito) de cada comando con respuesta"""
+    commands = records[records['kind'] == KIND_COMMAND]
+    acks = records[records['kind'] == KIND_ACK]
+    # Índice de la respuesta de cada comando por su id
+    order = np.argsort(acks['ref'], kind='stable')
+    positions = np.searchsorted(acks['ref'][order], commands['ref'])
+    positions = np.minimum(positions, max(len(acks) - 1, 0))
+    matched = acks[order][positions] if len(acks) else acks
+    answered = (matched['ref'] == commands['ref']) if len(acks) else np.zeros(len(commands), bool)
+    commands, matched = commands[answered], matched[answered]
+    return np.rec.fromarrays([
+        commands['ref'], commands['device'], commands['t'], matched['value'],
+        (matched['flags'] & FLAG_SUCCESS) != 0
+    ], names='ref,device,t,latency_ms,success')
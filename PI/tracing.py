@@ -0,0 +1,135 @@
+# Trazas de latencia por frame: de la lectura de la cámara al dibujado en el navegador
+import collections
+import math
+import time
+
+# Etapas de un frame, en orden. Todas en milisegundos del reloj monotónico del
+# servidor; las del navegador se convierten con el desfase que estima el cliente
+STAGES = ('read', 'extracted', 'encoded', 'published', 'emitted', 'received', 'drawn')
+
+# Tramos entre etapas y qué parte del sistema mide cada uno
+SEGMENTS = (
+    ('camera', 'read', 'extracted'),         # Lectura de la tubería/driver y separación del frame
+    ('encode', 'extracted', 'encoded'),      # Codificación JPEG o escalado
+    ('publish', 'encoded', 'published'),     # Anillo de frames, telemetría, grabador
+    ('send_queue', 'published', 'emitted'),  # Espera en la ranura del cliente y envío
+    ('network', 'emitted', 'received'),      # Socket.IO hasta el navegador
+    ('browser', 'received', 'drawn'),        # Decodificación y dibujado
+)
+
+
+# Máximo de frames aceptados en un eco del cliente (un lote por segundo)
+MAX_ECHO_FRAMES = 512
+
+
+def now_ms():
+    return time.monotonic() * 1000
+
+
+def _percentile(values, p):
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))], 1)
+
+
+def _number(value, name, optional=False):
+    if value is None and optional:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{name} debe ser un número finito: {value!r}")
+    return float(value)
+
+
+def validate_echo(data):
+    """Comprobar un lote 'frame_trace' del cliente; devuelve (frames, offset_ms, rtt_ms)"""
+    if not isinstance(data, dict):
+        raise ValueError("El lote de trazas debe ser un objeto")
+    frames = data.get('frames', [])
+    if not isinstance(frames, list) or len(frames) > MAX_ECHO_FRAMES:
+        raise ValueError(f"frames debe ser una lista de como mucho {MAX_ECHO_FRAMES} elementos")
+    validated = []
+    for frame in frames:
+        if not isinstance(frame, (list, tuple)) or len(frame) != 3:
+            raise ValueError(f"Cada frame debe ser [seq, recibido, dibujado]: {frame!r}")
+        seq, received, drawn = frame
+        if isinstance(seq, bool) or not isinstance(seq, int):
+            raise ValueError(f"seq debe ser un entero: {seq!r}")
+        validated.append((seq, _number(received, 'recibido'), _number(drawn, 'dibujado', optional=True)))
+    return (validated, _number(data.get('offset_ms'), 'offset_ms', optional=True),
+            _number(data.get('rtt_ms'), 'rtt_ms', optional=True))
+
+
+class FrameTracer:
+    """Junta las etapas de cada frame por su secuencia y mantiene una ventana
+    móvil de la duración de cada tramo.
+
+    El servidor anota las etapas hasta el envío; el cliente devuelve en lotes
+    cuándo recibió y dibujó cada secuencia, junto con su desfase de reloj
+    estimado. Solo se recuerdan los últimos `max_frames` frames.
+    """
+
+    def __init__(self, window=300, max_frames=256, on_segment=None):
+        self.max_frames = max_frames
+        self.on_segment = on_segment  # on_segment(tramo, ms), p. ej. para /metrics
+        self.frames = collections.OrderedDict()  # seq -> {etapa: ms, 'emitted': {cliente: ms}}
+        self.segments = {name: collections.deque(maxlen=window) for name, _, _ in SEGMENTS}
+        self.totals = collections.deque(maxlen=window)
+        self.clients = {}  # cliente -> {'offset_ms', 'rtt_ms', 'frames'}
+        self.expired = 0   # Ecos de frames ya olvidados
+
+    def published(self, seq, stages, published_ms):
+        """Un frame publicado con las etapas anteriores que trae del bucle de captura"""
+        trace = dict(stages) if stages else {}
+        trace['published'] = published_ms
+        trace['emitted'] = {}
+        self.frames[seq] = trace
+        while len(self.frames) > self.max_frames:
+            self.frames.popitem(last=False)
+
+    def emitted(self, seq, client_id):
+        trace = self.frames.get(seq)
+        if trace is not None:
+            trace['emitted'][client_id] = now_ms()
+
+    def echo(self, client_id, frames, offset_ms, rtt_ms=None):
+        """Tiempos [(seq, recibido, dibujado)] del reloj del cliente; desfase = servidor - cliente"""
+        if offset_ms is None:
+            return
+        client = self.clients.setdefault(client_id, {'offset_ms': None, 'rtt_ms': None, 'frames': 0})
+        client.update(offset_ms=round(offset_ms, 1), rtt_ms=rtt_ms)
+        for seq, received, drawn in frames:
+            trace = self.frames.get(seq)
+            emitted = trace['emitted'].get(client_id) if trace is not None else None
+            if emitted is None:
+                self.expired += 1
+                continue
+            client['frames'] += 1
+            stages = dict(trace, emitted=emitted, received=received + offset_ms,
+                          drawn=drawn + offset_ms if drawn is not None else None)
+            for name, start, end in SEGMENTS:
+                if stages.get(start) is not None and stages.get(end) is not None:
+                    duration = stages[end] - stages[start]
+                    self.segments[name].append(duration)
+                    if self.on_segment is not None:
+                        self.on_segment(name, duration)
+            first = next((stages[stage] for stage in STAGES if stages.get(stage) is not None), None)
+            if stages['drawn'] is not None:
+                self.totals.append(stages['drawn'] - first)
+
+    def forget(self, client_id):
+        self.clients.pop(client_id, None)
+
+    def stats(self):
+        """Desglose móvil por tramo (p50, p95 y media en ms)"""
+        breakdown = {}
+        for name, values in list(self.segments.items()) + [('total', self.totals)]:
+            values = sorted(values)
+            breakdown[name] = {
+                'p50': _percentile(values, 50),
+                'p95': _percentile(values, 95),
+                'mean': round(sum(values) / len(values), 1)
+            } if values else None
+        return {
+            'breakdown': breakdown,
+            'samples': len(self.totals),
+            'expired': self.expired,
+            'clients': dict(self.clients)
+        }
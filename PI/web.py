@@ -2,6 +2,7 @@
 # Importando eventlet primero y aplicando monkey patch
 import eventlet
 eventlet.monkey_patch()
+from eventlet import tpool
 
 # Importaciones estándar
 import os
@@ -11,10 +12,15 @@ import json
 import threading
 import subprocess
 import base64
+import argparse
 import signal
 import socket
 import time
+import uuid
+import collections
+import functools
 import serial
+from concurrent.futures import Future
 
 # Configuración de logging
 logging.basicConfig(
@@ -49,10 +55,29 @@ check_dependencies()
 # Ahora importamos los módulos después de verificar que estén instalados
 import numpy as np
 import cv2
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
 from flask_socketio import SocketIO
 
+# Módulos propios del proyecto
+from mjpeg import MjpegDemuxer
+from h264 import AnnexBSplitter
+from adaptive import AdaptiveController
+from renditions import RENDITIONS, RenditionEncoder, scale_frame
+from capture import NativeCapture
+from framering import FLAG_H264, FLAG_KEYFRAME, FrameRing, FrameView
+from recorder import DashcamRecorder
+from telemetry import TelemetryLog
+from replay import ReplayEngine, ReplaySession
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry
+from tracing import FrameTracer, now_ms, validate_echo
+from profiler import HandlerProfiler, SamplingProfiler
+from hubwatch import HubWatchdog
+from simulator import SimulatedArduino, SyntheticCamera
+from arduino import (REPLACED_RESPONSE, ArduinoLink, discover_arduinos, motor_ack_matcher, open_serial_port,
+                     servo_ack_matcher, motor_opcode, servo_opcode)
+from hotplug import DeviceWatcher
+
 # Matar procesos previos en puertos requeridos
 def kill_processes_on_ports(ports):
     for port in ports:
@@ -118,6 +143,78 @@ socketio = SocketIO(
 # Tipo de dispositivo de cámara
 camera_device = detect_camera()
 
+# Registro binario de comandos, respuestas, ángulos de servo y frames (PI/telemetry).
+# Desactivado por defecto para no escribir continuamente en la tarjeta SD; se activa con --telemetry
+telemetry = TelemetryLog(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'telemetry'), enabled=False)
+
+# Métricas para /metrics; MotorService, CameraService y FrameBroadcaster las alimentan directamente
+metrics = Registry()
+serial_rtt = metrics.histogram('robot_serial_rtt_seconds', "Tiempo desde el envío de un comando hasta su confirmación",
+                               ('device',))
+serial_commands = metrics.counter('robot_serial_commands_total',
+                                  "Comandos serie por resultado (sent, confirmed, failed, coalesced)", ('device', 'result'))
+reconnect_attempts = metrics.counter('robot_serial_reconnect_attempts_total', "Intentos de conexión con un Arduino",
+                                     ('device',))
+reconnect_duration = metrics.histogram('robot_serial_reconnect_duration_seconds',
+                                       "Duración de cada búsqueda de Arduinos", buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30))
+serial_connected = metrics.gauge('robot_serial_connected', "1 si el Arduino está conectado", ('device',),
+                                 function=lambda: {('motores',): int(motor_service.motor_arduino_connected),
+                                                   ('servos',): int(motor_service.servo_arduino_connected)})
+capture_fps = metrics.gauge('robot_capture_fps', "FPS reales de la captura")
+capture_target_fps = metrics.gauge('robot_capture_target_fps', "FPS solicitados a la cámara",
+                                   function=lambda: camera_service.fps)
+frames_captured = metrics.counter('robot_frames_captured_total', "Frames capturados")
+encode_seconds = metrics.histogram('robot_encode_seconds', "Tiempo de codificación JPEG de un frame",
+                                   buckets=(0.001, 0.0025, 0.005, 0.01, 0.02, 0.035, 0.05, 0.1, 0.25))
+emit_seconds = metrics.histogram('robot_emit_seconds', "Tiempo de envío de un frame por Socket.IO", ('protocol',))
+video_clients = metrics.gauge('robot_video_clients', "Clientes de video conectados",
+                              function=lambda: len(camera_service.broadcaster.slots))
+video_bytes_sent = metrics.counter('robot_video_bytes_sent_total', "Bytes de video enviados a cada cliente", ('client',))
+video_frames_sent = metrics.counter('robot_video_frames_sent_total', "Frames enviados a cada cliente", ('client',))
+video_frames_dropped = metrics.counter('robot_video_frames_dropped_total',
+                                       "Frames descartados por cliente lento", ('client',))
+frame_stage_seconds = metrics.histogram('robot_frame_stage_seconds',
+                                        "Duración de cada tramo de un frame, de la cámara al navegador", ('stage',))
+handler_seconds = metrics.histogram('robot_handler_seconds', "Tiempo total de cada manejador (con --instrument)",
+                                    ('handler',))
+handler_blocking_seconds = metrics.histogram('robot_handler_blocking_seconds',
+                                             "Tramo más largo de un manejador sin ceder el hub (con --instrument)",
+                                             ('handler',))
+
+hub_lag_seconds = metrics.histogram('robot_hub_lag_seconds', "Retraso del latido del hub de eventlet",
+                                    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+hub_stalls = metrics.counter('robot_hub_stalls_total', "Bloqueos del hub de eventlet por código responsable", ('site',))
+hub_stall_seconds = metrics.histogram('robot_hub_stall_seconds', "Duración de los bloqueos del hub de eventlet",
+                                      buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+# Vigilancia del hub: retraso del latido y bloqueos atribuidos (sitios registrados tras crear los servicios)
+hub_watchdog = HubWatchdog(
+    on_lag=hub_lag_seconds.observe,
+    on_stall=lambda stall: (hub_stalls.labels(stall['site']).inc(),
+                            hub_stall_seconds.observe(stall['duration_ms'] / 1000)))
+
+# Instrumentación opcional de manejadores y perfil por muestreo (--instrument, --profile-hz)
+handler_profiler = HandlerProfiler(on_call=lambda name, wall, blocking: (
+    handler_seconds.labels(name).observe(wall), handler_blocking_seconds.labels(name).observe(blocking)))
+sampling_profiler = None
+
+# Arduinos simulados {rol: SimulatedArduino} en modo simulación
+simulators = {}
+
+# Manejadores Socket.IO cuyas entradas se graban y se pueden reproducir (modo replay)
+REPLAY_HANDLERS = {}
+
+def record_input(event):
+    """Grabar en la telemetría cada entrada del evento de control `event`"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args):
+            telemetry.input(event, args)
+            return handler(*args)
+        REPLAY_HANDLERS[event] = handler
+        return wrapper
+    return decorator
+
 # Clase para gestionar el control de motores
 # Modificar la clase MotorService para separar los motores de los servos
 
@@ -125,12 +222,33 @@ class MotorService:
     def __init__(self):
         self.motor_arduino = None
         self.servo_arduino = None
+        self.motor_link = None  # Enlace con hilo lector del Arduino de motores
+        self.servo_link = None  # Enlace con hilo lector del Arduino de servos
+        # Velocidades a negociar al conectar, de mayor a menor (el firmware antiguo queda a 9600)
+        self.baud_rates = [115200, 57600, 9600]
+        # Negociar el protocolo binario al conectar (el firmware antiguo sigue en texto)
+        self.binary_protocol = True
+        # Leer los puertos con tpool (lo activa la vigilancia del hub si las lecturas lo bloquean)
+        self.serial_offload = False
         self.motor_arduino_connected = False
         self.servo_arduino_connected = False
         self.last_motor_command = None
         self.last_servo_command = None
+        self.motor_arduino_port = None
+        self.servo_arduino_port = None
+        self.resolved_ports = {}  # Ruta by-id -> nodo real, para reconocer la desconexión
+        # Caché de puertos por rol (rutas estables de /dev/serial/by-id)
+        self.port_cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'arduino_ports.json')
+        self.discovery_lock = threading.Lock()
         self.reconnect_thread = None
         self.reconnect_active = False
+        # Puertos inyectados con use_ports (simulación o replay): no se descubre nada
+        self.ports_injected = False
+        # Se activa cuando cambian los dispositivos serie o se pierde un enlace
+        self.devices_changed = threading.Event()
+        # Margen para que udev cree los enlaces by-id y ajuste permisos tras conectar
+        self.hotplug_settle = 0.3
+        self.device_watcher = DeviceWatcher(self._on_device_event)
         self.motor_status = {
             'mode': 'off',
             'motor1': {'speed': 0, 'direction': 'forward'},
@@ -144,248 +262,245 @@ class MotorService:
         }
         # Iniciar intento de conexión automática
         self.reconnect_active = True
+        self.devices_changed.set()
+        self.device_watcher.start()
         self.reconnect_thread = threading.Thread(target=self._auto_reconnect)
         self.reconnect_thread.daemon = True
         self.reconnect_thread.start()
 
     def _auto_reconnect(self):
-        """Intenta reconectar automáticamente con ambos Arduinos"""
-        retry_delay = 5  # Segundos iniciales entre intentos
-        max_retry_delay = 30  # Máximo retraso entre intentos
+        """Conecta los Arduinos que falten cada vez que cambian los dispositivos serie"""
         while self.reconnect_active:
-            # Intentar conectar con Arduino de motores
+            # Sin eventos no se prueba ningún puerto
+            self.devices_changed.wait()
+            if not self.reconnect_active:
+                break
+            time.sleep(self.hotplug_settle)
+            self.devices_changed.clear()
+
+            missing = []
             if not self.motor_arduino_connected:
-                logger.info("Intentando conectar con Arduino de motores...")
-                if self.init_motor_arduino():
-                    logger.info("¡Conexión con Arduino de motores establecida!")
-                    # Si hay un comando anterior, reenviar
-                    if self.last_motor_command:
-                        logger.info(f"Reenviando último comando de motor: {self.last_motor_command}")
-                        self.send_motor_command(self.last_motor_command)
-                    retry_delay = 5  # Resetear el retraso si conectamos exitosamente
-                else:
-                    # Incrementar el retraso exponencialmente hasta el máximo
-                    retry_delay = min(retry_delay * 1.5, max_retry_delay)
-            
-            # Intentar conectar con Arduino de servos
+                missing.append('motores')
             if not self.servo_arduino_connected:
-                logger.info("Intentando conectar con Arduino de servos...")
-                if self.init_servo_arduino():
-                    logger.info("¡Conexión con Arduino de servos establecida!")
-                    # Arduino de servos se auto-calibra al iniciar
-                    retry_delay = 5  # Resetear el retraso si conectamos exitosamente
-                else:
-                    # Incrementar el retraso exponencialmente hasta el máximo
-                    retry_delay = min(retry_delay * 1.5, max_retry_delay)
-            
-            # Esperar antes del próximo intento
-            time.sleep(retry_delay)
+                missing.append('servos')
+            if not missing:
+                continue
 
-    def init_motor_arduino(self):
-        """Inicializa la conexión con Arduino de motores"""
+            # Una sola pasada de descubrimiento para todos los Arduinos que faltan
+            logger.info(f"Buscando Arduinos: {', '.join(missing)}...")
+            motors_were_connected = self.motor_arduino_connected
+            self.init_arduinos(missing)
+
+            # Si hay un comando anterior, reenviar
+            if self.motor_arduino_connected and not motors_were_connected and self.last_motor_command:
+                logger.info(f"Reenviando último comando de motor: {self.last_motor_command}")
+                self.send_motor_command(self.last_motor_command)
+
+    def _on_device_event(self, action, path):
+        """Evento de conexión/desconexión de un puerto serie"""
+        if action == 'remove':
+            # Cerrar de inmediato el enlace cuyo dispositivo desapareció
+            for port, connected, on_disconnect in (
+                    (self.motor_arduino_port, self.motor_arduino_connected, self._on_motor_disconnect),
+                    (self.servo_arduino_port, self.servo_arduino_connected, self._on_servo_disconnect)):
+                # El enlace by-id ya no existe: comparar por nombre del nodo resuelto al conectar
+                if connected and port and os.path.basename(self._resolved_port(port)) == os.path.basename(path):
+                    on_disconnect()
+            return
+        if not (self.motor_arduino_connected and self.servo_arduino_connected):
+            self.devices_changed.set()
+
+    def _resolved_port(self, port):
+        """Nodo /dev/tty* al que apuntaba el puerto cuando se conectó"""
+        return self.resolved_ports.get(port, port)
+
+    def init_arduinos(self, roles=('motores', 'servos')):
+        """Descubre e inicializa los Arduinos indicados; True si se conectaron todos"""
+        if self.ports_injected:
+            # Cerrar los puertos inyectados y buscar placas reales rompería la simulación o el replay
+            connected = {'motores': self.motor_arduino_connected, 'servos': self.servo_arduino_connected}
+            return all(connected[role] for role in roles)
+        if not self.discovery_lock.acquire(blocking=False):
+            # Ya hay un descubrimiento en curso: abrir los puertos de nuevo reiniciaría las placas
+            logger.info("Descubrimiento de Arduinos ya en curso")
+            return False
+        started = time.monotonic()
+        for role in roles:
+            reconnect_attempts.labels(role).inc()
         try:
-            # Cerrar conexión previa si existe
-            if self.motor_arduino is not None and self.motor_arduino.is_open:
-                self.motor_arduino.close()
-                time.sleep(0.5)  # Esperar a que se cierre correctamente
-                
-            # Intentar diferentes puertos serie comunes en Raspberry Pi
-            # Para Arduino de motores (probamos primero ttyACM0 y ttyUSB0)
-            potential_ports = ['/dev/ttyACM0', '/dev/ttyUSB0', '/dev/ttyACM1', '/dev/ttyUSB1']
-            
-            for port in potential_ports:
+            # Los puertos ya conectados no se prueban: abrirlos reinicia el Arduino
+            in_use = []
+            if self.motor_arduino_connected and 'motores' not in roles:
+                in_use.append(self.motor_arduino_port)
+            if self.servo_arduino_connected and 'servos' not in roles:
+                in_use.append(self.servo_arduino_port)
+            for role in roles:
+                self._close_arduino(role)
+
+            found = discover_arduinos(roles, exclude=in_use, cache_path=self.port_cache_path)
+            for role, (path, port) in found.items():
                 try:
-                    # Intentar abrir la conexión con un timeout más largo
-                    self.motor_arduino = serial.Serial(port, 9600, timeout=2)
-                    time.sleep(2)  # Esperar a que Arduino se reinicie
-                    
-                    # Limpiar buffer de entrada por si hay datos residuales
-                    self.motor_arduino.reset_input_buffer()
-                    
-                    # Prueba básica para verificar comunicación (con retry)
-                    max_retries = 3
-                    for retry in range(max_retries):
-                        try:
-                            self.motor_arduino.write("off,0\n".encode())
-                            # Usar un timeout específico para la lectura
-                            start_time = time.time()
-                            response = ""
-                            while time.time() - start_time < 2.0:  # 2 segundos de timeout
-                                if self.motor_arduino.in_waiting > 0:
-                                    line = self.motor_arduino.readline().decode().strip()
-                                    response += line
-                                    if "Motores apagados" in response:
-                                        break
-                                # Usar eventlet.sleep para ser compatible con el loop de eventos
-                                eventlet.sleep(0.1)
-                                
-                            if "Motores apagados" in response:
-                                logger.info(f"Conexión con Arduino de motores establecida en {port}")
-                                self.motor_arduino_connected = True
-                                # Actualizar estado de motores
-                                self.motor_status['mode'] = 'off'
-                                for motor in range(1, 5):
-                                    self.motor_status[f'motor{motor}']['speed'] = 0
-                                # Emitir estado actualizado a todos los clientes
-                                socketio.emit('motor_status', self.motor_status)
-                                
-                                # Guardar puerto para evitar conflicto con servo Arduino
-                                self.motor_arduino_port = port
-                                return True
-                            
-                            logger.warning(f"Intento {retry+1} fallido, reintentando...")
-                            time.sleep(0.5)
-                        except Exception as e:
-                            logger.warning(f"Error en intento {retry+1}: {str(e)}")
-                            time.sleep(0.5)
-                    
-                    # Si llegamos aquí, no se pudo conectar después de varios intentos
-                    if self.motor_arduino and self.motor_arduino.is_open:
-                        self.motor_arduino.close()
+                    if role == 'motores':
+                        self._attach_motor_arduino(path, port)
+                    else:
+                        self._attach_servo_arduino(path, port)
                 except Exception as e:
-                    logger.debug(f"No se pudo conectar a {port}: {str(e)}")
-                    continue
-            
-            logger.error("No se pudo establecer conexión con Arduino de motores en ningún puerto")
-            self.motor_arduino_connected = False
-            return False
-        
+                    logger.error(f"Error al inicializar Arduino de {role}: {str(e)}")
+                    self._close_arduino(role)
+
+            for role in roles:
+                if role not in found:
+                    logger.error(f"No se pudo establecer conexión con Arduino de {role} en ningún puerto")
+            return all(role in found for role in roles)
         except Exception as e:
-            logger.error(f"Error al inicializar Arduino de motores: {str(e)}")
-            self.motor_arduino_connected = False
+            logger.error(f"Error al buscar Arduinos: {str(e)}")
             return False
+        finally:
+            reconnect_duration.observe(time.monotonic() - started)
+            self.discovery_lock.release()
+
+    def init_arduino(self):
+        """Inicializa la conexión con ambos Arduinos"""
+        return self.init_arduinos()
+
+    def init_motor_arduino(self):
+        """Inicializa la conexión con Arduino de motores"""
+        return self.init_arduinos(('motores',))
 
     def init_servo_arduino(self):
         """Inicializa la conexión con Arduino de servos"""
-        try:
-            # Cerrar conexión previa si existe
-            if self.servo_arduino is not None and self.servo_arduino.is_open:
-                self.servo_arduino.close()
-                time.sleep(0.5)  # Esperar a que se cierre correctamente
-                
-            # Intentar diferentes puertos serie evitando el puerto ya usado por el Arduino de motores
-            potential_ports = ['/dev/ttyACM0', '/dev/ttyUSB0', '/dev/ttyACM1', '/dev/ttyUSB1']
-            
-            # Reordenar la lista para probar primero puertos diferentes al del Arduino de motores
-            if hasattr(self, 'motor_arduino_port') and self.motor_arduino_port in potential_ports:
-                potential_ports.remove(self.motor_arduino_port)
-                potential_ports.append(self.motor_arduino_port)  # Lo movemos al final
-            
-            for port in potential_ports:
-                # Evitar probar el puerto ya usado por el Arduino de motores
-                if hasattr(self, 'motor_arduino_port') and port == self.motor_arduino_port:
-                    continue
-                    
-                try:
-                    # Intentar abrir la conexión
-                    self.servo_arduino = serial.Serial(port, 9600, timeout=2)
-                    time.sleep(2)  # Esperar a que Arduino se reinicie
-                    
-                    # Limpiar buffer de entrada
-                    self.servo_arduino.reset_input_buffer()
-                    
-                    # Comprobar si este es el Arduino de servos
-                    # Enviar comando para verificar servo
-                    self.servo_arduino.write("servo,mg995,stop\n".encode())
-                    
-                    # Esperar respuesta
-                    start_time = time.time()
-                    response = ""
-                    while time.time() - start_time < 2.0:
-                        if self.servo_arduino.in_waiting > 0:
-                            line = self.servo_arduino.readline().decode().strip()
-                            response += line + " "
-                            # Si contiene alguna respuesta relacionada con servos
-                            if "servo" in line.lower() or "mg995" in line.lower() or "ds04" in line.lower():
-                                logger.info(f"Conexión con Arduino de servos establecida en {port}")
-                                self.servo_arduino_connected = True
-                                
-                                # Esperar posibles mensajes de calibración
-                                time.sleep(1)
-                                while self.servo_arduino.in_waiting > 0:
-                                    self.servo_arduino.readline()  # Limpiar buffer
-                                
-                                # Emitir estado actual de servos a todos los clientes
-                                socketio.emit('servo_status', {'status': self.servo_status})
-                                return True
-                        # Pausar brevemente
-                        eventlet.sleep(0.1)
-                    
-                    # Si llegamos aquí, no es el Arduino de servos
-                    logger.debug(f"El dispositivo en {port} no respondió como Arduino de servos")
-                    if self.servo_arduino and self.servo_arduino.is_open:
-                        self.servo_arduino.close()
-                except Exception as e:
-                    logger.debug(f"No se pudo conectar a {port}: {str(e)}")
-                    continue
-            
-            logger.error("No se pudo establecer conexión con Arduino de servos en ningún puerto")
-            self.servo_arduino_connected = False
-            return False
-        
-        except Exception as e:
-            logger.error(f"Error al inicializar Arduino de servos: {str(e)}")
+        return self.init_arduinos(('servos',))
+
+    def use_ports(self, ports):
+        """Conectar puertos ya abiertos {rol: puerto} (p. ej. simulados) sin descubrimiento ni hotplug"""
+        self.ports_injected = True
+        self.reconnect_active = False
+        self.devices_changed.set()
+        self.device_watcher.stop()
+        with self.discovery_lock:
+            for role, port in ports.items():
+                self._close_arduino(role)
+                path = getattr(port, 'port', None) or f"virtual:{role}"
+                if role == 'motores':
+                    self._attach_motor_arduino(path, port)
+                else:
+                    self._attach_servo_arduino(path, port)
+    
+    def _close_arduino(self, role):
+        """Cierra la conexión previa con un Arduino si existe"""
+        if role == 'motores':
+            link, port = self.motor_link, self.motor_arduino
+            self.motor_link = None
+            self.motor_arduino_connected = False
+        else:
+            link, port = self.servo_link, self.servo_arduino
+            self.servo_link = None
             self.servo_arduino_connected = False
-            return False
+        if link is not None:
+            link.close()
+        elif port is not None and port.is_open:
+            try:
+                port.close()
+            except:
+                pass
+
+    def _attach_motor_arduino(self, path, port):
+        """Crea el enlace con el Arduino de motores ya identificado en `port`"""
+        self.motor_arduino = port
+        # Guardar puerto para evitar conflicto con servo Arduino
+        self.motor_arduino_port = path
+        self.resolved_ports[path] = os.path.realpath(path)
+        # A partir de aquí un hilo lector procesa todas las respuestas
+        self.motor_link = ArduinoLink('motores', port,
+                                      on_event=self._on_motor_event,
+                                      on_disconnect=self._on_motor_disconnect,
+                                      encoder=motor_opcode)
+        self.motor_link.offload_reads = self.serial_offload
+        self.motor_link.start()
+        self.motor_link.negotiate_baudrate(self.baud_rates)
+        if self.binary_protocol:
+            self.motor_link.negotiate_binary()
+        self.motor_link.send("off,0", match=motor_ack_matcher("off,0"), priority=True)
+        self.motor_arduino_connected = True
+        logger.info(f"Conexión con Arduino de motores establecida en {path}")
+        # Actualizar estado de motores
+        self.motor_status['mode'] = 'off'
+        for motor in range(1, 5):
+            self.motor_status[f'motor{motor}']['speed'] = 0
+        # Emitir estado actualizado a todos los clientes
+        socketio.emit('motor_status', self.motor_status)
+
+    def _attach_servo_arduino(self, path, port):
+        """Crea el enlace con el Arduino de servos ya identificado en `port`"""
+        self.servo_arduino = port
+        self.servo_arduino_port = path
+        self.resolved_ports[path] = os.path.realpath(path)
+        # A partir de aquí un hilo lector procesa todas las respuestas
+        self.servo_link = ArduinoLink('servos', port,
+                                      on_event=self._on_servo_event,
+                                      on_disconnect=self._on_servo_disconnect,
+                                      encoder=servo_opcode)
+        self.servo_link.offload_reads = self.serial_offload
+        self.servo_link.start()
+        self.servo_link.negotiate_baudrate(self.baud_rates)
+        if self.binary_protocol:
+            self.servo_link.negotiate_binary()
+        self.servo_arduino_connected = True
+        logger.info(f"Conexión con Arduino de servos establecida en {path}")
+        # Emitir estado actual de servos a todos los clientes
+        socketio.emit('servo_status', {'status': self.servo_status})
 
-    def send_motor_command(self, command):
-        """Envía un comando de control a los motores"""
+    def submit_motor_command(self, command):
+        """Envía un comando a los motores y devuelve un Future con (success, response)"""
         try:
             if not self.motor_arduino_connected:
                 # Intentar reconectar si no hay conexión
                 if not self.init_motor_arduino():
                     logger.error("No hay conexión con Arduino de motores")
-                    return False, "No hay conexión con Arduino de motores"
+                    return self._completed(False, "No hay conexión con Arduino de motores")
             
-            if self.motor_arduino and self.motor_arduino.is_open:
+            if self.motor_link and self.motor_link.active:
                 # Guardar el comando para posibles reconexiones
                 self.last_motor_command = command
                 
-                # Enviar comando al Arduino
-                full_command = f"{command}\n"
-                self.motor_arduino.write(full_command.encode())
+                # Encolar el comando: la consigna de marcha más reciente reemplaza a la no enviada
+                # y el apagado se adelanta a la cola descartando las consignas pendientes
+                future = self.motor_link.send(command, match=motor_ack_matcher(command), timeout=1.0,
+                                              coalesce='drive', priority=(command == "off,0"))
                 logger.info(f"Comando enviado a motores: {command}")
-                
-                # Leer respuesta (con timeout)
-                start_time = time.time()
-                response = ""
-                while time.time() - start_time < 1.0:  # Timeout de 1 segundo
-                    if self.motor_arduino.in_waiting > 0:
-                        response += self.motor_arduino.readline().decode().strip()
-                        if response:
-                            break
-                    time.sleep(0.1)
+                serial_commands.labels('motores', 'sent').inc()
+                self._track_command(future, 'motores', command, telemetry.command('motores', command))
                 
                 # Actualizar estado interno y notificar a clientes
                 self._update_motor_status(command)
                 socketio.emit('motor_status', self.motor_status)
-                
-                return True, response or "Comando enviado"
+                return future
             
-            return False, "Puerto serie no disponible"
+            return self._completed(False, "Puerto serie no disponible")
         
         except Exception as e:
             logger.error(f"Error al enviar comando al motor: {str(e)}")
             # Marcar Arduino como desconectado para forzar reconexión
-            self.motor_arduino_connected = False
-            # Cerrar puerto para evitar bloqueo
-            if self.motor_arduino and self.motor_arduino.is_open:
-                try:
-                    self.motor_arduino.close()
-                except:
-                    pass
-            return False, f"Error: {str(e)}"
+            self._on_motor_disconnect()
+            return self._completed(False, f"Error: {str(e)}")
+    
+    def send_motor_command(self, command, wait=False):
+        """Envía un comando de control a los motores sin esperar la respuesta salvo con wait=True"""
+        future = self.submit_motor_command(command)
+        if wait or future.done():
+            return future.result()
+        return True, "Comando enviado"
     
-    def send_servo_command(self, servo_type, action, params=None):
-        """Envía un comando de control a los servos con mejor manejo de errores"""
+    def submit_servo_command(self, servo_type, action, params=None):
+        """Envía un comando a los servos y devuelve un Future con (success, response)"""
         try:
             if not self.servo_arduino_connected:
                 # Intentar reconectar si no hay conexión
                 if not self.init_servo_arduino():
                     logger.error("No hay conexión con Arduino de servos")
-                    return False, "No hay conexión con Arduino de servos"
+                    return self._completed(False, "No hay conexión con Arduino de servos")
             
-            if self.servo_arduino and self.servo_arduino.is_open:
+            if self.servo_link and self.servo_link.active:
                 # Construir el comando
                 command = f"servo,{servo_type},{action}"
                 if params:
@@ -394,83 +509,200 @@ class MotorService:
                 # Guardar el comando para posibles reconexiones
                 self.last_servo_command = command
                 
-                # Enviar comando al Arduino
-                full_command = f"{command}\n"
-                self.servo_arduino.write(full_command.encode())
-                logger.info(f"Comando de servo enviado: {command}")
-                
-                # Leer respuesta (con timeout extendido para comandos importantes)
-                start_time = time.time()
+                # Encolar el comando (timeout extendido para comandos importantes). Los
+                # movimientos y paradas de un mismo servo se reemplazan entre sí, y una
+                # parada con prioridad se adelanta a la cola
                 timeout = 2.0 if action in ["stop", "move"] else 1.0
-                response = ""
-                
-                while time.time() - start_time < timeout:
-                    if self.servo_arduino.in_waiting > 0:
-                        line = self.servo_arduino.readline().decode().strip()
-                        response += line + "\n"
-                        
-                        # Si es una actualización de ángulo del servo, procesarla
-                        if line.startswith("servo_angle"):
-                            parts = line.split(',')
-                            if len(parts) >= 3:
-                                servo_name = parts[1]
-                                try:
-                                    angle = int(parts[2])
-                                    self._update_servo_angle(servo_name, angle)
-                                except ValueError:
-                                    logger.warning(f"Valor de ángulo no válido: {parts[2]}")
-                        
-                        # Si es una confirmación de detención, procesarla
-                        elif line.startswith("servo_stopped"):
-                            parts = line.split(',')
-                            if len(parts) >= 2:
-                                servo_name = parts[1]
-                                self.servo_status[servo_name]['moving'] = False
-                                socketio.emit('servo_stopped', {
-                                    'servo_type': servo_name,
-                                    'success': True
-                                })
-                        
-                        # Considerar la respuesta como completa si contiene información relevante
-                        if (line and not line.startswith("servo_angle") and
-                            not line.startswith("servo_stopped")):
-                            break
-                    
-                    # Usar tiempo de espera compatible con el loop de eventos
-                    eventlet.sleep(0.05)
+                coalesce = f"{servo_type}:move" if action in ["stop", "move"] else None
+                priority = action == "stop" and "priority" in (params or "")
+                future = self.servo_link.send(command, match=servo_ack_matcher(servo_type, action),
+                                              timeout=timeout, coalesce=coalesce, priority=priority)
+                logger.info(f"Comando de servo enviado: {command}")
+                serial_commands.labels('servos', 'sent').inc()
+                self._track_command(future, 'servos', command, telemetry.command('servos', command))
                 
                 # Actualizar estado interno basado en el comando
                 self._update_servo_status(servo_type, action, params)
                 
                 # Notificar a clientes sobre el nuevo estado
                 socketio.emit('servo_status', {'status': self.servo_status})
-                
-                return True, response.strip() or "Comando de servo enviado"
+                return future
             
-            return False, "Puerto serie no disponible"
+            return self._completed(False, "Puerto serie no disponible")
         
         except Exception as e:
             logger.error(f"Error al enviar comando al servo: {str(e)}")
             # Marcar Arduino como desconectado para forzar reconexión
-            self.servo_arduino_connected = False
-            # Cerrar puerto para evitar bloqueo
-            if self.servo_arduino and self.servo_arduino.is_open:
-                try:
-                    self.servo_arduino.close()
-                except:
-                    pass
-            return False, f"Error: {str(e)}"
+            self._on_servo_disconnect()
+            return self._completed(False, f"Error: {str(e)}")
+    
+    def send_servo_command(self, servo_type, action, params=None, wait=False):
+        """Envía un comando de control a los servos sin esperar la respuesta salvo con wait=True"""
+        future = self.submit_servo_command(servo_type, action, params)
+        if wait or future.done():
+            return future.result()
+        return True, "Comando de servo enviado"
     
-    # El resto de los métodos (_update_motor_status, _update_servo_status, etc.) se mantienen igual
+    def offload_serial_reads(self):
+        """Leer los puertos serie en hilos nativos (tpool) a partir de ahora"""
+        self.serial_offload = True
+        for link in (self.motor_link, self.servo_link):
+            if link is not None:
+                link.offload_reads = True
+    
+    def link_stats(self):
+        """Métricas de las colas y enlaces serie de ambos Arduinos"""
+        return {
+            'motores': self.motor_link.stats() if self.motor_link else None,
+            'servos': self.servo_link.stats() if self.servo_link else None,
+            'hotplug': {'backend': self.device_watcher.backend, 'events': self.device_watcher.events}
+        }
+    
+    def _completed(self, success, response):
+        """Future ya resuelto para los errores detectados antes de enviar"""
+        future = Future()
+        future.set_result((success, response))
+        return future
+    
+    def _track_command(self, future, device, command, ref=0):
+        """Registrar y notificar la respuesta del Arduino cuando llegue"""
+        sent = time.monotonic()
+        
+        def done(f):
+            success, response = f.result()
+            elapsed = time.monotonic() - sent
+            latency_ms = round(elapsed * 1000, 1)
+            telemetry.ack(device, ref, success, response, latency_ms)
+            if response == REPLACED_RESPONSE:
+                serial_commands.labels(device, 'coalesced').inc()
+            elif success:
+                serial_commands.labels(device, 'confirmed').inc()
+                serial_rtt.labels(device).observe(elapsed)
+            else:
+                serial_commands.labels(device, 'failed').inc()
+            if success:
+                logger.info(f"Respuesta de {device} en {latency_ms} ms: {response}")
+            else:
+                logger.warning(f"Comando de {device} sin confirmar ({command}): {response}")
+            socketio.emit('command_ack', {
+                'device': device,
+                'command': command,
+                'success': success,
+                'response': response,
+                'latency_ms': latency_ms
+            })
+        
+        future.add_done_callback(done)
+    
+    def _on_motor_event(self, kind, data):
+        """Eventos del hilo lector del Arduino de motores"""
+        if kind == 'error':
+            logger.warning(f"Arduino de motores: {data['line']}")
+    
+    def _on_servo_event(self, kind, data):
+        """Eventos del hilo lector del Arduino de servos; la telemetría se reenvía al instante"""
+        if kind == 'servo_angle':
+            telemetry.servo_angle(data['servo_type'], data['angle'])
+            self._update_servo_angle(data['servo_type'], data['angle'])
+        elif kind == 'servo_stopped':
+            servo_name = data['servo_type']
+            if servo_name in self.servo_status:
+                self.servo_status[servo_name]['moving'] = False
+            socketio.emit('servo_stopped', {
+                'servo_type': servo_name,
+                'success': True
+            })
+        elif kind == 'error':
+            logger.warning(f"Arduino de servos: {data['line']}")
+    
+    def _on_motor_disconnect(self):
+        """Marcar Arduino de motores como desconectado para forzar reconexión"""
+        self.motor_arduino_connected = False
+        if self.motor_link is not None:
+            self.motor_link.close()
+        elif self.motor_arduino and self.motor_arduino.is_open:
+            try:
+                self.motor_arduino.close()
+            except:
+                pass
+        # Buscar de nuevo por si el enlace cayó sin que se desconectara el USB
+        self.devices_changed.set()
+    
+    def _on_servo_disconnect(self):
+        """Marcar Arduino de servos como desconectado para forzar reconexión"""
+        self.servo_arduino_connected = False
+        if self.servo_link is not None:
+            self.servo_link.close()
+        elif self.servo_arduino and self.servo_arduino.is_open:
+            try:
+                self.servo_arduino.close()
+            except:
+                pass
+        # Buscar de nuevo por si el enlace cayó sin que se desconectara el USB
+        self.devices_changed.set()
+    
+    def _update_motor_status(self, command):
+        """Actualizar el estado de los motores a partir del comando enviado"""
+        parts = command.split(',')
+        mode = parts[0]
+        if mode == 'off':
+            self.motor_status['mode'] = 'off'
+            for motor in range(1, 5):
+                self.motor_status[f'motor{motor}']['speed'] = 0
+            return
+        
+        # Pares (velocidad, dirección) según el modo
+        if mode == 'synchronized' and len(parts) >= 3:
+            pairs = [(parts[1], parts[2])] * 4
+        elif mode == 'differential' and len(parts) >= 5:
+            pairs = [(parts[1], parts[2])] * 2 + [(parts[3], parts[4])] * 2
+        elif mode == 'independent' and len(parts) >= 9:
+            pairs = [(parts[i], parts[i + 1]) for i in range(1, 9, 2)]
+        else:
+            return
+        
+        self.motor_status['mode'] = mode
+        for motor, (speed, direction) in enumerate(pairs, start=1):
+            self.motor_status[f'motor{motor}']['speed'] = int(speed)
+            self.motor_status[f'motor{motor}']['direction'] = 'reverse' if direction.startswith('reverse') else 'forward'
+    
+    def _update_servo_status(self, servo_type, action, params=None):
+        """Actualizar el estado de un servo a partir del comando enviado"""
+        status = self.servo_status.get(servo_type)
+        if status is None:
+            return
+        values = params.split(',') if params else []
+        if action == 'move' and len(values) >= 2:
+            status['speed'] = int(values[1])
+            # La calibración es inmediata; el resto de movimientos termina con servo_angle
+            status['moving'] = 'calibration' not in values
+        elif action == 'stop':
+            status['moving'] = False
+        elif action == 'speed' and values:
+            status['speed'] = int(values[0])
+        elif action == 'reverse':
+            status['reverse'] = not status['reverse']
+        elif action == 'limit' and values:
+            status['limit'] = int(values[0])
+    
+    def _update_servo_angle(self, servo_name, angle):
+        """Actualizar el ángulo reportado por el Arduino y notificar a los clientes si cambió"""
+        status = self.servo_status.get(servo_name)
+        if status is None or status['angle'] == angle:
+            return
+        status['angle'] = angle
+        socketio.emit('servo_angle', {
+            'servo_type': servo_name,
+            'angle': angle
+        })
     
     def stop_motors(self):
         """Detiene todos los motores y cierra la conexión"""
         try:
             if self.motor_arduino and self.motor_arduino.is_open:
-                self.send_motor_command("off,0")
-                time.sleep(0.5)
-                self.motor_arduino.close()
-            self.motor_arduino_connected = False
+                # Esperar la confirmación del Arduino antes de cerrar el puerto
+                self.send_motor_command("off,0", wait=True)
+            self._on_motor_disconnect()
             return True
         except Exception as e:
             logger.error(f"Error al detener motores: {str(e)}")
@@ -480,13 +712,12 @@ class MotorService:
         """Detiene todos los servos y cierra la conexión"""
         try:
             if self.servo_arduino and self.servo_arduino.is_open:
-                # Detener ambos servos
-                self.send_servo_command("mg995", "stop")
-                time.sleep(0.2)
-                self.send_servo_command("ds04", "stop")
-                time.sleep(0.5)
-                self.servo_arduino.close()
-            self.servo_arduino_connected = False
+                # Detener ambos servos y esperar las confirmaciones antes de cerrar el puerto
+                mg995 = self.submit_servo_command("mg995", "stop")
+                ds04 = self.submit_servo_command("ds04", "stop")
+                mg995.result()
+                ds04.result()
+            self._on_servo_disconnect()
             return True
         except Exception as e:
             logger.error(f"Error al detener servos: {str(e)}")
@@ -497,11 +728,315 @@ class MotorService:
         motor_stopped = self.stop_motors()
         servo_stopped = self.stop_servos()
         self.reconnect_active = False
+        self.devices_changed.set()
+        self.device_watcher.stop()
         if self.reconnect_thread and self.reconnect_thread.is_alive():
             self.reconnect_thread.join(timeout=1)
         logger.info("Todos los dispositivos detenidos")
         return motor_stopped and servo_stopped
 
+# Clase para repartir los frames de video a cada cliente
+class FrameBroadcaster:
+    """Codifica cada frame una sola vez y lo entrega a cada cliente a través de una
+    ranura con el último frame: los clientes lentos descartan frames viejos en vez
+    de acumularlos en cola"""
+
+    def __init__(self, ack_timeout=1.0, max_video_backlog=30):
+        self.ack_timeout = ack_timeout
+        # H.264 no admite descartar frames sueltos: los clientes lentos acumulan
+        # hasta este número y después saltan al siguiente keyframe
+        self.max_video_backlog = max_video_backlog
+        self.slots = {}
+        self.seq = 0
+        # Etapas de cada frame hasta el navegador (los clientes devuelven recepción y dibujado)
+        self.tracer = FrameTracer(on_segment=lambda stage, ms: frame_stage_seconds.labels(stage).observe(ms / 1000))
+
+    def add_client(self, client_id, transport='socketio'):
+        slot = {
+            'transport': transport,
+            # Los clientes HTTP reciben el JPEG tal cual; los de Socket.IO antiguos, base64
+            'protocol': 'mjpeg' if transport == 'http' else 'base64',
+            'ack': False,           # Si el cliente confirma cada frame recibido
+            'frame': None,          # Último frame pendiente de enviar
+            'codecs': set(),        # Códecs de video que el cliente sabe decodificar
+            'rendition': 'full',    # Versión del video que recibe (full, half, thumb)
+            'chunks': collections.deque(),  # Frames H.264 pendientes, en orden
+            'need_keyframe': True,  # El decodificador del cliente espera un keyframe
+            'event': threading.Event(),
+            'ack_event': threading.Event(),
+            'active': True,
+            'sent': 0,
+            'dropped': 0,
+            'bytes_sent': 0,
+            'lag_ms': 0.0,
+            'max_lag_ms': 0.0,
+            'ack_timeouts': 0,
+            'bytes_metric': video_bytes_sent.labels(client_id),
+            'sent_metric': video_frames_sent.labels(client_id),
+            'dropped_metric': video_frames_dropped.labels(client_id)
+        }
+        self.slots[client_id] = slot
+        if transport == 'http':
+            # Los clientes HTTP consumen su ranura con iter_frames()
+            return
+        sender = threading.Thread(target=self._sender, args=(client_id, slot))
+        sender.daemon = True
+        sender.start()
+
+    def remove_client(self, client_id):
+        slot = self.slots.pop(client_id, None)
+        for metric in (video_bytes_sent, video_frames_sent, video_frames_dropped):
+            metric.remove(client_id)
+        self.tracer.forget(client_id)
+        if slot:
+            slot['active'] = False
+            slot['event'].set()
+            slot['ack_event'].set()
+
+    def set_protocol(self, client_id, protocol, ack=False, codecs=()):
+        slot = self.slots.get(client_id)
+        if slot is None or slot['transport'] != 'socketio' or protocol not in ('binary', 'base64'):
+            return False
+        slot['protocol'] = protocol
+        slot['ack'] = bool(ack)
+        # H.264 solo viaja como mensaje binario
+        slot['codecs'] = set(codecs) if protocol == 'binary' else set()
+        return True
+
+    def set_rendition(self, client_id, rendition):
+        slot = self.slots.get(client_id)
+        if slot is None or rendition not in RENDITIONS:
+            return False
+        slot['rendition'] = rendition
+        return True
+
+    def renditions_in_use(self):
+        """Renditions con al menos un suscriptor"""
+        return {slot['rendition'] for slot in list(self.slots.values())}
+
+    def supports(self, codec):
+        """True si todos los clientes conectados pueden decodificar `codec`"""
+        slots = list(self.slots.values())
+        # Las renditions reducidas se generan a partir de JPEG
+        return bool(slots) and all(codec in slot['codecs'] and slot['rendition'] == 'full' for slot in slots)
+
+    def reset_video(self):
+        """El flujo H.264 se reinició: los clientes deben esperar al próximo keyframe"""
+        for slot in list(self.slots.values()):
+            slot['need_keyframe'] = True
+
+    def publish(self, frame_data, metadata, rendition='full'):
+        """Publicar un frame nuevo; no bloquea el bucle de captura"""
+        self.seq += 1
+        published = time.monotonic()
+        self.tracer.published(self.seq, metadata.get('t'), published * 1000)
+        payloads = {}
+        for slot in list(self.slots.values()):
+            if slot['rendition'] != rendition:
+                continue
+            protocol = slot['protocol']
+            payload = payloads.get(protocol)
+            if payload is None:
+                # Codificar una sola vez por protocolo, y solo si algún cliente lo usa
+                if protocol == 'mjpeg':
+                    # /stream.mjpg escribe la vista del anillo directamente en el socket
+                    payload = frame_data
+                elif protocol == 'binary':
+                    # Socket.IO solo admite bytes como adjunto binario: una copia por frame
+                    data = frame_data.tobytes() if isinstance(frame_data, FrameView) else frame_data
+                    payload = dict(metadata, frame=data, format='jpeg', seq=self.seq, rendition=rendition)
+                else:
+                    view = frame_data.view if isinstance(frame_data, FrameView) else frame_data
+                    payload = dict(metadata, frame=base64.b64encode(view).decode('utf-8'),
+                                   seq=self.seq, rendition=rendition)
+                payloads[protocol] = payload
+            if slot['frame'] is not None:
+                # El cliente no consumió el frame anterior: se descarta
+                self._drop(slot)
+            slot['frame'] = (payload, len(frame_data), published)
+            slot['event'].set()
+
+    def publish_video(self, data, metadata, keyframe, codec):
+        """Publicar una unidad de acceso H.264; se entregan todas en orden"""
+        self.seq += 1
+        published = time.monotonic()
+        self.tracer.published(self.seq, metadata.get('t'), published * 1000)
+        frame = data.tobytes() if isinstance(data, FrameView) else data
+        payload = dict(metadata, frame=frame, format='h264', key=keyframe, codec=codec, seq=self.seq)
+        for slot in list(self.slots.values()):
+            if 'h264' not in slot['codecs'] or slot['rendition'] != 'full':
+                continue
+            chunks = slot['chunks']
+            if len(chunks) >= self.max_video_backlog:
+                # Cliente demasiado lento: vaciar la cola y reanudar en el siguiente keyframe
+                self._drop(slot, len(chunks))
+                chunks.clear()
+                slot['need_keyframe'] = True
+            if slot['need_keyframe'] and not keyframe:
+                self._drop(slot)
+                continue
+            slot['need_keyframe'] = False
+            chunks.append((payload, len(data), published))
+            slot['event'].set()
+
+    def _next_pending(self, slot):
+        """Siguiente frame a enviar: el último JPEG o el más antiguo de la cola H.264"""
+        if slot['chunks']:
+            return slot['chunks'].popleft()
+        pending = slot['frame']
+        slot['frame'] = None
+        return pending
+
+    def _sender(self, client_id, slot):
+        """Hilo de envío de un cliente: siempre envía el frame más reciente"""
+        while slot['active']:
+            if not slot['chunks']:
+                slot['event'].wait()
+                slot['event'].clear()
+            pending = self._next_pending(slot)
+            if not slot['active'] or pending is None:
+                continue
+            payload, size, published = pending
+            try:
+                with app.app_context():
+                    started = time.monotonic()
+                    if slot['ack']:
+                        # Esperar la confirmación del cliente antes de enviar el siguiente frame
+                        slot['ack_event'].clear()
+                        socketio.emit('video_frame', payload, room=client_id,
+                                      callback=lambda *args: slot['ack_event'].set())
+                        emit_seconds.labels(slot['protocol']).observe(time.monotonic() - started)
+                        if not slot['ack_event'].wait(self.ack_timeout):
+                            slot['ack_timeouts'] += 1
+                    else:
+                        socketio.emit('video_frame', payload, room=client_id)
+                        emit_seconds.labels(slot['protocol']).observe(time.monotonic() - started)
+                    self.tracer.emitted(payload['seq'], client_id)
+            except Exception as e:
+                logger.error(f"Error al enviar frame a {client_id}: {e}")
+                continue
+            self._record_sent(slot, size, published)
+
+    def iter_frames(self, client_id, timeout=1.0):
+        """Generador con el último frame de un cliente HTTP; termina al eliminar el cliente"""
+        slot = self.slots.get(client_id)
+        while slot is not None and slot['active']:
+            if not slot['event'].wait(timeout):
+                continue
+            slot['event'].clear()
+            pending = slot['frame']
+            slot['frame'] = None
+            if pending is None:
+                continue
+            payload, size, published = pending
+            if isinstance(payload, FrameView):
+                # Copia antes de escribir: sendall puede ceder a mitad de un frame grande y
+                # en ese tiempo el escritor reutilizaría la ranura. Se comprueba después de
+                # copiar por si la ranura cambió durante la copia
+                data = payload.tobytes()
+                if not payload.valid():
+                    # Cliente tan lento que la ranura ya se reutilizó
+                    self._drop(slot)
+                    continue
+                payload = data
+            # El consumidor escribe el frame en el socket antes de pedir el siguiente
+            yield payload
+            self._record_sent(slot, size, published)
+
+    def _drop(self, slot, count=1):
+        slot['dropped'] += count
+        slot['dropped_metric'].inc(count)
+
+    def _record_sent(self, slot, size, published):
+        lag_ms = (time.monotonic() - published) * 1000
+        slot['sent'] += 1
+        slot['bytes_sent'] += size
+        slot['sent_metric'].inc()
+        slot['bytes_metric'].inc(size)
+        slot['lag_ms'] = round(lag_ms, 1)
+        slot['max_lag_ms'] = round(max(slot['max_lag_ms'], lag_ms), 1)
+
+    def stats(self):
+        """Contadores por cliente para /server_info"""
+        return {
+            client_id: {
+                'transport': slot['transport'],
+                'protocol': slot['protocol'],
+                'codecs': sorted(slot['codecs']),
+                'rendition': slot['rendition'],
+                'backlog': len(slot['chunks']),
+                'ack': slot['ack'],
+                'sent': slot['sent'],
+                'dropped': slot['dropped'],
+                'bytes_sent': slot['bytes_sent'],
+                'lag_ms': slot['lag_ms'],
+                'max_lag_ms': slot['max_lag_ms'],
+                'ack_timeouts': slot['ack_timeouts']
+            }
+            for client_id, slot in list(self.slots.items())
+        }
+
+# Proceso libcamera-vid con su separador de frames
+class LibcameraCapture:
+    """Un proceso libcamera-vid en marcha; `profile` identifica su configuración"""
+
+    def __init__(self, cmd, codec, profile):
+        self.codec = codec
+        self.profile = profile
+        self.width, self.height, self.fps = profile[:3]
+        self.parser = AnnexBSplitter() if codec == 'h264' else MjpegDemuxer()
+        self.pending = []           # Frames leídos durante el arranque en paralelo
+        self.last_read = None       # Instante (ms monotónicos) de la última lectura de la tubería
+        self.ready = threading.Event()
+        self.failed = False
+        self.started = time.monotonic()
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+
+    def read(self, offload=False):
+        """Lee un bloque del proceso; devuelve [(frame, es_keyframe)] o None si terminó.
+
+        Con `offload` la lectura de la tubería se hace en un hilo nativo (tpool).
+        """
+        if offload:
+            count = tpool.execute(self.parser.read_from, self.process.stdout, 65536)
+        else:
+            count = self.parser.read_from(self.process.stdout, 65536)
+        if not count:
+            return None
+        self.last_read = now_ms()
+        if self.codec == 'h264':
+            return list(self.parser.iter_access_units())
+        # Extraer los frames JPEG completos sin volver a escanear lo ya leído; son vistas
+        # del buffer del demultiplexor que se copian al anillo de frames antes de la siguiente lectura
+        return [(frame_data, True) for frame_data in self.parser.iter_frames(copy=False)]
+
+    def prime(self):
+        """Leer hasta el primer frame para poder cambiar a este proceso sin hueco"""
+        try:
+            while not self.pending:
+                frames = self.read()
+                if frames is None:
+                    self.failed = True
+                    break
+                # Una captura H.264 solo puede empezar a emitirse en un keyframe
+                while self.codec == 'h264' and frames and not frames[0][1]:
+                    frames.pop(0)
+                self.pending = frames
+        except Exception:
+            self.failed = True
+        self.ready.set()
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.terminate()
+                self.process.wait(timeout=2)
+            except:
+                try:
+                    self.process.kill()
+                except:
+                    pass
+
 # Clase para gestionar el streaming de video por Socket.IO
 class CameraService:
     def __init__(self):
@@ -509,15 +1044,42 @@ class CameraService:
         self.stream_thread = None
         self.process = None
         self.clients = set()
+        self.broadcaster = FrameBroadcaster()
+        # Cada frame capturado se copia una vez aquí; los consumidores lo leen sin copiar
+        self.frame_ring = FrameRing()
+        # Versiones reducidas para clientes que no necesitan la resolución completa
+        self.renditions = RenditionEncoder(self.broadcaster)
+        # Búfer de los últimos segundos de video que se guarda a disco ante un evento
+        self.recorder = DashcamRecorder(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings'))
         self.quality = 80  # Calidad JPEG por defecto (1-100)
         self.width = 640
         self.height = 480
         self.fps = 30
+        # Códec preferido: 'h264' usa el codificador por hardware y solo se activa
+        # si todos los clientes lo decodifican; si no, se transmite MJPEG
+        self.codec = 'mjpeg'
+        self.h264_bitrate = 1000000  # bits/s
+        self.splitter_stats = None
+        # Control en lazo cerrado de calidad/FPS/resolución; se activa con 'adaptive_video' o --adaptive-video
+        self.adaptive = AdaptiveController(self)
+        self.adaptive_thread = None
+        # Mantener la cámara capturando sin clientes para que el primer frame sea inmediato
+        self.keep_warm = False
+        # Servir resoluciones menores escalando la captura actual en vez de relanzarla (MJPEG)
+        self.downscale_profiles = True
+        self.capture = None
+        self.native_capture = None  # Hilo nativo de captura en el camino OpenCV
+        self.capture_stats = {'seamless_switches': 0, 'fallback_switches': 0, 'last_switch_gap_ms': None}
+        self.playback = None        # (FramePlayback, ReplayEngine) en modo replay
+        self.camera_opener = None   # Cámara simulada en lugar de la detectada
+        self.offload_reads = False  # Leer libcamera-vid con tpool (lo activa la vigilancia del hub)
         
-    def add_client(self, client_id):
+    def add_client(self, client_id, transport='socketio'):
         self.clients.add(client_id)
+        self.broadcaster.add_client(client_id, transport)
         logger.info(f"Cliente {client_id} conectado. Total: {len(self.clients)}")
-        socketio.emit('connection_status', {'status': 'connected'}, room=client_id)
+        if transport == 'socketio':
+            socketio.emit('connection_status', {'status': 'connected'}, room=client_id)
         
         # Iniciar automáticamente la transmisión cuando se conecta un cliente
         if not self.stream_active and len(self.clients) > 0:
@@ -525,10 +1087,43 @@ class CameraService:
     
     def remove_client(self, client_id):
         self.clients.discard(client_id)
+        self.broadcaster.remove_client(client_id)
+        self.adaptive.remove_client(client_id)
         logger.info(f"Cliente {client_id} desconectado. Total: {len(self.clients)}")
         if len(self.clients) == 0 and self.stream_active:
             self.stop_stream()
     
+    def set_protocol(self, client_id, protocol, ack=False, codecs=()):
+        """Seleccionar el protocolo de frames de un cliente ('binary' o 'base64')"""
+        if self.broadcaster.set_protocol(client_id, protocol, ack, codecs):
+            logger.info(f"Cliente {client_id} usa protocolo de video {protocol} "
+                        f"(ack: {bool(ack)}, códecs: {', '.join(codecs) or 'jpeg'})")
+            return True
+        return False
+    
+    def set_rendition(self, client_id, rendition):
+        """Suscribir a un cliente a una rendition ('full', 'half' o 'thumb')"""
+        if self.broadcaster.set_rendition(client_id, rendition):
+            logger.info(f"Cliente {client_id} recibe la rendition {rendition}")
+            return True
+        return False
+    
+    def set_codec(self, codec):
+        """Establecer el códec preferido ('mjpeg' o 'h264')"""
+        if codec in ('mjpeg', 'h264'):
+            self.codec = codec
+            logger.info(f"Códec de video preferido: {codec} (activo: {self.active_codec()})")
+            return True
+        return False
+    
+    def active_codec(self):
+        """Códec con el que se transmite ahora; MJPEG si algún cliente no admite H.264"""
+        uses_libcamera = self.camera_opener is None and (
+            camera_device == "libcamera" or camera_device.startswith("libcamera:"))
+        if self.codec == 'h264' and uses_libcamera and self.broadcaster.supports('h264'):
+            return 'h264'
+        return 'mjpeg'
+    
     def set_quality(self, quality):
         """Establecer la calidad de compresión JPEG (1-100)"""
         if 1 <= quality <= 100:
@@ -543,11 +1138,7 @@ class CameraService:
             self.width = width
             self.height = height
             logger.info(f"Resolución ajustada a {width}x{height}")
-            
-            # Reiniciar el stream si está activo
-            if self.stream_active:
-                self.stop_stream()
-                self.start_stream()
+            # El bucle de captura aplica el cambio sin detener el stream
             return True
         return False
     
@@ -559,20 +1150,64 @@ class CameraService:
             return True
         return False
     
+    def set_keep_warm(self, enabled):
+        """Mantener (o no) la cámara en marcha aunque no haya clientes"""
+        self.keep_warm = bool(enabled)
+        logger.info(f"Cámara en espera activa: {'sí' if self.keep_warm else 'no'}")
+        if self.keep_warm:
+            self._ensure_capture()
+        return True
+    
+    def set_dashcam(self, enabled=None, pre_seconds=None, post_seconds=None):
+        """Configurar el modo dashcam; mientras está activo la cámara no se detiene"""
+        self.recorder.configure(enabled, pre_seconds, post_seconds)
+        logger.info(f"Modo dashcam: {'activo' if self.recorder.enabled else 'inactivo'} "
+                    f"({self.recorder.pre_seconds:g} s antes, {self.recorder.post_seconds:g} s después)")
+        if self.recorder.enabled:
+            self._ensure_capture()
+        return True
+    
+    def record_event(self, reason='manual'):
+        """Guardar a disco el video alrededor de un evento (si el modo dashcam está activo)"""
+        name = self.recorder.trigger(reason)
+        if name:
+            logger.info(f"Evento '{reason}': grabando segmento {name}")
+        return name
+    
+    def _capture_wanted(self):
+        return self.keep_warm or self.recorder.enabled or (self.stream_active and len(self.clients) > 0)
+    
+    def _ensure_capture(self):
+        """Arrancar el hilo de captura si no está ya en marcha (p. ej. en espera activa)"""
+        if self.stream_thread and self.stream_thread.is_alive():
+            return
+        self.stream_thread = threading.Thread(target=self._stream_video)
+        self.stream_thread.daemon = True
+        self.stream_thread.start()
+    
     def start_stream(self):
         if not self.stream_active:
             self.stream_active = True
-            self.stream_thread = threading.Thread(target=self._stream_video)
-            self.stream_thread.daemon = True
-            self.stream_thread.start()
+            self._ensure_capture()
+            self.adaptive_thread = threading.Thread(target=self._adaptive_loop)
+            self.adaptive_thread.daemon = True
+            self.adaptive_thread.start()
             logger.info("Streaming iniciado")
             socketio.emit('stream_status', {'status': 'started'})
             return True
         return False
     
-    def stop_stream(self):
-        if self.stream_active:
+    def stop_stream(self, force=False):
+        if self.stream_active or (force and (self.keep_warm or self.recorder.enabled)):
             self.stream_active = False
+            if force:
+                self.keep_warm = False
+                self.recorder.stop()
+            if self.keep_warm or self.recorder.enabled:
+                # La captura sigue en marcha sin enviar frames
+                logger.info("Streaming detenido (cámara en espera activa)")
+                socketio.emit('stream_status', {'status': 'stopped'})
+                return True
             
             # Esperar a que el hilo termine
             if self.stream_thread and self.stream_thread.is_alive():
@@ -596,146 +1231,360 @@ class CameraService:
             return True
         return False
     
-    def _stream_video(self):
-        """Función para transmitir video mediante Socket.IO"""
-        if camera_device == "libcamera" or camera_device.startswith("libcamera:"):
-            # Usar libcamera para Raspberry Pi Camera v3
+    def _adaptive_loop(self):
+        """Evalúa periódicamente el control adaptativo mientras haya stream"""
+        while self.stream_active and threading.current_thread() is self.adaptive_thread:
+            time.sleep(self.adaptive.interval)
+            if not self.adaptive.enabled or not self.stream_active:
+                continue
             try:
-                cmd = [
-                    'libcamera-vid',
-                    '-t', '0',                        # Sin límite de tiempo
-                    '--width', str(self.width),       # Ancho del video
-                    '--height', str(self.height),     # Alto del video
-                    '--framerate', str(self.fps),     # Tasa de fotogramas
-                    '--codec', 'mjpeg',               # Formato de compresión
-                    '--output', '-'                   # Salida a stdout
-                ]
-                
-                logger.info(f"Iniciando libcamera-vid con comando: {' '.join(cmd)}")
-                self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-                frame_buffer = bytearray()
-                frame_count = 0
-                last_time = time.time()
-                real_fps = 0
-                
-                while self.stream_active and len(self.clients) > 0:
-                    # Leer chunk de datos de la salida de libcamera-vid
-                    chunk = self.process.stdout.read(4096)
-                    if not chunk:
-                        logger.warning("No se están recibiendo datos de libcamera-vid")
-                        time.sleep(0.1)
-                        continue
-                    
-                    # Acumular datos en el buffer
-                    frame_buffer.extend(chunk)
-                    
-                    # Buscar marcadores JPEG para extraer frames completos
-                    start_marker = frame_buffer.find(b'\xff\xd8')
-                    end_marker = frame_buffer.find(b'\xff\xd9')
-                    
-                    if start_marker != -1 and end_marker != -1 and end_marker > start_marker:
-                        # Extraer frame completo JPEG
-                        frame_data = frame_buffer[start_marker:end_marker + 2]
-                        frame_buffer = frame_buffer[end_marker + 2:]
-                        
-                        # Calcular FPS real
-                        frame_count += 1
-                        now = time.time()
-                        if now - last_time >= 1.0:
-                            real_fps = frame_count / (now - last_time)
-                            frame_count = 0
-                            last_time = now
-                            
-                        try:
-                            # Convertir a base64 y enviar por Socket.IO
-                            frame_base64 = base64.b64encode(frame_data).decode('utf-8')
-                            
-                            # Usar con app.app_context para evitar errores de contexto
-                            with app.app_context():
-                                socketio.emit('video_frame', {
-                                    'frame': frame_base64,
-                                    'fps': round(real_fps, 1),
-                                    'width': self.width,
-                                    'height': self.height
-                                })
-                        except Exception as e:
-                            logger.error(f"Error al enviar frame: {e}")
-                        
-                        # Control de velocidad para respetar los FPS solicitados
-                        target_delay = 1.0 / self.fps
-                        eventlet.sleep(max(0, target_delay - 0.01))  # Pequeño margen para procesamiento
-            
+                decision = self.adaptive.evaluate()
+                if decision:
+                    socketio.emit('video_adapted', {key: decision[key] for key in ('setting', 'from', 'to', 'reason')})
             except Exception as e:
-                logger.error(f"Error en streaming con libcamera: {e}")
-            finally:
-                if self.process:
-                    try:
-                        self.process.terminate()
-                    except:
-                        pass
-                    self.process = None
+                logger.error(f"Error en el control adaptativo de video: {e}")
+    
+    def _capture_profile(self, codec, current=None):
+        """Parámetros que obligan a relanzar libcamera-vid si cambian"""
+        if (codec == 'mjpeg' and self.downscale_profiles and current is not None and current.codec == codec
+                and current.fps == self.fps and current.width >= self.width and current.height >= self.height
+                and current.profile[3] >= self.quality):
+            # Perfil inferior (resolución o calidad): se recodifica desde la captura actual en vez de relanzarla
+            return current.profile
+        profile = (self.width, self.height, self.fps)
+        if codec != 'mjpeg':
+            return profile
+        quality = self.quality
+        if self.adaptive.enabled and self.downscale_profiles:
+            # Capturar a la calidad máxima del control adaptativo: sus escalones se
+            # aplican al recodificar y no relanzan libcamera-vid
+            quality = max(quality, self.adaptive.bounds['quality']['max'])
+        return profile + (quality,)
+    
+    def _emit_frame(self, frame_data, real_fps, stages=None):
+        """Entregar un frame JPEG al repartidor de clientes; `stages` son sus etapas hasta ahora"""
+        metadata = {
+            'fps': round(real_fps, 1),
+            'width': self.width,
+            'height': self.height
+        }
+        if stages:
+            metadata['t'] = {stage: round(value, 1) for stage, value in stages.items()}
+        self.broadcaster.publish(frame_data, metadata)
+    
+    def _store_frame(self, frame_data, keyframe=True, codec='mjpeg', timestamp=None):
+        """Copiar el frame al anillo compartido; devuelve su FrameView (o bytes si no cabe)"""
+        flags = (FLAG_KEYFRAME if keyframe else 0) | (FLAG_H264 if codec == 'h264' else 0)
+        seq = self.frame_ring.write(frame_data, timestamp, flags)
+        if seq is None:
+            return bytes(frame_data)
+        return self.frame_ring.get(seq)
+    
+    def _emit_renditions(self, source, source_size, real_fps):
+        """Generar en segundo plano las renditions reducidas que tengan suscriptores"""
+        self.renditions.submit(source, source_size, {
+            'fps': round(real_fps, 1),
+            'width': self.width,
+            'height': self.height
+        }, self.quality)
+    
+    def _libcamera_command(self, codec, profile):
+        """Argumentos de libcamera-vid para el códec y perfil de captura indicados"""
+        width, height, fps = profile[:3]
+        cmd = [
+            'libcamera-vid',
+            '-t', '0',                        # Sin límite de tiempo
+            '--width', str(width),            # Ancho del video
+            '--height', str(height),          # Alto del video
+            '--framerate', str(fps),          # Tasa de fotogramas
+            '--codec', codec,                 # Formato de compresión
+        ]
+        if codec == 'mjpeg':
+            cmd += ['--quality', str(profile[3])]  # Calidad JPEG del codificador
+        if codec == 'h264':
+            cmd += [
+                '--inline',                       # SPS/PPS en cada keyframe para clientes nuevos
+                '--intra', str(fps),              # Un keyframe por segundo
+                '--profile', 'baseline',          # Sin frames B: menor latencia
+                '--bitrate', str(self.h264_bitrate),
+                '--flush'                         # Escribir cada frame sin esperar
+            ]
+        cmd += ['--output', '-']              # Salida a stdout
+        return cmd
+    
+    def _launch_capture(self, codec, profile):
+        """Lanzar libcamera-vid con el perfil indicado"""
+        cmd = self._libcamera_command(codec, profile)
+        logger.info(f"Iniciando libcamera-vid con comando: {' '.join(cmd)}")
+        return LibcameraCapture(cmd, codec, profile)
+    
+    def _switch_capture(self, capture, codec, profile, standby):
+        """Cambio de perfil sin hueco: el proceso nuevo arranca en paralelo y se
+        pasa a él con su primer frame. Si la cámara no admite dos procesos a la
+        vez, se detiene el actual antes de arrancar el nuevo.
+
+        Devuelve (captura activa, captura en espera).
+        """
+        if standby is not None and (standby.codec, standby.profile) != (codec, profile):
+            standby.close()
+            standby = None
+        if standby is None:
+            standby = self._launch_capture(codec, profile)
+            primer = threading.Thread(target=standby.prime)
+            primer.daemon = True
+            primer.start()
+            return capture, standby
+        if not standby.ready.is_set():
+            return capture, standby
+        gap_start = time.monotonic()
+        if standby.failed:
+            # Cámara ocupada por el proceso actual: cortar y relanzar
+            standby.close()
+            capture.close()
+            standby = self._launch_capture(codec, profile)
+            standby.prime()
+            if standby.failed:
+                standby.close()
+                raise RuntimeError("libcamera-vid no arrancó con el perfil nuevo")
+            self.capture_stats['fallback_switches'] += 1
         else:
-            # Usar OpenCV para cámaras estándar
-            try:
-                device_id = int(camera_device.split('=')[1]) if camera_device.startswith('video=') else 0
-                cap = cv2.VideoCapture(device_id)
-                cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
-                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
-                cap.set(cv2.CAP_PROP_FPS, self.fps)
-                
-                if not cap.isOpened():
-                    logger.error(f"No se pudo abrir la cámara {device_id}")
-                    return
+            capture.close()
+            self.capture_stats['seamless_switches'] += 1
+        self.capture_stats['last_switch_gap_ms'] = round((time.monotonic() - gap_start) * 1000, 1)
+        logger.info(f"Perfil de captura cambiado a {profile} "
+                    f"({self.capture_stats['last_switch_gap_ms']} ms sin frames)")
+        return standby, None
+    
+    def _stream_libcamera(self):
+        """Transmite con libcamera-vid mientras se necesite la captura"""
+        capture = standby = None
+        try:
+            frame_count = 0
+            last_time = time.time()
+            real_fps = 0
+            
+            while self._capture_wanted():
+                codec = self.active_codec()
+                profile = self._capture_profile(codec, capture)
+                if capture is None:
+                    capture = self._launch_capture(codec, profile)
+                    capture.prime()
+                    if capture.failed:
+                        raise RuntimeError("libcamera-vid terminó sin producir frames")
+                elif (capture.codec, capture.profile) != (codec, profile):
+                    # Un cambio de códec, resolución, FPS o calidad cambia de proceso
+                    previous = capture
+                    capture, standby = self._switch_capture(capture, codec, profile, standby)
+                    if capture is not previous and codec == 'h264':
+                        self.broadcaster.reset_video()
+                elif standby is not None:
+                    # El perfil volvió al de la captura actual antes de completar el cambio
+                    standby.close()
+                    standby = None
+                self.capture = capture
+                self.process = capture.process
+                self.splitter_stats = capture.parser.stats
                 
-                frame_count = 0
-                last_time = time.time()
-                real_fps = 0
+                if capture.pending:
+                    frames, capture.pending = capture.pending, []
+                else:
+                    # Leer datos de libcamera-vid directamente al buffer del separador
+                    frames = capture.read(self.offload_reads)
+                    if frames is None:
+                        logger.warning("No se están recibiendo datos de libcamera-vid")
+                        raise RuntimeError("libcamera-vid terminó")
+                # La cámara entrega los frames ya codificados
+                extracted = now_ms()
+                stages = {'read': capture.last_read or extracted, 'extracted': extracted, 'encoded': extracted}
                 
-                while self.stream_active and len(self.clients) > 0:
-                    ret, frame = cap.read()
-                    if not ret:
-                        logger.warning("Error al leer frame de la cámara")
-                        time.sleep(0.1)
-                        continue
-                    
+                for frame_data, keyframe in frames:
+                    # Única copia del frame: del buffer del separador al anillo compartido
+                    frame = self._store_frame(frame_data, keyframe, capture.codec)
+                    telemetry.frame(getattr(frame, 'seq', 0), len(frame_data),
+                                    getattr(frame, 'timestamp', None) or time.time(), keyframe, capture.codec)
+                    # Las unidades H.264 ya son bytes propios: el grabador no necesita copiarlas
+                    self.recorder.add(frame_data if capture.codec == 'h264' else frame,
+                                      getattr(frame, 'timestamp', None), keyframe, capture.codec)
                     # Calcular FPS real
                     frame_count += 1
+                    frames_captured.inc()
                     now = time.time()
                     if now - last_time >= 1.0:
                         real_fps = frame_count / (now - last_time)
+                        capture_fps.set(real_fps)
                         frame_count = 0
                         last_time = now
                     
+                    if not (self.stream_active and self.clients):
+                        continue  # En espera activa: se captura sin enviar
                     try:
-                        # Codificar como JPEG y convertir a base64
-                        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
-                        frame_base64 = base64.b64encode(buffer.tobytes()).decode('utf-8')
-                        
-                        # Enviar por Socket.IO
-                        with app.app_context():
-                            socketio.emit('video_frame', {
-                                'frame': frame_base64,
+                        if capture.codec == 'h264':
+                            # El separador ya entrega cada unidad de acceso en bytes propios
+                            self.broadcaster.publish_video(frame_data, {
                                 'fps': round(real_fps, 1),
                                 'width': self.width,
-                                'height': self.height
-                            })
+                                'height': self.height,
+                                't': stages
+                            }, keyframe, capture.parser.codec)
+                        else:
+                            capture_size = (capture.width, capture.height)
+                            self._emit_renditions(frame, capture_size, real_fps)
+                            if 'full' in self.broadcaster.renditions_in_use():
+                                if capture_size != (self.width, self.height) or capture.profile[3] > self.quality:
+                                    # Escalar/recodificar en un hilo nativo para no bloquear el hub
+                                    started = time.monotonic()
+                                    frame = tpool.execute(scale_frame, getattr(frame, 'view', frame), capture_size,
+                                                          (self.width, self.height), self.quality)
+                                    encode_seconds.observe(time.monotonic() - started)
+                                    stages = dict(stages, encoded=now_ms())
+                                self._emit_frame(frame, real_fps, stages)
                     except Exception as e:
                         logger.error(f"Error al enviar frame: {e}")
                     
-                    # Control de velocidad para respetar los FPS solicitados
-                    target_delay = 1.0 / self.fps
-                    eventlet.sleep(max(0, target_delay - 0.01))
+                    if capture.codec == 'mjpeg':
+                        # Control de velocidad para respetar los FPS solicitados
+                        target_delay = 1.0 / self.fps
+                        eventlet.sleep(max(0, target_delay - 0.01))  # Pequeño margen para procesamiento
+                if capture.codec == 'h264':
+                    # libcamera-vid ya marca el ritmo; solo ceder el control a los emisores
+                    eventlet.sleep(0)
+        
+        except Exception as e:
+            logger.error(f"Error en streaming con libcamera: {e}")
+            time.sleep(1)  # Evitar relanzar en bucle si libcamera-vid falla
+        finally:
+            for pipeline in (standby, capture):
+                if pipeline is not None:
+                    pipeline.close()
+            self.capture = None
+            self.process = None
+    
+    def use_playback(self, playback, engine):
+        """Sustituir la cámara por los frames de un segmento grabado (modo replay)"""
+        self.playback = (playback, engine)
+        self.width, self.height = playback.size
+    
+    def use_camera(self, opener):
+        """Sustituir la cámara detectada por otra con la interfaz de cv2.VideoCapture (simulación)"""
+        self.camera_opener = opener
+    
+    def _stream_video(self):
+        """Función para transmitir video mediante Socket.IO"""
+        if self.playback is not None:
+            self._stream_playback()
+        elif self.camera_opener is None and (camera_device == "libcamera" or camera_device.startswith("libcamera:")):
+            # Usar libcamera para Raspberry Pi Camera v3; se relanza si libcamera-vid falla
+            while self._capture_wanted():
+                self._stream_libcamera()
+        else:
+            # Usar OpenCV para cámaras estándar; captura y codificación en un hilo nativo
+            self._stream_opencv()
+    
+    def _stream_playback(self):
+        """Reparte los frames de un segmento grabado al ritmo de la reproducción"""
+        playback, engine = self.playback
+        frame_count = 0
+        last_time = time.time()
+        real_fps = 0
+        try:
+            for frame_data, captured in playback.play(engine):
+                if not self._capture_wanted():
+                    break
+                frame = self._store_frame(frame_data, timestamp=captured)
+                telemetry.frame(getattr(frame, 'seq', 0), len(frame_data), captured)
+                self.recorder.add(frame, captured)
                 
-            except Exception as e:
-                logger.error(f"Error en streaming con OpenCV: {e}")
-            finally:
-                if 'cap' in locals() and cap.isOpened():
-                    cap.release()
+                # Calcular FPS real
+                frame_count += 1
+                frames_captured.inc()
+                now = time.time()
+                if now - last_time >= 1.0:
+                    real_fps = frame_count / (now - last_time)
+                    capture_fps.set(real_fps)
+                    frame_count = 0
+                    last_time = now
+                
+                if not (self.stream_active and self.clients):
+                    continue
+                try:
+                    self._emit_renditions(frame, playback.size, real_fps)
+                    if 'full' in self.broadcaster.renditions_in_use():
+                        self._emit_frame(frame, real_fps)
+                except Exception as e:
+                    logger.error(f"Error al enviar frame: {e}")
+        except Exception as e:
+            logger.error(f"Error en la reproducción de video: {e}")
+    
+    def _stream_opencv(self):
+        """Reparte los frames que produce el hilo nativo de captura OpenCV"""
+        capture = None
+        try:
+            device_id = int(camera_device.split('=')[1]) if camera_device.startswith('video=') else 0
+            capture = NativeCapture(device_id, self.width, self.height, self.fps, self.quality,
+                                    opener=self.camera_opener)
+            self.native_capture = capture
+            if not capture.start():
+                logger.error(capture.last_error or f"No se pudo abrir la cámara {device_id}")
+                return
+            
+            frame_count = 0
+            last_time = time.time()
+            real_fps = 0
+            seq = 0
+            
+            while self._capture_wanted():
+                # Ajustes que el hilo de captura aplica en su siguiente iteración
+                capture.width, capture.height = self.width, self.height
+                capture.fps, capture.quality = self.fps, self.quality
+                capture.streaming = bool(self.stream_active and self.clients) or self.recorder.enabled
+                capture.encode = 'full' in self.broadcaster.renditions_in_use() or self.recorder.enabled
+                
+                latest = capture.exchange.get(seq, timeout=0.5)
+                if latest is None:
+                    if capture.last_error:
+                        raise RuntimeError(capture.last_error)
+                    continue
+                seq, (frame, frame_data, captured, stages) = latest
+                if frame_data is not None:
+                    encode_seconds.observe(capture.encode_ms / 1000)
+                    frame_data = self._store_frame(frame_data, timestamp=captured)
+                    telemetry.frame(getattr(frame_data, 'seq', 0), len(frame_data), captured)
+                    self.recorder.add(frame_data, captured)
+                
+                # Calcular FPS real
+                frame_count += 1
+                frames_captured.inc()
+                now = time.time()
+                if now - last_time >= 1.0:
+                    real_fps = frame_count / (now - last_time)
+                    capture_fps.set(real_fps)
+                    frame_count = 0
+                    last_time = now
+                
+                if not (self.stream_active and self.clients):
+                    continue
+                try:
+                    self._emit_renditions(frame, (frame.shape[1], frame.shape[0]), real_fps)
+                    if frame_data is not None:
+                        self._emit_frame(frame_data, real_fps, stages)
+                except Exception as e:
+                    logger.error(f"Error al enviar frame: {e}")
+            
+        except Exception as e:
+            logger.error(f"Error en streaming con OpenCV: {e}")
+        finally:
+            if capture is not None:
+                capture.stop()
 
 # Instanciar servicios
 camera_service = CameraService()
 motor_service = MotorService()
 
+# Lecturas que pueden bloquear el hub dentro de código C y cómo pasarlas a tpool
+hub_watchdog.register_site('serial_read', 'arduino.py', '_reader', offload=motor_service.offload_serial_reads)
+hub_watchdog.register_site('libcamera_read', 'web.py', 'read',
+                           offload=lambda: setattr(camera_service, 'offload_reads', True))
+
 # Rutas de Flask
 @app.route('/')
 def index():
@@ -745,6 +1594,56 @@ def index():
 def serve_static(path):
     return send_from_directory('.', path)
 
+@app.route('/stream.mjpg')
+def stream_mjpg():
+    """Video MJPEG por HTTP (multipart/x-mixed-replace) desde la misma captura"""
+    client_id = f"http-{uuid.uuid4().hex[:8]}"
+    camera_service.add_client(client_id, transport='http')
+    if request.args.get('rendition'):
+        # /stream.mjpg?rendition=thumb para miniaturas
+        camera_service.set_rendition(client_id, request.args['rendition'])
+    
+    def generate():
+        try:
+            for frame in camera_service.broadcaster.iter_frames(client_id):
+                yield (b'--frame\r\nContent-Type: image/jpeg\r\n'
+                       b'Content-Length: ' + str(len(frame)).encode() + b'\r\n\r\n')
+                yield frame
+                yield b'\r\n'
+        finally:
+            # El cliente cerró la conexión: deja de contar para el stream
+            camera_service.remove_client(client_id)
+    
+    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame',
+                    headers={'Cache-Control': 'no-cache, private', 'Pragma': 'no-cache'})
+
+@app.route('/debug/handlers')
+def debug_handlers():
+    """Tiempos por manejador y últimas llamadas lentas con su pila"""
+    if not handler_profiler.enabled:
+        return jsonify({'error': 'Instrumentación desactivada (iniciar con --instrument)'}), 404
+    return jsonify(handler_profiler.stats())
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Pilas colapsadas para flamegraph.pl/speedscope; ?seconds=N muestrea N segundos, ?reset=1 reinicia"""
+    if not handler_profiler.enabled:
+        return jsonify({'error': 'Instrumentación desactivada (iniciar con --instrument)'}), 404
+    seconds = request.args.get('seconds', type=float)
+    if seconds:
+        hz = request.args.get('hz', 100, type=int)
+        if not 1 <= hz <= 1000:
+            return jsonify({'error': 'hz debe estar entre 1 y 1000'}), 400
+        # Perfil puntual independiente del continuo
+        profiler = SamplingProfiler(hz)
+        profiler.start()
+        eventlet.sleep(max(0, min(seconds, 60)))
+        profiler.stop()
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    if sampling_profiler is None:
+        return jsonify({'error': 'Sin perfil continuo (iniciar con --profile-hz o usar ?seconds=N)'}), 404
+    return Response(sampling_profiler.collapsed(reset=request.args.get('reset') == '1'), mimetype='text/plain')
+
 @app.route('/server_info')
 def server_info():
     return jsonify({
@@ -755,11 +1654,34 @@ def server_info():
         "quality": camera_service.quality,
         "resolution": f"{camera_service.width}x{camera_service.height}",
         "fps": camera_service.fps,
-        "arduino_connected": motor_service.arduino_connected,
+        "codec": camera_service.codec,
+        "active_codec": camera_service.active_codec(),
+        "video_parser": camera_service.splitter_stats() if camera_service.splitter_stats else None,
+        "adaptive_video": camera_service.adaptive.stats(),
+        "keep_warm": camera_service.keep_warm,
+        "renditions": camera_service.renditions.stats(),
+        "frame_ring": camera_service.frame_ring.stats(),
+        "dashcam": camera_service.recorder.stats(),
+        "telemetry": telemetry.stats(),
+        "native_capture": camera_service.native_capture.stats() if camera_service.native_capture else None,
+        "capture": dict(camera_service.capture_stats,
+                        profile=camera_service.capture.profile if camera_service.capture else None),
+        "video_clients": camera_service.broadcaster.stats(),
+        "frame_latency": camera_service.broadcaster.tracer.stats(),
+        "hub": hub_watchdog.stats(),
+        "motors_connected": motor_service.motor_arduino_connected,
+        "servos_connected": motor_service.servo_arduino_connected,
+        "serial": motor_service.link_stats(),
+        "simulators": {role: simulator.stats() for role, simulator in simulators.items()} or None,
         "motor_status": motor_service.motor_status,
         "servo_status": motor_service.servo_status
     })
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 # Eventos Socket.IO - Conexión y Video
 # Eventos Socket.IO - Conexión y Video
 @socketio.on('connect')
@@ -773,11 +1695,10 @@ def handle_connect():
     # Enviar estado actual de servos al cliente que se conecta
     socketio.emit('servo_status', motor_service.servo_status, room=client_id)
     
-    # Inicializar los servos si el Arduino está conectado
-    if motor_service.arduino_connected:
+    # Inicializar los servos si el Arduino está conectado (sin esperar respuesta)
+    if motor_service.servo_arduino_connected:
         logger.info("Enviando comandos de calibración inicial para servos")
         motor_service.send_servo_command('mg995', 'move', '0,2,calibration')
-        time.sleep(0.5)  # Pequeña pausa para evitar sobrecarga
         motor_service.send_servo_command('ds04', 'move', '0,2,calibration')
 
 # Modificación en handle_control_servos para manejar comandos de calibración
@@ -845,6 +1766,8 @@ def handle_start_stream(data=None):
     
     # Actualizar configuración si se proporciona
     if data:
+        if any(key in data for key in ('quality', 'width', 'fps')):
+            camera_service.adaptive.suspend('video')
         if 'quality' in data:
             camera_service.set_quality(int(data['quality']))
         if 'width' in data and 'height' in data:
@@ -861,44 +1784,147 @@ def handle_stop_stream():
     success = camera_service.stop_stream()
     return {'success': success}
 
+@socketio.on('video_protocol')
+def handle_video_protocol(data):
+    """Negociar el formato de los frames de video (binario o base64) y los códecs del cliente"""
+    protocol = (data or {}).get('protocol', 'base64')
+    codecs = [codec for codec in (data or {}).get('codecs', []) if codec == 'h264']
+    success = camera_service.set_protocol(request.sid, protocol, (data or {}).get('ack', False), codecs)
+    return {'success': success, 'protocol': protocol if success else 'base64',
+            'codec': camera_service.active_codec()}
+
+@socketio.on('video_rendition')
+def handle_video_rendition(data):
+    """Elegir la versión del video que recibe el cliente ('full', 'half' o 'thumb')"""
+    rendition = (data or {}).get('rendition', 'full')
+    success = camera_service.set_rendition(request.sid, rendition)
+    return {'success': success, 'rendition': rendition if success else 'full',
+            'codec': camera_service.active_codec()}
+
+@socketio.on('keep_warm')
+def handle_keep_warm(data):
+    """Mantener la cámara capturando aunque no haya clientes"""
+    logger.info(f"Solicitud de espera activa de la cámara: {data}")
+    if data and 'enabled' in data:
+        return {'success': camera_service.set_keep_warm(data['enabled'])}
+    return {'success': False}
+
+@socketio.on('clock_sync')
+def handle_clock_sync(data=None):
+    """Reloj monotónico del servidor (ms) para que el cliente estime su desfase"""
+    return {'server_time': now_ms()}
+
+@socketio.on('frame_trace')
+def handle_frame_trace(data):
+    """Recepción y dibujado de los últimos frames según el cliente; devuelve el desglose de latencia"""
+    tracer = camera_service.broadcaster.tracer
+    if data:
+        try:
+            frames, offset_ms, rtt_ms = validate_echo(data)
+        except ValueError as e:
+            logger.warning(f"Lote de trazas de {request.sid} no válido: {e}")
+            return {'success': False, 'error': str(e)}
+        tracer.echo(request.sid, frames, offset_ms, rtt_ms)
+    return tracer.stats()
+
+@socketio.on('video_feedback')
+def handle_video_feedback(data):
+    """Informe periódico del cliente: tiempo de decodificación y FPS recibidos"""
+    if data:
+        camera_service.adaptive.report(request.sid, data.get('decode_ms'), data.get('fps'))
+
+@socketio.on('adaptive_video')
+@record_input('adaptive_video')
+def handle_adaptive_video(data):
+    """Activar/desactivar el control adaptativo de video y ajustar sus límites"""
+    logger.info(f"Solicitud de control adaptativo: {data}")
+    data = data or {}
+    try:
+        camera_service.adaptive.configure(data.get('enabled'), data.get('bounds'))
+    except ValueError as e:
+        logger.warning(f"Límites de control adaptativo no válidos: {e}")
+        return {'success': False, 'error': str(e), 'enabled': camera_service.adaptive.enabled,
+                'bounds': camera_service.adaptive.bounds}
+    return {'success': True, 'enabled': camera_service.adaptive.enabled,
+            'bounds': camera_service.adaptive.bounds}
+
+@socketio.on('dashcam')
+def handle_dashcam(data):
+    """Configurar el modo dashcam (enabled, pre_seconds, post_seconds)"""
+    logger.info(f"Solicitud de configuración del modo dashcam: {data}")
+    data = data or {}
+    try:
+        camera_service.set_dashcam(data.get('enabled'), data.get('pre_seconds'), data.get('post_seconds'))
+    except ValueError as e:
+        logger.warning(f"Configuración del modo dashcam no válida: {e}")
+        return {'success': False, 'error': str(e), 'dashcam': camera_service.recorder.stats()}
+    return {'success': True, 'dashcam': camera_service.recorder.stats()}
+
+@socketio.on('dashcam_trigger')
+@record_input('dashcam_trigger')
+def handle_dashcam_trigger(data=None):
+    """Guardar bajo demanda el video de los últimos segundos y los siguientes"""
+    name = camera_service.record_event((data or {}).get('reason', 'manual'))
+    return {'success': name is not None, 'segment': name}
+
+@socketio.on('set_codec')
+@record_input('set_codec')
+def handle_set_codec(data):
+    """Seleccionar el códec preferido del stream ('mjpeg' o 'h264')"""
+    logger.info(f"Solicitud para cambiar códec: {data}")
+    if data and 'codec' in data:
+        success = camera_service.set_codec(data['codec'])
+        return {'success': success, 'codec': camera_service.active_codec()}
+    return {'success': False}
+
 @socketio.on('set_quality')
+@record_input('set_quality')
 def handle_set_quality(data):
     logger.info(f"Solicitud para cambiar calidad: {data}")
     if 'quality' in data:
+        camera_service.adaptive.suspend('quality')
         success = camera_service.set_quality(int(data['quality']))
         return {'success': success}
     return {'success': False}
 
 @socketio.on('set_resolution')
+@record_input('set_resolution')
 def handle_set_resolution(data):
     logger.info(f"Solicitud para cambiar resolución: {data}")
     if 'width' in data and 'height' in data:
+        camera_service.adaptive.suspend('resolution')
         success = camera_service.set_resolution(int(data['width']), int(data['height']))
         return {'success': success}
     return {'success': False}
 
 @socketio.on('set_fps')
+@record_input('set_fps')
 def handle_set_fps(data):
     logger.info(f"Solicitud para cambiar FPS: {data}")
     if 'fps' in data:
+        camera_service.adaptive.suspend('fps')
         success = camera_service.set_fps(int(data['fps']))
         return {'success': success}
     return {'success': False}
 
 # Eventos Socket.IO - Control de Motores
 @socketio.on('init_motors')
+@record_input('init_motors')
 def handle_init_motors():
     """Inicializar conexión con Arduino"""
     success = motor_service.init_arduino()
     return {'success': success, 'status': motor_service.motor_status}
 
 @socketio.on('motors_off')
+@record_input('motors_off')
 def handle_motors_off():
     """Apagar todos los motores"""
+    camera_service.record_event('motors_off')
     success, response = motor_service.send_motor_command("off,0")
     return {'success': success, 'response': response, 'status': motor_service.motor_status}
 
 @socketio.on('synchronized_mode')
+@record_input('synchronized_mode')
 def handle_synchronized_mode(data):
     """Control sincronizado - todos los motores a la misma velocidad"""
     speed = data.get('speed', 0)
@@ -913,6 +1939,7 @@ def handle_synchronized_mode(data):
     return {'success': success, 'response': response, 'status': motor_service.motor_status}
 
 @socketio.on('differential_mode')
+@record_input('differential_mode')
 def handle_differential_mode(data):
     """Control diferencial - dos pares de motores con velocidades diferentes"""
     speed1 = data.get('speed1', 0)
@@ -929,6 +1956,7 @@ def handle_differential_mode(data):
     return {'success': success, 'response': response, 'status': motor_service.motor_status}
 
 @socketio.on('independent_mode')
+@record_input('independent_mode')
 def handle_independent_mode(data):
     """Control independiente - cada motor con su propia velocidad"""
     speed1 = data.get('speed1', 0)
@@ -951,11 +1979,12 @@ def handle_independent_mode(data):
 @socketio.on('motor_status_request')
 def handle_motor_status_request():
     """Obtener el estado actual de los motores"""
-    return {'status': motor_service.motor_status, 'connected': motor_service.arduino_connected}
+    return {'status': motor_service.motor_status, 'connected': motor_service.motor_arduino_connected}
 
 # Eventos Socket.IO - Control de Servos
 # Eventos Socket.IO - Control de Servos
 @socketio.on('control_servos')
+@record_input('control_servos')
 def handle_control_servos(data):
     """Manejar comandos de control de servos"""
     logger.info(f"Solicitud de control de servo recibida: {data}")
@@ -1045,11 +2074,64 @@ def handle_servo_status_request():
     return {'status': motor_service.servo_status}
 
 # Función principal
-def main():
+def run_replay(directory, video=None, speed=1.0, exit_when_done=False):
+    """Modo replay: Arduinos y cámara sustituidos por una sesión grabada y entradas reproducidas"""
+    session = ReplaySession(directory, video)
+    engine = ReplayEngine(session, lambda event, args: REPLAY_HANDLERS[event](*args), speed)
+    # La telemetría de la reproducción se guarda aparte para compararla con la grabada
+    replay_directory = os.path.join(directory, 'replay-' + time.strftime('%Y%m%d-%H%M%S'))
+    telemetry.directory = replay_directory
+    telemetry.enabled = True
+    logger.info(f"Reproduciendo {directory} ({len(session.inputs)} entradas, {session.duration:.1f} s) "
+                f"a velocidad x{speed:g}")
+    engine.start()
+    motor_service.baud_rates = []
+    motor_service.use_ports(engine.ports)
+    if session.video is not None:
+        camera_service.use_playback(session.video, engine)
+    engine.run()
+    
+    telemetry.stop()
+    report = engine.report(replay_directory if os.path.isdir(replay_directory) else None)
+    os.makedirs(replay_directory, exist_ok=True)
+    with open(os.path.join(replay_directory, 'report.json'), 'w') as f:
+        json.dump(dict(report, video_clients=camera_service.broadcaster.stats(),
+                       serial_links=motor_service.link_stats()), f, indent=2)
+    logger.info(f"Reproducción terminada: {json.dumps(report)}")
+    if exit_when_done:
+        os.kill(os.getpid(), signal.SIGTERM)
+
+def run_simulation(delay_ms=2.0, jitter_ms=1.0, camera_fps=30):
+    """Modo simulación: Arduinos emulados tras un par pty y cámara sintética"""
+    for role in ('motores', 'servos'):
+        simulator = SimulatedArduino(role, delay_ms, jitter_ms)
+        simulator.start()
+        simulators[role] = simulator
+    logger.info("Arduinos simulados: " + ", ".join(f"{role} en {sim.path}" for role, sim in simulators.items()))
+    camera_service.use_camera(functools.partial(SyntheticCamera, fps=camera_fps))
+    motor_service.use_ports({role: open_serial_port(sim.path) for role, sim in simulators.items()})
+
+def enable_instrumentation(slow_ms=100.0, blocking_ms=50.0, profile_hz=0):
+    """Envolver todos los manejadores Socket.IO y rutas Flask ya registrados y, si se pide,
+    arrancar el perfil continuo por muestreo"""
+    global sampling_profiler
+    handler_profiler.slow_ms = slow_ms
+    handler_profiler.blocking_ms = blocking_ms
+    handler_profiler.instrument_flask(app)
+    handler_profiler.instrument_socketio(socketio.server)
+    handler_profiler.start()
+    if profile_hz > 0:
+        sampling_profiler = SamplingProfiler(profile_hz)
+        sampling_profiler.start()
+    logger.info(f"Instrumentación activa: lento > {slow_ms:g} ms, bloqueo > {blocking_ms:g} ms"
+                + (f", perfil a {profile_hz} Hz" if profile_hz > 0 else ""))
+
+def main(use_reloader=True):
     try:
         # Iniciar servidor Socket.IO
         logger.info(f"Iniciando servidor integrado (video + motores) en http://0.0.0.0:5001")
-        socketio.run(app, host='0.0.0.0', port=5001, debug=True, allow_unsafe_werkzeug=True)
+        socketio.run(app, host='0.0.0.0', port=5001, debug=True, use_reloader=use_reloader,
+                     allow_unsafe_werkzeug=True)
     except Exception as e:
         logger.error(f"Error al iniciar servidor: {e}")
         sys.exit(1)
@@ -1061,8 +2143,12 @@ if __name__ == '__main__':
         # Usar eventlet.spawn para ejecutar operaciones bloqueantes fuera del bucle principal
         def shutdown():
             try:
-                camera_service.stop_stream()
+                camera_service.stop_stream(force=True)
+                camera_service.frame_ring.close()
                 motor_service.stop_motors()
+                telemetry.stop()
+                for simulator in simulators.values():
+                    simulator.stop()
             except Exception as e:
                 logger.error(f"Error durante el cierre: {e}")
             finally:
@@ -1073,4 +2159,43 @@ if __name__ == '__main__':
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
-    main()
+    parser = argparse.ArgumentParser(description="Servidor integrado de video y motores")
+    parser.add_argument('--adaptive-video', action='store_true',
+                        help="Activar desde el inicio el control adaptativo de calidad, FPS y resolución")
+    parser.add_argument('--telemetry', action='store_true',
+                        help="Registrar comandos, respuestas, ángulos y frames en PI/telemetry (sesiones para --replay)")
+    parser.add_argument('--replay', metavar='DIR', help="Reproducir la sesión grabada en un directorio de telemetría")
+    parser.add_argument('--video', metavar='SEGMENTO', help="Segmento .mjpg del modo dashcam para el video del replay")
+    parser.add_argument('--speed', type=float, default=1.0, help="Velocidad de reproducción (2 = el doble)")
+    parser.add_argument('--exit-when-done', action='store_true', help="Cerrar el servidor al terminar el replay")
+    parser.add_argument('--simulate', action='store_true',
+                        help="Usar Arduinos simulados (pty) y una cámara sintética en lugar del hardware")
+    parser.add_argument('--sim-delay-ms', type=float, default=2.0, help="Retraso de respuesta de los Arduinos simulados")
+    parser.add_argument('--sim-jitter-ms', type=float, default=1.0, help="Variación aleatoria máxima del retraso")
+    parser.add_argument('--sim-fps', type=int, default=30, help="FPS máximos de la cámara sintética")
+    parser.add_argument('--instrument', action='store_true',
+                        help="Medir cada manejador y ruta y avisar de los lentos (/debug/handlers, /debug/profile)")
+    parser.add_argument('--slow-ms', type=float, default=100.0, help="Tiempo total a partir del que un manejador es lento")
+    parser.add_argument('--blocking-ms', type=float, default=50.0,
+                        help="Tiempo sin ceder el hub a partir del que un manejador es lento")
+    parser.add_argument('--profile-hz', type=int, default=0, help="Perfil continuo por muestreo (0 = desactivado)")
+    parser.add_argument('--stall-ms', type=float, default=50.0, help="Tiempo sin latir a partir del que el hub está bloqueado")
+    parser.add_argument('--auto-offload', action='store_true',
+                        help="Pasar a tpool las lecturas serie o de libcamera-vid que bloqueen el hub repetidamente")
+    args = parser.parse_args()
+    hub_watchdog.stall_ms = args.stall_ms
+    hub_watchdog.auto_offload = args.auto_offload
+    hub_watchdog.start()
+    if args.telemetry:
+        telemetry.enabled = True
+    if args.adaptive_video:
+        camera_service.adaptive.configure(enabled=True)
+    if args.instrument:
+        enable_instrumentation(args.slow_ms, args.blocking_ms, args.profile_hz)
+    if args.replay:
+        eventlet.spawn(run_replay, args.replay, args.video, args.speed, args.exit_when_done)
+    elif args.simulate:
+        eventlet.spawn(run_simulation, args.sim_delay_ms, args.sim_jitter_ms, args.sim_fps)
+    
+    # El recargador relanzaría el proceso y con él la reproducción o los simuladores
+    main(use_reloader=not (args.replay or args.simulate))